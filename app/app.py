@@ -1,13 +1,27 @@
 import streamlit as st
-import joblib
 import numpy as np
+import os
+import sys
 
-# Load model and label map
-model = joblib.load("models/model.pkl")
-label_map = joblib.load("models/label_map.pkl")
-reverse_map = {v: k for k, v in label_map.items()}
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+from instrument import span  # noqa: E402
+from model_bundle import current_bundle  # noqa: E402
+from predict_batch import MODEL_PATH, load_model  # noqa: E402
 
 st.set_page_config(page_title="Traffic Congestion Predictor", layout="centered")
+
+
+# Load model and label map once per server. Bundle paths are versioned, so a
+# newly published bundle (or, before the first one, a rewritten legacy pickle)
+# gets a new cache key.
+@st.cache_resource(show_spinner=False)
+def get_model(version):
+    return load_model(compiled=True)
+
+
+model, label_map = get_model(current_bundle() or os.path.getmtime(MODEL_PATH))
+reverse_map = {v: k for k, v in label_map.items()}
+
 st.title("🚦 Urban Traffic Congestion Predictor")
 
 st.markdown("Enter current traffic stats to predict congestion level.")
@@ -43,7 +57,8 @@ for band in speed_bands:
 # --- Predict ---
 if st.button("Predict Congestion Level"):
     features = np.array([[hour, is_weekend, is_rush_hour, volume_15min] + speed_inputs])
-    prediction = model.predict(features)[0]
+    with span("predict", rows=len(features)):
+        prediction = model.predict(features)[0]
     label = reverse_map[prediction]
 
     st.success(f"Predicted Congestion Level: **{label}**")
@@ -1,18 +1,129 @@
 import streamlit as st
 import numpy as np
-import joblib
-import pulp
-import folium
-import pandas as pd
-import pydeck as pdk
 import streamlit.components.v1 as components
 import time
+import json
 import os
-from sklearn.ensemble import RandomForestClassifier
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+sys.path.append(SRC_DIR)
+import instrument  # noqa: E402
+from fallback_trainer import is_training, read_progress  # noqa: E402
+from feature_store import STORE_PATH  # noqa: E402
+from map_engine import load_aggregates, render_map_html  # noqa: E402
+from spatial_index import INDEX_PATH  # noqa: E402
+from model_bundle import BUNDLE_DIR  # noqa: E402
+from optimize_signals import green_times  # noqa: E402
+from schema import VOLUME_PATH  # noqa: E402
+from queue_simulator import plan_greens, simulate_plans  # noqa: E402
+from signal_animation import render_animation_html, signal_schedule  # noqa: E402
+from stream_ingest import LIVE_PATH  # noqa: E402
+from signal_network import (  # noqa: E402
+    APPROACHES,
+    corridor_links,
+    load_intersections,
+    optimize_network,
+)
+from predict_batch import (  # noqa: E402
+    LABEL_MAP_PATH,
+    MODEL_PATH,
+    load_model,
+    model_available,
+)
 
 # ---------------------- CONFIG ----------------------
 st.set_page_config(page_title="Urban Traffic AI System", layout="centered")
 
+# ---------------------- RERUN TIMING ----------------------
+# The dashboard always collects spans (TRAFFIC_PROFILE and TRAFFIC_TRACE_FILE
+# still switch on the profilers and the span file, with or without
+# TRAFFIC_TRACE); the sidebar shows the ones recorded during this rerun
+if not instrument.enabled():
+    instrument.enable(**instrument.environment_options())
+RERUN_START = time.perf_counter()
+rerun_spans = instrument.capture()
+span = instrument.span
+
+
+# ---------------------- CACHING ----------------------
+def file_version(path):
+    # Cache key that changes whenever the file (or any file in the directory)
+    # is rewritten, so cached objects are dropped as soon as they go stale
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        stats = [
+            os.stat(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        ]
+        return (
+            len(stats),
+            max((s.st_mtime_ns for s in stats), default=0),
+            sum(s.st_size for s in stats),
+        )
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def model_version():
+    # A new bundle is published by rewriting CURRENT; the legacy pickles are
+    # only used until the first bundle exists
+    return (
+        file_version(os.path.join(BUNDLE_DIR, "CURRENT")),
+        file_version(MODEL_PATH),
+        file_version(LABEL_MAP_PATH),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_model(version):
+    # Single-row predictions: the compiled tree engine avoids the per-call
+    # overhead of the model library (a linear model is used as is)
+    return load_model(compiled=True)
+
+
+@st.cache_data(show_spinner=False)
+def get_map_aggregates(data_version, by, days):
+    # Every record, grouped per location (or grid cell) and hour of day; a
+    # weekday/weekend selection is answered by the spatial/time index
+    weekdays = None if days == "all" else days
+    return {
+        "hourly": load_aggregates(by=by, bucket="hour", weekdays=weekdays),
+        "all": load_aggregates(by=by, bucket=None, weekdays=weekdays),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def build_map_html(data_version, by, days, hour):
+    aggregates = get_map_aggregates(data_version, by, days)
+    if hour is None:
+        agg = aggregates["all"]
+    else:
+        hourly = aggregates["hourly"]
+        agg = hourly[hourly["hour"] == hour]
+    # Rendered once per data version and view, then served from memory
+    return render_map_html(agg)
+
+
+@st.cache_data(show_spinner=False)
+def build_signal_animation(volume_version, hour):
+    # The coordinated plan for the hour is solved once and shipped as one
+    # cycle of per-approach greens; the browser plays it back on its own
+    intersections = load_intersections(hour=hour)
+    links = corridor_links(intersections)
+    plan, summary = optimize_network(intersections, links)
+    greens, cycle = plan_greens(plan)
+    volumes = intersections[APPROACHES].to_numpy(dtype=float)
+    summary["mean_delay_s"] = float(
+        simulate_plans(greens, volumes, cycle)["mean_delay_s"][0]
+    )
+    return render_animation_html(signal_schedule(plan, links)), summary
+
+
 # ---------------------- SIDEBAR ---------------------
 st.sidebar.title("🚦 Urban Traffic Assistant")
 page = st.sidebar.radio(
@@ -22,55 +133,57 @@ page = st.sidebar.radio(
         "Signal Optimizer",
         "🌍 Congestion Map View",
         "🚦 Pydeck Signal Animation",
+        "📡 Live Feed",
     ],
 )
 
-# ---------------------- FALLBACK MODEL TRAINING ----------------------
-if not os.path.exists("models/model.pkl") or not os.path.exists("models/label_map.pkl"):
-    st.warning("\u26a0\ufe0f Model files not found. Training a fallback model...")
 
-    df_train = pd.read_csv("data/processed/final_processed.csv")
-    df_train = df_train.dropna(subset=["congestion_level", "volume_15min", "hour"])
-    df_train["label"] = df_train["congestion_level"].map(
-        {"Low": 0, "Medium": 1, "High": 2}
+# ---------------------- FALLBACK MODEL TRAINING ----------------------
+def start_fallback_training():
+    # The trainer runs in its own process; its file lock makes extra launches
+    # from other sessions exit straight away
+    subprocess.Popen(
+        [sys.executable, os.path.join(SRC_DIR, "fallback_trainer.py")],
+        cwd=ROOT_DIR,
+        start_new_session=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
     )
 
-    feature_cols = [
-        "hour",
-        "is_weekend",
-        "is_rush_hour",
-        "volume_15min",
-        "vol_1_19kph",
-        "vol_20_25kph",
-        "vol_26_30kph",
-        "vol_31_35kph",
-        "vol_36_40kph",
-        "vol_41_45kph",
-        "vol_46_50kph",
-        "vol_51_55kph",
-        "vol_56_60kph",
-        "vol_61_65kph",
-        "vol_66_70kph",
-        "vol_71_75kph",
-        "vol_76_80kph",
-        "vol_81_160kph",
-    ]
-    X = df_train[feature_cols]
-    y = df_train["label"]
-
-    model = RandomForestClassifier(n_estimators=50, random_state=42)
-    model.fit(X, y)
 
-    os.makedirs("models", exist_ok=True)
-    joblib.dump(model, "models/model.pkl")
-    joblib.dump({"Low": 0, "Medium": 1, "High": 2}, "models/label_map.pkl")
+@st.fragment(run_every=1.0)
+def fallback_training_status():
+    if model_available():
+        st.rerun(scope="app")
+
+    progress = read_progress() or {"stage": "starting", "progress": 0.0}
+    if progress["stage"] == "failed" and not is_training():
+        st.error(f"Fallback training failed: {progress.get('error')}")
+        if st.button("Retry training"):
+            start_fallback_training()
+        return
+    st.progress(
+        progress["progress"],
+        text=f"Training fallback model: {progress['stage']} "
+        f"({progress['progress']:.0%})",
+    )
 
-    st.success("✅ Fallback model trained and saved.")
 
-# ---------------------- MODEL LOADING ----------------------
-model = joblib.load("models/model.pkl")
-label_map = joblib.load("models/label_map.pkl")
-reverse_map = {v: k for k, v in label_map.items()}
+model = None
+if not model_available():
+    st.warning(
+        "\u26a0\ufe0f Model files not found. A fallback model is training in the "
+        "background; the predictor will be available when it is ready."
+    )
+    progress = read_progress()
+    if not is_training() and (progress is None or progress["stage"] != "failed"):
+        start_fallback_training()
+    fallback_training_status()
+else:
+    # ---------------------- MODEL LOADING ----------------------
+    with span("load:model"):
+        model, label_map = get_model(model_version())
+    reverse_map = {v: k for k, v in label_map.items()}
 
 # ---------------------- PAGE 1: Congestion Predictor ----------------------
 if page == "Congestion Predictor":
@@ -105,11 +218,14 @@ if page == "Congestion Predictor":
         st.number_input(f"{band} km/h", min_value=0, value=5) for band in speed_bands
     ]
 
-    if st.button("Predict Congestion Level"):
+    if model is None:
+        st.info("The fallback model is still training; prediction is disabled.")
+    elif st.button("Predict Congestion Level"):
         features = np.array(
             [[hour, is_weekend, is_rush_hour, volume_15min] + speed_inputs]
         )
-        prediction = model.predict(features)[0]
+        with span("predict", rows=len(features)):
+            prediction = model.predict(features)[0]
         label = reverse_map[prediction]
         st.success(f"Predicted Congestion Level: **{label}**")
         st.balloons()
@@ -130,99 +246,127 @@ elif page == "Signal Optimizer":
     traffic_volume = {"North": vol_N, "East": vol_E, "South": vol_S, "West": vol_W}
 
     if st.button("Optimize Signal Timings"):
-        total_cycle_time = 120
-        prob = pulp.LpProblem("Signal_Timing_Optimization", pulp.LpMinimize)
-
-        green_time = {
-            dir: pulp.LpVariable(f"green_{dir}", lowBound=10, cat="Continuous")
-            for dir in traffic_volume
-        }
-
-        ideal_total = sum(traffic_volume.values())
-        deviations = {}
-
-        for direction in traffic_volume:
-            ideal = (traffic_volume[direction] / ideal_total) * total_cycle_time
-            dev = pulp.LpVariable(f"dev_{direction}", lowBound=0, cat="Continuous")
-            deviations[direction] = dev
-
-            prob += green_time[direction] - ideal <= dev
-            prob += ideal - green_time[direction] <= dev
-
-        prob += pulp.lpSum(deviations.values())
-        prob += pulp.lpSum(green_time.values()) == total_cycle_time
-
-        prob.solve()
+        greens = green_times(
+            [list(traffic_volume.values())], cycle_length=120, min_green=10
+        )[0]
 
         st.subheader("Optimized Green Light Durations")
-        for direction in traffic_volume:
-            st.write(f"**{direction}:** {green_time[direction].varValue:.2f} seconds")
+        for direction, green in zip(traffic_volume, greens):
+            st.write(f"**{direction}:** {green:.2f} seconds")
 
 # ---------------------- PAGE 3: Congestion Map View ----------------------
 elif page == "🌍 Congestion Map View":
     st.title("Congestion Map")
-    st.markdown("Real-time congestion levels across the city.")
+    st.markdown("Congestion levels at every counted location across the city.")
+    by = st.radio("Group by", ["location", "grid"], horizontal=True)
+    days = st.radio("Days", ["all", "weekdays", "weekends"], horizontal=True)
+    hour = st.select_slider("Hour of day", options=["All day"] + list(range(24)))
 
     try:
-        df = pd.read_csv("data/processed/final_processed.csv")
-        df = df.dropna(subset=["latitude_vol", "longitude_vol", "congestion_level"])
-        df = df.sample(min(300, len(df)), random_state=42)
-
-        m = folium.Map(
-            location=[df["latitude_vol"].mean(), df["longitude_vol"].mean()],
-            zoom_start=12,
-        )
-
-        color_map = {"Low": "green", "Medium": "orange", "High": "red"}
-
-        for _, row in df.iterrows():
-            folium.CircleMarker(
-                location=[row["latitude_vol"], row["longitude_vol"]],
-                radius=5,
-                color=color_map.get(row["congestion_level"], "gray"),
-                fill=True,
-                fill_opacity=0.7,
-                popup=f"Level: {row['congestion_level']}<br>Vol: {row['volume_15min']}",
-            ).add_to(m)
-
-        m.save("app/congestion_map.html")
-        with open("app/congestion_map.html", "r", encoding="utf-8") as f:
-            map_html = f.read()
-        components.html(map_html, height=600, scrolling=True)
+        with span("page:map build"):
+            map_html = build_map_html(
+                (file_version(STORE_PATH), file_version(INDEX_PATH)),
+                by,
+                days,
+                None if hour == "All day" else hour,
+            )
+        with span("page:map render"):
+            components.html(map_html, height=600, scrolling=True)
 
     except Exception as e:
-        st.error("Failed to load map. Ensure final_processed.csv has lat/lon columns.")
+        st.error("Failed to load map. Ensure the feature store has lat/lon columns.")
         st.exception(e)
 
 # ---------------------- PAGE 4: Pydeck Animated Signals ----------------------
 elif page == "🚦 Pydeck Signal Animation":
-    st.title("🚦 Real-Time Signal Animation (Pydeck)")
-    st.markdown("Simulating signal light transitions using timed blinking.")
-
-    intersections = [
-        {"id": "A", "lat": 43.651, "lon": -79.381},
-        {"id": "B", "lat": 43.659, "lon": -79.387},
-        {"id": "C", "lat": 43.667, "lon": -79.377},
-        {"id": "D", "lat": 43.645, "lon": -79.375},
-    ]
-    df = pd.DataFrame(intersections)
-
-    green_time = st.slider("Green Time Per Signal (seconds)", 3, 10, 5)
-    current = int(time.time() / green_time) % len(df)
-    df["color"] = [[0, 255, 0] if i == current else [255, 0, 0] for i in range(len(df))]
-
-    layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=df,
-        get_position="[lon, lat]",
-        get_color="color",
-        get_radius=60,
-        pickable=True,
+    st.title("🚦 Signal Plan Animation")
+    st.markdown(
+        "Optimized, coordinated green splits for every counted intersection, "
+        "played back in the browser. Each dot is one approach."
     )
+    hour = st.slider("Hour of day", 0, 23, 8)
 
-    view_state = pdk.ViewState(
-        latitude=df["lat"].mean(), longitude=df["lon"].mean(), zoom=13, pitch=0
+    try:
+        with span("page:animation build"):
+            animation_html, summary = build_signal_animation(
+                file_version(VOLUME_PATH), hour
+            )
+        with span("page:animation render"):
+            components.html(animation_html, height=620)
+        st.caption(
+            f"{summary['intersections']} intersections on a "
+            f"{summary['cycle']:.0f} s cycle | mean green-wave error "
+            f"{summary['mean_wave_error_s']:.1f} s | simulated delay "
+            f"{summary['mean_delay_s']:.0f} s per vehicle"
+        )
+
+    except Exception as e:
+        st.error("Failed to build the signal plan. Ensure the raw volume data exists.")
+        st.exception(e)
+
+# ---------------------- PAGE 5: Live Feed ----------------------
+elif page == "📡 Live Feed":
+    st.title("📡 Live Feed")
+    st.markdown(
+        "Latest scored records and signal timings from `src/stream_ingest.py`, "
+        "refreshed every two seconds."
     )
 
-    st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view_state))
-    st.caption(f"🟢 Green signal currently ON at: Intersection {df.loc[current, 'id']}")
+    @st.fragment(run_every=2.0)
+    def live_feed():
+        # The ingestor replaces the snapshot atomically, so a read never sees
+        # half of it
+        if not os.path.exists(LIVE_PATH):
+            st.info(
+                "No live state yet. Start the ingestor, e.g. "
+                "`python src/stream_ingest.py --socket /tmp/traffic_feed.sock`."
+            )
+            return
+        with open(LIVE_PATH) as f:
+            state = json.load(f)
+        metrics = state["metrics"]
+        st.caption(
+            f"Updated {time.time() - state['updated']:.0f} s ago | "
+            f"{metrics['sensors']} sensors"
+        )
+        cols = st.columns(4)
+        cols[0].metric("Records", f"{metrics['records']:,}")
+        cols[1].metric("Records/s", f"{metrics['records_per_s']:,.0f}")
+        cols[2].metric("Latency p50", f"{metrics['latency_ms']['p50']:.0f} ms")
+        cols[3].metric("Latency p99", f"{metrics['latency_ms']['p99']:.0f} ms")
+        st.subheader("Sensors")
+        st.dataframe(state["sensors"], hide_index=True)
+        st.subheader("Signal timings (s of green per cycle)")
+        st.dataframe(state["signals"], hide_index=True)
+
+    live_feed()
+
+# ---------------------- TIMING PANEL ----------------------
+total_ms = (time.perf_counter() - RERUN_START) * 1000
+history = st.session_state.setdefault("rerun_ms", {}).setdefault(page, [])
+history.append(total_ms)
+del history[:-50]
+
+with st.sidebar.expander("⏱️ Rerun timing"):
+    # Spans of this rerun in start order, nested steps indented under the
+    # step that called them
+    if rerun_spans:
+        st.dataframe(
+            [
+                {
+                    "step": "\u2003" * s["depth"] + s["name"],
+                    "ms": round(s["duration_ms"], 1),
+                    "rows": s["rows"],
+                    "ΔRSS MB": round(s["rss_delta_mb"], 1),
+                }
+                for s in sorted(rerun_spans, key=lambda s: s["start"])
+            ],
+            hide_index=True,
+        )
+    st.write(f"**This rerun: {total_ms:.1f} ms**")
+    st.caption(
+        f"Mean over the last {len(history)} reruns of this page: "
+        f"{sum(history) / len(history):.1f} ms"
+    )
+    if st.checkbox("All sessions since start"):
+        st.dataframe(instrument.summary().round(1))
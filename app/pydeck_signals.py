@@ -1,46 +1,38 @@
 import streamlit as st
-import pydeck as pdk
-import pandas as pd
-import time
+import streamlit.components.v1 as components
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+from schema import VOLUME_PATH  # noqa: E402
+from signal_animation import render_animation_html, signal_schedule  # noqa: E402
+from signal_network import (  # noqa: E402
+    corridor_links,
+    load_intersections,
+    optimize_network,
+)
 
 st.set_page_config(page_title="Pydeck Signal Animation", layout="centered")
-st.title("🚥 Real-Time Traffic Signal Animation (Pydeck)")
+st.title("🚥 Traffic Signal Plan Animation")
 
-# Define mock intersections
-intersections = [
-    {"id": "A", "lat": 43.651, "lon": -79.381},
-    {"id": "B", "lat": 43.659, "lon": -79.387},
-    {"id": "C", "lat": 43.667, "lon": -79.377},
-    {"id": "D", "lat": 43.645, "lon": -79.375},
-]
 
-df = pd.DataFrame(intersections)
+# Solved once per hour of day (and raw data version); every frame after that
+# is drawn in the browser from the precomputed cycle. The playback speed only
+# goes into the page, so changing it does not re-solve the network.
+@st.cache_data(show_spinner=False)
+def build_schedule(volume_mtime, hour):
+    intersections = load_intersections(hour=hour)
+    links = corridor_links(intersections)
+    plan, summary = optimize_network(intersections, links)
+    return signal_schedule(plan, links), summary
 
-# Simulate current green intersection
-green_interval = st.slider("Signal Duration per Intersection (s)", 3, 10, 5)
-current_index = int(time.time() / green_interval) % len(df)
-df["color"] = [
-    [0, 255, 0] if i == current_index else [255, 0, 0] for i in range(len(df))
-]
 
-# Pydeck layer
-layer = pdk.Layer(
-    "ScatterplotLayer",
-    df,
-    get_position="[lon, lat]",
-    get_color="color",
-    get_radius=50,
-    pickable=True,
-    auto_highlight=True,
-)
+hour = st.slider("Hour of day", 0, 23, 8)
+speed = st.select_slider("Initial playback speed", options=[1, 2, 5, 10, 20], value=5)
 
-# Render map
-view_state = pdk.ViewState(
-    latitude=df["lat"].mean(),
-    longitude=df["lon"].mean(),
-    zoom=13,
-    pitch=0,
+schedule, summary = build_schedule(os.path.getmtime(VOLUME_PATH), hour)
+components.html(render_animation_html(schedule, speed=speed), height=620)
+st.caption(
+    f"🟢 {summary['intersections']} intersections on a {summary['cycle']:.0f} s "
+    f"cycle, one dot per approach (green, amber, red)"
 )
-
-st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view_state))
-st.caption(f"🟢 Green signal at intersection: {df.loc[current_index, 'id']}")
@@ -1,7 +1,21 @@
 import streamlit as st
-import pulp
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+from optimize_signals import target_greens  # noqa: E402
+from signal_network import SignalReoptimizer  # noqa: E402
 
 st.set_page_config(page_title="Signal Optimizer", layout="centered")
+
+
+# One optimizer per server: its LP stays built between clicks and recent
+# volume vectors are answered from its cache
+@st.cache_resource(show_spinner=False)
+def get_optimizer():
+    return SignalReoptimizer(cycle=120, min_green=10, quantum=1.0)
+
+
 st.title("🚥 Intersection Signal Optimizer")
 
 st.markdown(
@@ -18,38 +32,23 @@ vol_W = st.number_input("West Volume", min_value=0, value=30)
 traffic_volume = {"North": vol_N, "East": vol_E, "South": vol_S, "West": vol_W}
 
 if st.button("Optimize Signal Timings"):
-    total_cycle_time = 120
-    prob = pulp.LpProblem("Signal_Timing_Optimization", pulp.LpMinimize)
-
-    green_time = {
-        dir: pulp.LpVariable(f"green_{dir}", lowBound=10, cat="Continuous")
-        for dir in traffic_volume
-    }
-
-    # Ideal calculation and deviation setup
-    ideal_total = sum(traffic_volume.values())
-    deviations = {}
-
-    for direction in traffic_volume:
-        ideal = (traffic_volume[direction] / ideal_total) * total_cycle_time
-        dev = pulp.LpVariable(f"dev_{direction}", lowBound=0, cat="Continuous")
-        deviations[direction] = dev
-
-        prob += green_time[direction] - ideal <= dev
-        prob += ideal - green_time[direction] <= dev
-
-    prob += pulp.lpSum(deviations.values())  # minimize total deviation
-    prob += pulp.lpSum(green_time.values()) == total_cycle_time
-
-    prob.solve()
+    volumes = [list(traffic_volume.values())]
+    targets = target_greens(volumes, cycle_length=120)[0]
+    optimizer = get_optimizer()
+    greens = optimizer.solve(volumes)["greens"][0]
 
     # --- Results ---
     st.subheader(" Optimized Green Light Durations")
-    for direction in traffic_volume:
-        st.write(f"**{direction}:** {green_time[direction].varValue:.2f} seconds")
+    for direction, green in zip(traffic_volume, greens):
+        st.write(f"**{direction}:** {green:.2f} seconds")
 
     st.subheader(" Target vs Optimized")
-    for direction in traffic_volume:
-        ideal = (traffic_volume[direction] / ideal_total) * total_cycle_time
-        actual = green_time[direction].varValue
+    for direction, ideal, actual in zip(traffic_volume, targets, greens):
         st.write(f"{direction}: Ideal = {ideal:.2f}s | Optimized = {actual:.2f}s")
+
+    stats = optimizer.stats()
+    st.caption(
+        f"Cache hit rate {stats['hit_rate']:.0%} over {stats['calls']} calls | "
+        f"median solve {stats['median_solve_ms'] or 0:.3f} ms | "
+        f"median call {stats['median_call_ms']:.3f} ms"
+    )
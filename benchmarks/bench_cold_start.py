@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["sklearn", "xgboost", "pulp", "folium", "streamlit"]
+
+# Each snippet runs in a fresh interpreter and stops at the first prediction
+SNIPPETS = {
+    "legacy pickle": """
+import joblib
+import numpy as np
+model = joblib.load("models/model.pkl")
+label_map = joblib.load("models/label_map.pkl")
+model.predict(np.zeros((1, 18), dtype=np.float32))
+""",
+    "bundle": """
+import sys
+sys.path.append("src")
+import numpy as np
+from predict_batch import load_model
+model, label_map = load_model()
+model.predict(np.zeros((1, 18), dtype=np.float32))
+""",
+}
+
+REPORT = """
+import json, sys
+print(json.dumps({"heavy": [m for m in %r if m in sys.modules],
+                  "modules": len(sys.modules)}))
+""" % (HEAVY_MODULES,)
+
+
+def cold_start(snippet):
+    # Wall time from spawning the interpreter until it exits after predicting
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", snippet + REPORT],
+        cwd=ROOT_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return time.perf_counter() - start, json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Process start to first prediction: legacy pickle vs bundle"
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = statistics.median(cold_start("pass")[0] for _ in range(args.repeats))
+    print(f"Bare interpreter: {baseline * 1000:.0f} ms")
+    for name, snippet in SNIPPETS.items():
+        if name == "legacy pickle" and not os.path.exists(
+            os.path.join(ROOT_DIR, "models/model.pkl")
+        ):
+            print(f"{name:>14}: skipped (models/model.pkl not found)")
+            continue
+        runs = [cold_start(snippet) for _ in range(args.repeats)]
+        seconds = statistics.median(s for s, _ in runs)
+        info = runs[-1][1]
+        print(
+            f"{name:>14}: {seconds * 1000:6.0f} ms to first prediction, "
+            f"{info['modules']} modules, heavy imports: "
+            f"{', '.join(info['heavy']) or 'none'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from bench_map import map_records  # noqa: E402
+from eda import EDA_COLUMNS, FIGURES, compute_eda_stats, render_figure  # noqa: E402
+from schema import DAYS  # noqa: E402
+
+
+def seaborn_figures(df, output_dir):
+    # The previous approach: every row handed to sns.boxplot, one figure
+    # after another
+    for x, name, figsize, order in [
+        ("hour", "volume_by_hour.png", (10, 6), None),
+        ("day_of_week", "volume_by_day.png", (10, 6), DAYS),
+        ("is_rush_hour", "rush_hour_vs_volume.png", (8, 6), None),
+    ]:
+        plt.figure(figsize=figsize)
+        sns.boxplot(x=x, y="volume_15min", data=df, order=order)
+        plt.savefig(os.path.join(output_dir, name))
+        plt.close()
+    plt.figure(figsize=(6, 6))
+    df["congestion_level"].value_counts().plot(kind="pie", autopct="%1.1f%%")
+    plt.savefig(os.path.join(output_dir, "congestion_level_pie.png"))
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="EDA figures from precomputed box stats vs seaborn on all rows"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(
+        f"{'records':>10}{'seaborn (ms)':>14}{'stats (ms)':>12}"
+        f"{'draw (ms)':>11}{f'draw x{args.workers} (ms)':>16}"
+    )
+    with tempfile.TemporaryDirectory() as output_dir, ProcessPoolExecutor(
+        args.workers
+    ) as pool:
+        # Warm the pool so worker start-up is not timed
+        list(pool.map(abs, range(args.workers)))
+        for scale in args.scales:
+            df = map_records(scale)[EDA_COLUMNS]
+
+            start = time.perf_counter()
+            seaborn_figures(df, output_dir)
+            seaborn_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            stats = compute_eda_stats(df)
+            stats_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for figure in FIGURES:
+                render_figure(figure, stats, output_dir)
+            draw_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            n = len(FIGURES)
+            list(pool.map(render_figure, FIGURES, [stats] * n, [output_dir] * n))
+            pool_ms = (time.perf_counter() - start) * 1000
+            print(
+                f"{len(df):>10}{seaborn_ms:>14.0f}{stats_ms:>12.0f}"
+                f"{draw_ms:>11.0f}{pool_ms:>16.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
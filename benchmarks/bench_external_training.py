@@ -0,0 +1,94 @@
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import xgboost
+from sklearn.metrics import f1_score
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from external_training import (  # noqa: E402
+    EXTERNAL_PARAMS,
+    time_cutoff,
+    train_external,
+    training_batches,
+)
+from feature_store import read_features, write_features  # noqa: E402
+from features import FEATURE_COLS  # noqa: E402
+from model_bundle import load_bundle  # noqa: E402
+from preprocess_data import add_features, join_volume_speed  # noqa: E402
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+
+
+def _train(kind, store_path, batch_rows, nthread, queue):
+    start = time.perf_counter()
+    if kind == "in memory":
+        # The whole store in one frame, split at the same day
+        cutoff = time_cutoff(root=store_path)
+        df = read_features(
+            columns=FEATURE_COLS + ["congestion_level", "datetime"], root=store_path
+        )
+        X, y = training_batches(df[df["datetime"] < cutoff])
+        X_test, y_test = training_batches(df[df["datetime"] >= cutoff])
+        del df
+        model = xgboost.XGBClassifier(
+            **EXTERNAL_PARAMS, tree_method="hist", n_jobs=nthread
+        ).fit(X, y)
+        f1 = f1_score(y_test, model.predict(X_test), average="macro")
+    else:
+        bundle_root = os.path.join(os.path.dirname(store_path), "bundles")
+        path = train_external(
+            EXTERNAL_PARAMS,
+            nthread=nthread,
+            batch_rows=batch_rows,
+            root=store_path,
+            bundle_root=bundle_root,
+        )
+        f1 = load_bundle(path).manifest["metrics"]["holdout_f1_macro"]
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((f1, elapsed, peak_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Peak memory of in-memory vs external-memory XGBoost training"
+    )
+    parser.add_argument("--scale", type=int, default=20, help="copies of the counts")
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    parser.add_argument("--nthread", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = os.path.join(tmp_dir, "features")
+        # Written a copy at a time, so the benchmark itself stays small
+        for copy in range(args.scale):
+            volume_df = synthetic_volume(1)
+            volume_df["count_id"] += copy * (volume_df["count_id"].max() + 1)
+            df = add_features(join_volume_speed(volume_df, synthetic_speed(volume_df)))
+            write_features(df, store_path)
+            del volume_df, df
+
+        print(f"{'training':<18}{'F1 macro':>10}{'time (s)':>10}{'peak RSS (MB)':>15}")
+        # A fresh (spawned) process per run, so peak RSS is that run alone
+        ctx = mp.get_context("spawn")
+        for kind in ["in memory", "external memory"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(
+                target=_train,
+                args=(kind, store_path, args.batch_rows, args.nthread, queue),
+            )
+            proc.start()
+            f1, elapsed, peak_mb = queue.get()
+            proc.join()
+            print(f"{kind:<18}{f1:>10.3f}{elapsed:>10.1f}{peak_mb:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from feature_store import read_features, write_features  # noqa: E402
+from preprocess_data import add_features, join_volume_speed  # noqa: E402
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+
+FEATURE_COLS = [
+    "hour",
+    "is_weekend",
+    "is_rush_hour",
+    "volume_15min",
+    "vol_1_19kph",
+    "vol_20_25kph",
+    "vol_26_30kph",
+    "vol_31_35kph",
+    "vol_36_40kph",
+    "vol_41_45kph",
+    "vol_46_50kph",
+    "vol_51_55kph",
+    "vol_56_60kph",
+    "vol_61_65kph",
+    "vol_66_70kph",
+    "vol_71_75kph",
+    "vol_76_80kph",
+    "vol_81_160kph",
+]
+MAP_COLS = ["latitude_vol", "longitude_vol", "volume_15min", "congestion_level"]
+
+
+def _load(kind, csv_path, store_path, queue):
+    start = time.perf_counter()
+    if kind == "csv (all columns)":
+        df = pd.read_csv(csv_path)
+    elif kind == "store: trainer columns":
+        df = read_features(columns=FEATURE_COLS + ["congestion_level"], root=store_path)
+    elif kind == "store: map columns":
+        df = read_features(columns=MAP_COLS, root=store_path)
+    else:
+        # One month of map data, as the dashboard would request for a date range
+        df = read_features(
+            columns=MAP_COLS, start="2021-05-01", end="2021-06-01", root=store_path
+        )
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((len(df), df.memory_usage(deep=True).sum() / 1e6, elapsed, peak_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CSV and feature store loads")
+    parser.add_argument(
+        "--scale", type=int, default=10, help="copies of the raw counts"
+    )
+    args = parser.parse_args()
+
+    volume_df = synthetic_volume(args.scale)
+    df = add_features(join_volume_speed(volume_df, synthetic_speed(volume_df)))
+    del volume_df
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "final_processed.csv")
+        store_path = os.path.join(tmp_dir, "features")
+        df.to_csv(csv_path, index=False)
+        write_features(df, store_path)
+        del df
+
+        print(
+            f"{'load':<30}{'rows':>10}{'frame (MB)':>12}{'time (s)':>10}{'peak RSS (MB)':>15}"
+        )
+        kinds = [
+            "csv (all columns)",
+            "store: trainer columns",
+            "store: map columns",
+            "store: map, one month",
+        ]
+        for kind in kinds:
+            # Fresh process per load so peak RSS reflects that load alone
+            queue = mp.Queue()
+            proc = mp.Process(target=_load, args=(kind, csv_path, store_path, queue))
+            proc.start()
+            proc.join()
+            rows, frame_mb, elapsed, peak_mb = queue.get()
+            print(
+                f"{kind:<30}{rows:>10}{frame_mb:>12.1f}{elapsed:>10.2f}{peak_mb:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from preprocess_data import join_volume_speed  # noqa: E402
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+
+
+def old_join(volume_df, speed_df):
+    merged_df = pd.merge(
+        volume_df, speed_df, on="count_id", how="outer", suffixes=("_vol", "_spd")
+    )
+    return merged_df.dropna(subset=["time_start_vol", "volume_15min"])
+
+
+def old_join_rows(volume_df, speed_df):
+    # Rows old_join returns, from the rows per count_id on each side: every
+    # volume row pairs with every speed row of its count (or stays alone)
+    per_count = volume_df.groupby("count_id").size()
+    speed_rows = speed_df.groupby("count_id").size()
+    speed_rows = speed_rows.reindex(per_count.index, fill_value=0)
+    return int((per_count * speed_rows.clip(lower=1)).sum())
+
+
+JOINS = {
+    "old (count_id)": old_join,
+    "new (count_id, direction, time_bin)": join_volume_speed,
+}
+
+
+def _run(name, scale, counts, queue):
+    volume_df = synthetic_volume(scale)
+    if counts:
+        keep = volume_df["count_id"].drop_duplicates().head(counts)
+        volume_df = volume_df[volume_df["count_id"].isin(keep)]
+    speed_df = synthetic_speed(volume_df)
+    start = time.perf_counter()
+    merged_df = JOINS[name](volume_df, speed_df)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is reported in KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((len(volume_df), len(merged_df), elapsed, peak_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the old and new volume/speed joins"
+    )
+    parser.add_argument("--scale", type=int, default=1, help="copies of the raw counts")
+    parser.add_argument(
+        "--counts",
+        type=int,
+        default=3,
+        help="only join the first N counts (0 for all; the old join needs "
+        "tens of GB on the full data)",
+    )
+    args = parser.parse_args()
+
+    # The old join's output on the full input, counted without building it
+    volume_df = synthetic_volume(args.scale)
+    full_rows = old_join_rows(volume_df, synthetic_speed(volume_df))
+    print(
+        f"old join on all {volume_df['count_id'].nunique()} counts: "
+        f"{len(volume_df)} -> {full_rows} rows ({full_rows / len(volume_df):.1f}x)\n"
+    )
+    del volume_df
+
+    print(
+        f"{'join':<38}{'input':>10}{'output':>14}{'explosion':>11}{'time (s)':>10}{'peak RSS (MB)':>15}"
+    )
+    for name in JOINS:
+        # Each join runs in a fresh process so peak RSS is not shared
+        queue = mp.Queue()
+        proc = mp.Process(target=_run, args=(name, args.scale, args.counts, queue))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print(
+                f"{name:<38} failed (exit code {proc.exitcode}, likely out of memory)"
+            )
+            continue
+        rows_in, rows_out, elapsed, peak_mb = queue.get()
+        print(
+            f"{name:<38}{rows_in:>10}{rows_out:>14}{rows_out / rows_in:>10.1f}x"
+            f"{elapsed:>10.2f}{peak_mb:>15.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
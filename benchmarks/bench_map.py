@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from map_engine import aggregate_congestion, render_map_html  # noqa: E402
+from preprocess_data import add_features  # noqa: E402
+from synthetic import synthetic_volume  # noqa: E402
+
+
+def map_records(scale, seed=0):
+    # Each copy of the counts is moved to new locations around the city, so
+    # the number of distinct locations grows with the scale
+    df = synthetic_volume(scale)
+    rng = np.random.default_rng(seed)
+    copy = df["count_id"] // (df["count_id"].max() // scale + 1)
+    shift = rng.normal(0, 0.05, size=(scale, 2))
+    df["latitude"] += shift[copy, 0]
+    df["longitude"] += shift[copy, 1]
+    df["centreline_id"] += copy * 100_000_000
+    df = df.rename(
+        columns={
+            c: f"{c}_vol"
+            for c in ["location_name", "latitude", "longitude", "centreline_id"]
+        }
+    ).rename(columns={"time_start": "time_start_vol"})
+    return add_features(df)
+
+
+def folium_sample(df, n=300):
+    # The previous approach: a random sample, one marker per row, saved to disk
+    import folium
+
+    df = df.dropna(subset=["latitude_vol", "longitude_vol", "congestion_level"])
+    df = df.sample(min(n, len(df)), random_state=42)
+    m = folium.Map(location=[43.65, -79.38], zoom_start=12)
+    for _, row in df.iterrows():
+        folium.CircleMarker(
+            location=[row["latitude_vol"], row["longitude_vol"]],
+            radius=5,
+            fill=True,
+        ).add_to(m)
+    with tempfile.NamedTemporaryFile(suffix=".html") as f:
+        m.save(f.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregated pydeck map vs sampled folium markers"
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    print(
+        f"{'records':>10}{'points':>8}{'folium 300 (ms)':>17}"
+        f"{'aggregate (ms)':>16}{'render (ms)':>13}{'HTML (KB)':>11}"
+    )
+    for scale in args.scales:
+        df = map_records(scale)
+        start = time.perf_counter()
+        folium_sample(df)
+        folium_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        agg = aggregate_congestion(df, bucket=None)
+        aggregate_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        html = render_map_html(agg)
+        render_ms = (time.perf_counter() - start) * 1000
+        print(
+            f"{len(df):>10}{len(agg):>8}{folium_ms:>17.0f}"
+            f"{aggregate_ms:>16.0f}{render_ms:>13.0f}{len(html) / 1024:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
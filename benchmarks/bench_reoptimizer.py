@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from optimize_signals import green_times_pulp  # noqa: E402
+from signal_network import SignalNetwork, SignalReoptimizer  # noqa: E402
+
+
+def volume_stream(intervals, intersections, seed=0):
+    # 15-minute approach volumes: a daily profile plus a few vehicles of noise
+    rng = np.random.default_rng(seed)
+    base = rng.gamma(4.0, 15.0, size=(intersections, 4))
+    hour = (np.arange(intervals) // 4) % 24
+    profile = (
+        0.4
+        + 0.6 * np.exp(-((hour - 8) ** 2) / 6)
+        + 0.5 * np.exp(-((hour - 17) ** 2) / 6)
+    )
+    for scale in profile:
+        yield np.maximum(np.round(base * scale + rng.normal(0, 2, base.shape)), 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cold vs warm vs cached re-optimization over a volume stream"
+    )
+    parser.add_argument("--intervals", type=int, default=96 * 7, help="15-min steps")
+    parser.add_argument("--intersections", type=int, default=1)
+    parser.add_argument("--quantum", type=float, nargs="+", default=[1, 5, 10])
+    args = parser.parse_args()
+    stream = list(volume_stream(args.intervals, args.intersections))
+
+    sample = stream[:20]
+    start = time.perf_counter()
+    for volumes in sample:
+        green_times_pulp(volumes)
+    print(
+        f"PuLP per call:     {(time.perf_counter() - start) / len(sample) * 1000:8.3f} ms"
+    )
+
+    start = time.perf_counter()
+    for volumes in sample:
+        SignalNetwork(volumes, cycle=120, ped_crossing_m=0.0).solve()
+    print(
+        f"HiGHS, cold build: {(time.perf_counter() - start) / len(sample) * 1000:8.3f} ms"
+    )
+
+    for quantum in args.quantum:
+        optimizer = SignalReoptimizer(quantum=quantum)
+        for volumes in stream:
+            optimizer.solve(volumes)
+        stats = optimizer.stats()
+        print(
+            f"reoptimizer, quantum {quantum:g}: hit rate {stats['hit_rate']:6.1%}, "
+            f"median warm solve {stats['median_solve_ms']:.3f} ms, "
+            f"median call {stats['median_call_ms']:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
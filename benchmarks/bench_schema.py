@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from preprocess_data import join_volume_speed  # noqa: E402
+from schema import SPEED_DTYPES, memory_mb, read_raw_csv  # noqa: E402
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+
+
+def timed_read(read, path):
+    start = time.perf_counter()
+    df = read(path)
+    return df, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CSV parse time and memory: inferred dtypes vs the schema"
+    )
+    parser.add_argument("--scale", type=int, default=20, help="copies of the counts")
+    args = parser.parse_args()
+
+    volume_df = synthetic_volume(args.scale)
+    speed_df = synthetic_speed(volume_df)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        volume_path = os.path.join(tmp_dir, "volume.csv")
+        speed_path = os.path.join(tmp_dir, "speed.csv")
+        volume_df.to_csv(volume_path, index=False)
+        speed_df.to_csv(speed_path, index=False)
+        del volume_df, speed_df
+
+        readers = {
+            "inferred": (pd.read_csv, pd.read_csv),
+            "schema": (read_raw_csv, lambda path: read_raw_csv(path, SPEED_DTYPES)),
+        }
+        results = {}
+        for name, (read_volume, read_speed) in readers.items():
+            volume, volume_s = timed_read(read_volume, volume_path)
+            speed, speed_s = timed_read(read_speed, speed_path)
+            joined = join_volume_speed(volume, speed)
+            results[name] = (
+                volume_s + speed_s,
+                memory_mb(volume),
+                memory_mb(speed),
+                memory_mb(joined),
+            )
+            del volume, speed, joined
+
+    print(
+        f"{'dtypes':<10}{'parse (s)':>10}{'volume MB':>11}{'speed MB':>10}"
+        f"{'joined MB':>11}"
+    )
+    for name, (parse_s, volume_mb, speed_mb, joined_mb) in results.items():
+        print(
+            f"{name:<10}{parse_s:>10.2f}{volume_mb:>11.1f}{speed_mb:>10.1f}"
+            f"{joined_mb:>11.1f}"
+        )
+    base, new = results["inferred"], results["schema"]
+    print(
+        f"parse {base[0] / new[0]:.1f}x faster, volume {base[1] / new[1]:.1f}x, "
+        f"speed {base[2] / new[2]:.1f}x, joined {base[3] / new[3]:.1f}x smaller"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pydeck as pdk
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from bench_signal_network import synthetic_network  # noqa: E402
+from signal_animation import render_animation_html, signal_schedule  # noqa: E402
+from signal_network import corridor_links, optimize_network  # noqa: E402
+
+
+def rerun_frame(plan, t):
+    # What one tick of a rerun-per-frame page costs the server: colour every
+    # intersection for time t and serialise a new deck for the browser
+    cycle = plan["cycle"].to_numpy()
+    phase = (t - plan["offset"].to_numpy()) % cycle
+    on = phase < plan["green_EB"].to_numpy()
+    data = plan[["longitude", "latitude"]].assign(
+        color=np.where(on[:, None], [26, 150, 65], [215, 25, 28]).tolist()
+    )
+    layer = pdk.Layer("ScatterplotLayer", data, get_position="[longitude, latitude]")
+    return pdk.Deck(layers=[layer]).to_json()
+
+
+def verify(schedule, samples=997):
+    # At every sampled moment each intersection shows at most one green
+    site, start = schedule["site"], schedule["start"]
+    green, cycle = schedule["green"], schedule["cycle"]
+    t = np.linspace(0, cycle.max(), samples, endpoint=False) + 1e-3
+    on = ((t[:, None] - start) % cycle) < green
+    counts = np.zeros((samples, site.max() + 1), dtype=np.int64)
+    np.add.at(counts, (slice(None), site), on)
+    assert counts.max() <= 1, "overlapping greens at one intersection"
+    print(f"Verified: no overlapping greens over {samples} sampled moments")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Signal animation: precomputed schedule vs rerun per frame"
+    )
+    parser.add_argument("--corridors", type=int, default=40)
+    parser.add_argument("--per-corridor", type=int, default=30)
+    parser.add_argument("--output", default=None, help="write the page to this file")
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+
+    intersections = synthetic_network(args.corridors, args.per_corridor)
+    links = corridor_links(intersections)
+    plan, summary = optimize_network(intersections, links, decompose=True)
+    print(
+        f"{summary['intersections']} intersections planned in "
+        f"{summary['solve_s'] * 1000:.0f} ms ({summary['cycle']:.0f} s cycle)"
+    )
+
+    start = time.perf_counter()
+    schedule = signal_schedule(plan, links)
+    html = render_animation_html(schedule)
+    build_s = time.perf_counter() - start
+    arrays = sum(v.nbytes for k, v in schedule.items() if k != "names")
+    print(
+        f"schedule + page: {build_s * 1000:.1f} ms once, "
+        f"{len(schedule['start'])} approach markers, {arrays / 1024:.0f} KB of "
+        f"arrays, {len(html) / 1024:.0f} KB page"
+    )
+
+    start = time.perf_counter()
+    frames = 10
+    for t in range(frames):
+        rerun_frame(plan, float(t))
+    frame_s = (time.perf_counter() - start) / frames
+    print(
+        f"rerun per frame: {frame_s * 1000:.1f} ms of server time per frame "
+        f"-> {1 / frame_s:.0f} fps at best, before the browser round trip"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(html)
+        print(f"page written to {args.output}")
+    if args.verify:
+        verify(schedule)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from optimize_signals import (  # noqa: E402
+    green_times,
+    green_times_pulp,
+    target_greens,
+    total_deviation,
+)
+
+
+def synthetic_grid(n, approaches=4, seed=0):
+    # Volumes per approach with some near-empty approaches, so the minimum
+    # green binds, plus mixed cycle lengths and minimum greens
+    rng = np.random.default_rng(seed)
+    volumes = rng.gamma(2.0, 40.0, size=(n, approaches)).round()
+    quiet = rng.random((n, approaches)) < 0.15
+    volumes[quiet] = rng.integers(0, 5, quiet.sum())
+    cycle = rng.choice([60.0, 90.0, 120.0], n)
+    min_green = rng.choice([5.0, 7.0, 10.0], n)
+    return volumes, cycle, min_green
+
+
+def verify(volumes, cycle, min_green, greens, reference):
+    # Optimal LP solutions are not unique once a minimum green binds, so the
+    # objective is compared everywhere and the green times themselves only
+    # where the unconstrained targets are feasible (the optimum is unique)
+    feasible = ~np.isnan(reference).any(axis=1)
+    assert (np.isnan(greens).any(axis=1) == ~feasible).all(), "feasibility differs"
+    objective = np.abs(
+        total_deviation(greens[feasible], volumes[feasible], cycle[feasible])
+        - total_deviation(reference[feasible], volumes[feasible], cycle[feasible])
+    ).max()
+    unique = feasible & (target_greens(volumes, cycle) >= min_green[:, None]).all(1)
+    greens_diff = np.abs(greens[unique] - reference[unique]).max()
+    print(
+        f"Verified {feasible.sum()} feasible rows: max objective diff "
+        f"{objective:.2e} s, max green diff {greens_diff:.2e} s "
+        f"on {unique.sum()} rows with a unique optimum"
+    )
+    assert objective < 1e-4 and greens_diff < 1e-4
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Batch signal solver vs one PuLP LP per intersection"
+    )
+    parser.add_argument("--intersections", type=int, default=100_000)
+    parser.add_argument(
+        "--pulp-sample",
+        type=int,
+        default=200,
+        help="intersections solved with PuLP to time (and verify against)",
+    )
+    parser.add_argument(
+        "--verify", action="store_true", help="check the answers against PuLP"
+    )
+    args = parser.parse_args()
+
+    volumes, cycle, min_green = synthetic_grid(args.intersections)
+
+    start = time.perf_counter()
+    greens = green_times(volumes, cycle, min_green)
+    batch_s = time.perf_counter() - start
+
+    n = min(args.pulp_sample, args.intersections)
+    start = time.perf_counter()
+    reference = green_times_pulp(volumes[:n], cycle[:n], min_green[:n])
+    pulp_s = time.perf_counter() - start
+
+    print(
+        f"batch: {args.intersections:>9,} intersections in {batch_s * 1000:8.1f} ms "
+        f"-> {args.intersections / batch_s:12,.0f} intersections/s"
+    )
+    print(
+        f"PuLP:  {n:>9,} intersections in {pulp_s * 1000:8.1f} ms "
+        f"-> {n / pulp_s:12,.0f} intersections/s"
+    )
+    print(f"speedup: {(args.intersections / batch_s) / (n / pulp_s):,.0f}x")
+
+    if args.verify:
+        verify(volumes[:n], cycle[:n], min_green[:n], greens[:n], reference)
+
+
+if __name__ == "__main__":
+    main()
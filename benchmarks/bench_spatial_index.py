@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from bench_map import map_records  # noqa: E402
+from spatial_index import SpatialIndex  # noqa: E402
+
+QUERIES = {
+    "viewport": {"bbox": (-79.40, 43.64, -79.36, 43.66)},
+    "viewport, 07-09 weekdays": {
+        "bbox": (-79.40, 43.64, -79.36, 43.66),
+        "time_of_day": ("07:00", "09:00"),
+        "weekdays": "weekdays",
+    },
+    "viewport, one month": {
+        "bbox": (-79.40, 43.64, -79.36, 43.66),
+        "start": "2021-05-01",
+        "end": "2021-06-01",
+    },
+    "city, 07-09 weekdays": {"time_of_day": ("07:00", "09:00"), "weekdays": "weekdays"},
+}
+
+
+def scan(df, bbox=None, start=None, end=None, time_of_day=None, weekdays=None):
+    # The same filters as a full pass over the table
+    mask = np.ones(len(df), dtype=bool)
+    if bbox is not None:
+        mask &= df["longitude_vol"].between(bbox[0], bbox[2]).to_numpy()
+        mask &= df["latitude_vol"].between(bbox[1], bbox[3]).to_numpy()
+    if start is not None:
+        mask &= (df["datetime"] >= start).to_numpy() & (df["datetime"] < end).to_numpy()
+    if time_of_day is not None:
+        minute = df["datetime"].dt.hour * 60 + df["datetime"].dt.minute
+        mask &= minute.between(7 * 60, 9 * 60 - 1).to_numpy()
+    if weekdays is not None:
+        mask &= (df["datetime"].dt.weekday < 5).to_numpy()
+    return df[mask]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexed queries vs full scans")
+    parser.add_argument("--scale", type=int, default=50, help="copies of the counts")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    df = map_records(args.scale)
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    start = time.perf_counter()
+    index = SpatialIndex.build(df)
+    print(
+        f"{len(df):,} records at {df['centreline_id_vol'].nunique():,} locations, "
+        f"index built in {time.perf_counter() - start:.2f} s"
+    )
+
+    print(f"{'query':<28}{'rows':>9}{'index (ms)':>12}{'scan (ms)':>11}")
+    for name, query in QUERIES.items():
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            result = index.query(**query)
+            timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        expected = scan(df, **query)
+        scan_ms = (time.perf_counter() - start) * 1000
+        assert len(result) == len(expected), name
+        print(
+            f"{name:<28}{len(result):>9,}{np.median(timings) * 1000:>12.2f}"
+            f"{scan_ms:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
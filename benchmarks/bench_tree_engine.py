@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import XGBClassifier
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from features import LABEL_MAP, SPEED_COLS, build_features  # noqa: E402
+from predict_batch import predict_proba  # noqa: E402
+from preprocess_data import add_features, join_volume_speed  # noqa: E402
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+from tree_engine import compile_model  # noqa: E402
+
+MODELS = {
+    # The largest configurations in the training grid
+    "xgboost": lambda: XGBClassifier(
+        n_estimators=300, max_depth=6, learning_rate=0.1, n_jobs=1
+    ),
+    "random_forest": lambda: RandomForestClassifier(
+        n_estimators=100, random_state=42, n_jobs=1
+    ),
+}
+
+
+def per_call_s(fn, X, min_s=0.3):
+    # Best of repeated calls, repeated for at least min_s
+    fn(X)
+    best, spent = float("inf"), 0.0
+    while spent < min_s:
+        start = time.perf_counter()
+        fn(X)
+        elapsed = time.perf_counter() - start
+        best, spent = min(best, elapsed), spent + elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compiled tree engine vs native predict_proba"
+    )
+    parser.add_argument("--scale", type=int, default=10, help="copies of the counts")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 100_000])
+    args = parser.parse_args()
+
+    volume_df = synthetic_volume(args.scale)
+    df = add_features(join_volume_speed(volume_df, synthetic_speed(volume_df)))
+    X = build_features(df)
+    y = df["congestion_level"].map(LABEL_MAP).astype("int64").to_numpy()
+    # Rows as the city feed delivers them today: no speed bins
+    X_plain = X.copy()
+    X_plain[:, 4 : 4 + len(SPEED_COLS)] = 0
+    rng = np.random.default_rng(0)
+
+    print(
+        f"{'model':<15}{'batch':>8}{'native us/call':>16}{'trees':>10}"
+        f"{'default':>10}{'table':>10}{'us/row (table)':>16}{'identical':>11}"
+    )
+    for name, factory in MODELS.items():
+        model = factory().fit(X, y)
+        # Trees only, then the default: table, native predict for big batches
+        compiled = compile_model(model, native_rows=float("inf"))
+        default = compile_model(model).build_table()
+        for batch in args.batch_sizes:
+            rows = rng.choice(len(X), batch)
+            sample, plain = X[rows], X_plain[rows]
+            same = all(
+                np.array_equal(engine.predict_proba(data), predict_proba(model, data))
+                for engine, data in [
+                    (compiled, sample),
+                    (default, sample),
+                    (default, plain),
+                ]
+            )
+            native_s = per_call_s(lambda X: predict_proba(model, X), sample)
+            compiled_s = per_call_s(compiled.predict_proba, sample)
+            default_s = per_call_s(default.predict_proba, sample)
+            table_s = per_call_s(default.predict_proba, plain)
+            print(
+                f"{name:<15}{batch:>8}{native_s * 1e6:>16.1f}"
+                f"{compiled_s * 1e6:>10.1f}{default_s * 1e6:>10.1f}"
+                f"{table_s * 1e6:>10.1f}"
+                f"{table_s * 1e6 / batch:>16.3f}{str(same):>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import os
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from features import FEATURE_COLS  # noqa: E402
+
+
+def random_instance(rng):
+    hour = rng.randrange(24)
+    row = {
+        "hour": hour,
+        "is_weekend": rng.random() < 2 / 7,
+        "is_rush_hour": hour in (7, 8, 9, 16, 17, 18),
+        "volume_15min": rng.randrange(120),
+    }
+    for col in FEATURE_COLS[4:]:
+        row[col] = rng.randrange(15)
+    return row
+
+
+async def client(host, port, n_requests, rows_per_request, latencies, seed):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(n_requests):
+        body = json.dumps(
+            {"instances": [random_instance(rng) for _ in range(rows_per_request)]}
+        ).encode()
+        start = time.perf_counter()
+        writer.write(
+            f"POST /predict HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(
+            next(
+                line.split(":", 1)[1]
+                for line in head.decode().split("\r\n")
+                if line.lower().startswith("content-length")
+            )
+        )
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def fetch_metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"GET /metrics HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def run(args):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            client(args.host, args.port, args.requests, args.rows, latencies, seed)
+            for seed in range(args.concurrency)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+
+    lat = np.array(latencies) * 1000
+    total = len(latencies)
+    print(
+        f"{total} requests x {args.rows} rows over {args.concurrency} connections in {elapsed:.2f}s"
+    )
+    print(
+        f"throughput: {total / elapsed:,.0f} requests/s, {total * args.rows / elapsed:,.0f} rows/s"
+    )
+    print(
+        f"client latency ms: p50={np.percentile(lat, 50):.2f} "
+        f"p99={np.percentile(lat, 99):.2f} max={lat.max():.2f}"
+    )
+    print(
+        "server metrics:",
+        json.dumps(await fetch_metrics(args.host, args.port), indent=2),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load generator for inference_server.py"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, default=64, help="open connections")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="requests per connection"
+    )
+    parser.add_argument("--rows", type=int, default=1, help="instances per request")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
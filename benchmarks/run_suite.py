@@ -0,0 +1,373 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+from synthetic import synthetic_speed, synthetic_volume  # noqa: E402
+
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+TRAIN_PARAMS = {"n_estimators": 100, "max_depth": 6, "learning_rate": 0.1}
+
+# Every pipeline stage as a pair of callables: setup(scale, tmp_dir) builds
+# the stage's inputs from synthetic data at `scale` copies of the raw counts,
+# and run(inputs) does the work being measured and returns the rows it
+# processed. Each stage and scale runs in a fresh process; only run() is
+# timed, and peak RSS is reset after setup so it is the peak while run()
+# executes (its inputs included).
+
+
+def _raw_frames(scale):
+    volume_df = synthetic_volume(scale)
+    return volume_df, synthetic_speed(volume_df)
+
+
+def _processed(scale):
+    from preprocess_data import add_features, join_volume_speed
+
+    return add_features(join_volume_speed(*_raw_frames(scale)))
+
+
+def _training_data(scale):
+    # The cleaning of train_model.load_training_data, without the store
+    from features import FEATURE_COLS, LABEL_MAP
+
+    df = _processed(scale).dropna(subset=["congestion_level", "volume_15min", "hour"])
+    X = df[FEATURE_COLS].copy()
+    speed_cols = [col for col in FEATURE_COLS if "vol_" in col]
+    X[speed_cols] = X[speed_cols].fillna(0).astype("uint16")
+    return X, df["congestion_level"].map(LABEL_MAP).astype("int64")
+
+
+def setup_load(scale, tmp_dir):
+    paths = (os.path.join(tmp_dir, "volume.csv"), os.path.join(tmp_dir, "speed.csv"))
+    for df, path in zip(_raw_frames(scale), paths):
+        df.to_csv(path, index=False)
+    return paths
+
+
+def run_load(paths):
+    from schema import SPEED_DTYPES, read_raw_csv
+
+    volume_df = read_raw_csv(paths[0])
+    read_raw_csv(paths[1], SPEED_DTYPES)
+    return len(volume_df)
+
+
+def setup_merge(scale, tmp_dir):
+    return _raw_frames(scale)
+
+
+def run_merge(frames):
+    from preprocess_data import join_volume_speed
+
+    return len(join_volume_speed(*frames))
+
+
+def setup_features(scale, tmp_dir):
+    from preprocess_data import join_volume_speed
+
+    return join_volume_speed(*_raw_frames(scale))
+
+
+def run_features(df):
+    from preprocess_data import add_features
+
+    return len(add_features(df))
+
+
+def setup_store(scale, tmp_dir):
+    return _processed(scale), os.path.join(tmp_dir, "features")
+
+
+def run_store(inputs):
+    from feature_store import clear_store, read_features, write_features
+    from features import FEATURE_COLS
+
+    df, root = inputs
+    clear_store(root)
+    write_features(df, root)
+    return len(read_features(columns=FEATURE_COLS + ["congestion_level"], root=root))
+
+
+def setup_eda(scale, tmp_dir):
+    from eda import EDA_COLUMNS
+
+    return _processed(scale)[EDA_COLUMNS]
+
+
+def run_eda(df):
+    from eda import compute_eda_stats
+
+    return compute_eda_stats(df)["records"]
+
+
+def setup_train(scale, tmp_dir):
+    return _training_data(scale)
+
+
+def run_train(data):
+    from training_engine import build_model
+
+    X, y = data
+    build_model("xgboost", TRAIN_PARAMS).fit(X, y)
+    return len(X)
+
+
+def setup_predict(scale, tmp_dir):
+    from training_engine import build_model
+
+    X, y = _training_data(scale)
+    model = build_model("xgboost", TRAIN_PARAMS).fit(
+        X[: len(X) // scale], y[: len(y) // scale]
+    )
+    return model, X.to_numpy(dtype=np.float32)
+
+
+def run_predict(inputs):
+    from predict_batch import predict_proba
+
+    model, X = inputs
+    return len(predict_proba(model, X))
+
+
+def setup_signals(scale, tmp_dir):
+    # Four approaches per intersection from the synthetic 15-minute volumes
+    volume = synthetic_volume(scale)["volume_15min"].to_numpy(dtype=np.float64)
+    return volume[: len(volume) // 4 * 4].reshape(-1, 4)
+
+
+def run_signals(volumes):
+    from optimize_signals import green_times
+
+    return len(green_times(volumes, cycle_length=120, min_green=10))
+
+
+def setup_map(scale, tmp_dir):
+    from map_engine import MAP_COLUMNS
+
+    return _processed(scale)[MAP_COLUMNS]
+
+
+def run_map(df):
+    from map_engine import aggregate_congestion, render_map_html
+
+    render_map_html(aggregate_congestion(df))
+    return len(df)
+
+
+STAGES = {
+    "load": (setup_load, run_load),
+    "merge": (setup_merge, run_merge),
+    "features": (setup_features, run_features),
+    "store": (setup_store, run_store),
+    "eda": (setup_eda, run_eda),
+    "train": (setup_train, run_train),
+    "predict": (setup_predict, run_predict),
+    "signals": (setup_signals, run_signals),
+    "map": (setup_map, run_map),
+}
+
+
+def _peak_rss_mb():
+    # VmHWM can be reset (Linux); elsewhere fall back to the process peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _measure(stage, scale, repeat, queue):
+    setup, run = STAGES[stage]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = setup(scale, tmp_dir)
+        best = float("inf")
+        _reset_peak_rss()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = run(inputs)
+            best = min(best, time.perf_counter() - start)
+        queue.put((rows, best, _peak_rss_mb()))
+
+
+def measure(stage, scale, repeat=1):
+    # Fresh (spawned) process per stage and scale; None if the stage failed
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(stage, scale, repeat, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return None
+    rows, wall_s, peak_mb = queue.get()
+    return {
+        "stage": stage,
+        "scale": scale,
+        "rows": int(rows),
+        "wall_s": wall_s,
+        "peak_rss_mb": peak_mb,
+        "rows_per_s": rows / wall_s if wall_s > 0 else float("inf"),
+    }
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(history, path=HISTORY_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def machine():
+    return f"{platform.node()}/{platform.machine()}/{os.cpu_count()} cpus"
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline(history, stage, scale, host, runs=5):
+    # Median wall time and peak RSS over the last `runs` recorded runs of the
+    # stage at this scale on this machine
+    past = [
+        r
+        for entry in history
+        if entry["machine"] == host
+        for r in entry["results"]
+        if r["stage"] == stage and r["scale"] == scale
+    ][-runs:]
+    if not past:
+        return None
+    return {
+        "wall_s": float(np.median([r["wall_s"] for r in past])),
+        "peak_rss_mb": float(np.median([r["peak_rss_mb"] for r in past])),
+    }
+
+
+def regressions(result, base, threshold=0.2, min_seconds=0.05, min_mb=10):
+    # Metrics more than `threshold` worse than the baseline; differences under
+    # min_seconds / min_mb are treated as noise
+    found = []
+    if base is None:
+        return found
+    for metric, floor in (("wall_s", min_seconds), ("peak_rss_mb", min_mb)):
+        new, old = result[metric], base[metric]
+        if new > old * (1 + threshold) and new - old > floor:
+            found.append(f"{metric} {old:.3g} -> {new:.3g} (+{new / old - 1:.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time every pipeline stage on synthetic data and track regressions"
+    )
+    parser.add_argument(
+        "--stages", nargs="+", choices=list(STAGES), default=list(STAGES)
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=1, help="best of N runs")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)"
+    )
+    parser.add_argument(
+        "--baseline-runs", type=int, default=5, help="past runs in the baseline"
+    )
+    parser.add_argument(
+        "--no-record", action="store_true", help="compare without saving this run"
+    )
+    args = parser.parse_args()
+
+    history = load_history(args.history)
+    host = machine()
+    results, failures = [], []
+    print(
+        f"{'stage':<10}{'scale':>6}{'rows':>11}{'wall (s)':>10}{'peak RSS (MB)':>15}"
+        f"{'rows/s':>13}  vs baseline"
+    )
+    for stage in args.stages:
+        for scale in args.scales:
+            result = measure(stage, scale, args.repeat)
+            if result is None:
+                failures.append(f"{stage} x{scale}: failed")
+                print(f"{stage:<10}{scale:>6}  failed (see the traceback above)")
+                continue
+            base = baseline(history, stage, scale, host, args.baseline_runs)
+            found = regressions(result, base, args.threshold)
+            results.append(result)
+            failures += [f"{stage} x{scale}: {f}" for f in found]
+            if base is None:
+                status = "new"
+            else:
+                status = (
+                    f"{result['wall_s'] / base['wall_s']:.2f}x time, "
+                    f"{result['peak_rss_mb'] / base['peak_rss_mb']:.2f}x RSS"
+                )
+                status += " REGRESSION" if found else ""
+            print(
+                f"{stage:<10}{scale:>6}{result['rows']:>11}{result['wall_s']:>10.3f}"
+                f"{result['peak_rss_mb']:>15.0f}{result['rows_per_s']:>13,.0f}  {status}"
+            )
+
+    if not args.no_record:
+        history.append(
+            {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": _commit(),
+                "machine": host,
+                "python": platform.python_version(),
+                "results": results,
+            }
+        )
+        save_history(history, args.history)
+        print(f"\nRun appended to {args.history} ({len(history)} runs)")
+
+    if failures:
+        print(
+            f"\n{len(failures)} failure(s) or regression(s) past {args.threshold:.0%}:"
+        )
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from features import SPEED_COLS
+from schema import VOLUME_PATH
+
+# Rough speed profile of urban arterials, used to split each volume into bins
+SPEED_PROFILE = np.array(
+    [0.02, 0.03, 0.05, 0.08, 0.12, 0.15, 0.16, 0.14, 0.10, 0.06, 0.04, 0.02, 0.02, 0.01]
+)
+
+
+def synthetic_volume(scale=1, path=VOLUME_PATH):
+    # Replicate the raw counts `scale` times under fresh count/row ids
+    base = pd.read_csv(path)
+    copies = []
+    for i in range(scale):
+        part = base.copy()
+        part["id"] = part["id"] + i * (base["id"].max() + 1)
+        part["count_id"] = part["count_id"] + i * (base["count_id"].max() + 1)
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+
+def synthetic_speed(volume_df, seed=42):
+    # One speed row per volume row, with the volume spread over the speed bins
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(volume_df["volume_15min"].to_numpy(), SPEED_PROFILE)
+    speed_df = volume_df.drop(columns=["volume_15min"]).copy()
+    speed_df[SPEED_COLS] = counts
+    return speed_df
@@ -1,61 +1,298 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
+import colorsys
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_store import STORE_PATH, read_features
+from features import RUSH_HOURS
+from instrument import span, traced
+from schema import DAYS, compact, memory_report
+from spatial_index import INDEX_PATH, load_index
+
+EDA_COLUMNS = [
+    "hour",
+    "day_of_week",
+    "is_rush_hour",
+    "volume_15min",
+    "congestion_level",
+]
+OUTPUT_DIR = "reports/figures"
+CACHE_DIR = "data/processed/eda_cache"
+
+# (file, figure size, stats key, title, x label, y label)
+FIGURES = [
+    (
+        "volume_by_hour.png",
+        (10, 6),
+        "hour",
+        "Traffic Volume by Hour",
+        "Hour of Day",
+        "Volume (15 min)",
+    ),
+    (
+        "volume_by_day.png",
+        (10, 6),
+        "day_of_week",
+        "Traffic Volume by Day of Week",
+        "Day",
+        "Volume (15 min)",
+    ),
+    (
+        "congestion_level_pie.png",
+        (6, 6),
+        "congestion_level",
+        "Distribution of Congestion Levels",
+        None,
+        "",
+    ),
+    (
+        "rush_hour_vs_volume.png",
+        (8, 6),
+        "is_rush_hour",
+        "Rush Hour vs Non-Rush Hour Volume",
+        "Is Rush Hour",
+        "Volume (15 min)",
+    ),
+]
+
+# The figures are drawn from summaries, not rows: one pass over the volumes
+# gives the box statistics of every group (the same numbers seaborn gets from
+# matplotlib's boxplot_stats), which are cached on disk next to the data they
+# came from and handed to ax.bxp in worker processes.
+
+
+def load_eda_frame(bbox=None, time_of_day=None, weekdays=None):
+    # The whole city reads the plot columns from the feature store; an area,
+    # time window or set of days is answered by the spatial/time index
+    if bbox is None and time_of_day is None and weekdays is None:
+        return read_features(columns=EDA_COLUMNS)
+    df = load_index().query(bbox=bbox, time_of_day=time_of_day, weekdays=weekdays)
+    df["hour"] = df["minute_of_day"] // 60
+    df["day_of_week"] = df["datetime"].dt.day_name()
+    df["is_rush_hour"] = df["hour"].isin(RUSH_HOURS)
+    return compact(df[EDA_COLUMNS])
+
+
+def box_stats(codes, values, n_groups, whis=1.5):
+    # Box statistics per group code (0 .. n_groups - 1) from values that are
+    # already sorted: a stable sort by code keeps every group sorted, so
+    # quartiles, whiskers and fliers are index lookups
+    if not len(values):
+        return []
+    order = np.argsort(codes, kind="stable")
+    codes, values = codes[order], values[order]
+    size = np.bincount(codes, minlength=n_groups)
+    start = np.cumsum(size) - size
+    present = size > 0
+    last = start + np.maximum(size - 1, 0)
+
+    def at(index):
+        # Empty groups point at a valid row; they are skipped below
+        return values[np.minimum(index, len(values) - 1)]
+
+    # Linear interpolation between order statistics, as np.percentile
+    pos = np.array([0.25, 0.5, 0.75])[:, None] * np.maximum(size - 1, 0)
+    below = np.floor(pos).astype(np.int64)
+    frac = pos - below
+    lo = at(np.minimum(start + below, last))
+    hi = at(np.minimum(start + below + 1, last))
+    q1, med, q3 = lo + frac * (hi - lo)
+
+    iqr = q3 - q1
+    low_fence = (q1 - whis * iqr)[codes]
+    high_fence = (q3 + whis * iqr)[codes]
+    n_low = np.bincount(codes, values < low_fence, n_groups).astype(np.int64)
+    n_high = np.bincount(codes, values > high_fence, n_groups).astype(np.int64)
+    whislo = np.minimum(at(np.minimum(start + n_low, last)), q1)
+    whishi = np.maximum(at(np.maximum(last - n_high, start)), q3)
+    mean = np.bincount(codes, values, n_groups) / np.maximum(size, 1)
+
+    outside = (values < whislo[codes]) | (values > whishi[codes])
+    stats = []
+    for g in np.flatnonzero(present):
+        fliers = values[start[g] : start[g] + size[g]][
+            outside[start[g] : start[g] + size[g]]
+        ]
+        # Repeated fliers draw the same marker, so one of each is kept
+        stats.append(
+            {
+                "position": int(g),
+                "n": int(size[g]),
+                "mean": float(mean[g]),
+                "med": float(med[g]),
+                "q1": float(q1[g]),
+                "q3": float(q3[g]),
+                "whislo": float(whislo[g]),
+                "whishi": float(whishi[g]),
+                "fliers": np.unique(fliers).tolist(),
+            }
+        )
+    return stats
+
+
+@traced("features:eda", rows=lambda stats: stats["records"])
+def compute_eda_stats(df):
+    volume = df["volume_15min"].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(volume)
+    order = np.argsort(volume[valid], kind="stable")
+    values = volume[valid][order]
+
+    def grouped(column, labels):
+        codes = pd.Categorical(df[column], categories=labels).codes
+        codes = codes.astype(np.int64)[valid][order]
+        keep = codes >= 0
+        return {
+            "labels": [str(label) for label in labels],
+            "boxes": box_stats(codes[keep], values[keep], len(labels)),
+        }
+
+    hours = sorted(df["hour"].dropna().unique().tolist())
+    levels = df["congestion_level"].value_counts()
+    return {
+        "records": int(len(df)),
+        "hour": grouped("hour", hours),
+        "day_of_week": grouped("day_of_week", DAYS),
+        "is_rush_hour": grouped("is_rush_hour", [False, True]),
+        "congestion_level": {
+            "labels": [str(level) for level in levels.index],
+            "counts": levels.tolist(),
+        },
+    }
+
+
+def _source_version(path):
+    stats = [
+        os.stat(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    ]
+    if os.path.isfile(path):
+        stats = [os.stat(path)]
+    return [len(stats), max((s.st_mtime_ns for s in stats), default=0)]
+
+
+def eda_stats(bbox=None, time_of_day=None, weekdays=None, refresh=False):
+    # Cached per filter and per version of the store (or index) it reads
+    filtered = bbox is not None or time_of_day is not None or weekdays is not None
+    source = INDEX_PATH if filtered else STORE_PATH
+    key = json.dumps([bbox, time_of_day, weekdays, _source_version(source)])
+    path = os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+    if os.path.exists(path) and not refresh:
+        with open(path) as f:
+            return json.load(f)
+
+    df = load_eda_frame(bbox, time_of_day, weekdays)
+    memory_report("eda frame", df)
+    stats = compute_eda_stats(df)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stats, f)
+    os.replace(tmp_path, path)
+    return stats
+
+
+def draw_boxes(ax, summary, width=0.8):
+    # ax.bxp styled as seaborn's default boxplot: one desaturated colour,
+    # grey lines, a categorical axis
+    import matplotlib.colors as mcolors
+    import seaborn as sns
+
+    color = sns.desaturate("C0", 0.75)
+    lum = colorsys.rgb_to_hls(*mcolors.to_rgb(color))[1] * 0.6
+    line = (lum, lum, lum)
+    boxes = summary["boxes"]
+    labels = summary["labels"]
+    ax.bxp(
+        [{**box, "fliers": np.asarray(box["fliers"])} for box in boxes],
+        positions=[box["position"] for box in boxes],
+        widths=width,
+        capwidths=width / 2,
+        patch_artist=True,
+        manage_ticks=False,
+        boxprops={"facecolor": color, "edgecolor": line},
+        medianprops={"color": line, "solid_capstyle": "butt"},
+        whiskerprops={"color": line, "solid_capstyle": "butt"},
+        flierprops={"markeredgecolor": line},
+        capprops={"color": line},
+    )
+    ax.set_xticks(range(len(labels)), labels)
+    ax.set_xlim(-0.5, len(labels) - 0.5)
+    ax.xaxis.grid(False)
+
+
+def render_figure(figure, stats, output_dir=OUTPUT_DIR):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    name, figsize, key, title, xlabel, ylabel = figure
+    fig = plt.figure(figsize=figsize)
+    ax = fig.gca()
+    if key == "congestion_level":
+        ax.pie(
+            stats[key]["counts"],
+            labels=stats[key]["labels"],
+            autopct="%1.1f%%",
+            startangle=90,
+        )
+    else:
+        draw_boxes(ax, stats[key])
+    ax.set_title(title)
+    if xlabel is not None:
+        ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    path = os.path.join(output_dir, name)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Save the EDA figures")
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"),
+        default=None,
+    )
+    parser.add_argument(
+        "--time-window",
+        nargs=2,
+        metavar=("FROM", "TO"),
+        default=None,
+        help='clock times such as "07:00" "09:00"',
+    )
+    parser.add_argument("--days", choices=["weekdays", "weekends"], default=None)
+    parser.add_argument(
+        "--workers", type=int, default=min(len(FIGURES), os.cpu_count() or 1)
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", help="recompute the cached statistics"
+    )
+    args = parser.parse_args()
+
+    stats = eda_stats(args.bbox, args.time_window, args.days, refresh=args.refresh)
+    print(f"{stats['records']} records")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with span("render:eda", figures=len(FIGURES)):
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                list(pool.map(render_figure, FIGURES, [stats] * len(FIGURES)))
+        else:
+            for figure in FIGURES:
+                render_figure(figure, stats)
+
+    print(f"EDA visualizations saved in: {OUTPUT_DIR}/")
+
 
-# Load preprocessed data
-df = pd.read_csv("data/processed/final_processed.csv")
-
-# Set output folder
-output_dir = "reports/figures"
-os.makedirs(output_dir, exist_ok=True)
-
-# Plot 1: Hourly volume trend
-plt.figure(figsize=(10, 6))
-sns.boxplot(x="hour", y="volume_15min", data=df)
-plt.title("Traffic Volume by Hour")
-plt.xlabel("Hour of Day")
-plt.ylabel("Volume (15 min)")
-plt.savefig(f"{output_dir}/volume_by_hour.png")
-plt.close()
-
-# Plot 2: Day of week volume trend
-plt.figure(figsize=(10, 6))
-sns.boxplot(
-    x="day_of_week",
-    y="volume_15min",
-    data=df,
-    order=[
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ],
-)
-plt.title("Traffic Volume by Day of Week")
-plt.xlabel("Day")
-plt.ylabel("Volume (15 min)")
-plt.savefig(f"{output_dir}/volume_by_day.png")
-plt.close()
-
-# Plot 3: Congestion level count
-plt.figure(figsize=(6, 6))
-df["congestion_level"].value_counts().plot(kind="pie", autopct="%1.1f%%", startangle=90)
-plt.title("Distribution of Congestion Levels")
-plt.ylabel("")
-plt.savefig(f"{output_dir}/congestion_level_pie.png")
-plt.close()
-
-# Plot 4: Rush hour comparison
-plt.figure(figsize=(8, 6))
-sns.boxplot(x="is_rush_hour", y="volume_15min", data=df)
-plt.title("Rush Hour vs Non-Rush Hour Volume")
-plt.xlabel("Is Rush Hour")
-plt.ylabel("Volume (15 min)")
-plt.savefig(f"{output_dir}/rush_hour_vs_volume.png")
-plt.close()
-
-print("EDA visualizations saved in: reports/figures/")
+if __name__ == "__main__":
+    main()
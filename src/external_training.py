@@ -0,0 +1,217 @@
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+from feature_store import STORE_PATH, scan_features
+from features import FEATURE_COLS, LABEL_MAP, SPEED_COLS
+from instrument import span
+from model_bundle import prune_bundles, save_bundle
+
+# Used when the leaderboard has no XGBoost row to take parameters from
+EXTERNAL_PARAMS = {"n_estimators": 300, "max_depth": 6, "learning_rate": 0.1}
+
+# XGBoost reads the store through a DataIter, one batch of at most
+# `batch_rows` rows at a time, and keeps only its quantised pages (spilled to
+# a cache directory next to the store) between passes. The holdout is the
+# latest `holdout` share of the rows, cut at a day boundary, so no partition
+# is shuffled into both sides. Evaluation streams the holdout the same way
+# and keeps only a confusion matrix.
+
+
+def training_batches(df):
+    # The rows and columns load_training_data keeps, as (X, y)
+    df = df.dropna(subset=["congestion_level", "volume_15min", "hour"])
+    X = df[FEATURE_COLS].copy()
+    X[SPEED_COLS] = X[SPEED_COLS].fillna(0).astype("uint16")
+    y = df["congestion_level"].map(LABEL_MAP).astype("int64")
+    return X, y
+
+
+def day_counts(batch_rows=1_000_000, root=STORE_PATH):
+    # Rows per calendar day, from one pass over the datetime column
+    counts = pd.Series(dtype="int64")
+    for df in scan_features(columns=["datetime"], batch_rows=batch_rows, root=root):
+        day = df["datetime"].dt.floor("D").value_counts()
+        counts = counts.add(day, fill_value=0)
+    return counts.sort_index().astype("int64")
+
+
+def time_cutoff(holdout=0.2, batch_rows=1_000_000, root=STORE_PATH):
+    # First day of the holdout: the earliest day with at least 1 - holdout of
+    # the rows before it
+    counts = day_counts(batch_rows, root)
+    before = (counts.cumsum() - counts) / counts.sum()
+    later = before.index[before.to_numpy() >= 1 - holdout]
+    return later[0] if len(later) else counts.index[-1]
+
+
+class StoreBatches(xgboost.DataIter):
+    # Training rows between start and end, batch by batch. The first pass
+    # also fingerprints the data the same way training_engine.data_hash does.
+
+    def __init__(
+        self, cache_prefix, start=None, end=None, batch_rows=1_000_000, root=STORE_PATH
+    ):
+        self.start, self.end = start, end
+        self.batch_rows = batch_rows
+        self.root = root
+        self.batches = None
+        self.first_pass = True
+        self.digest = hashlib.sha1()
+        self.rows = 0
+        self.dtypes = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self.batches is None:
+            self.batches = scan_features(
+                columns=FEATURE_COLS + ["congestion_level"],
+                start=self.start,
+                end=self.end,
+                batch_rows=self.batch_rows,
+                root=self.root,
+            )
+        for df in self.batches:
+            X, y = training_batches(df)
+            if not len(X):
+                continue
+            if self.first_pass:
+                rows = pd.util.hash_pandas_object(
+                    pd.concat([X, y], axis=1), index=False
+                )
+                self.digest.update(rows.to_numpy().tobytes())
+                self.rows += len(X)
+                self.dtypes = X.dtypes
+            input_data(data=X, label=y)
+            return True
+        return False
+
+    def reset(self):
+        if self.batches is not None:
+            self.first_pass = False
+        self.batches = None
+
+    def fingerprint(self):
+        digest = self.digest.copy()
+        digest.update(",".join(FEATURE_COLS).encode())
+        return digest.hexdigest()[:16]
+
+
+def confusion_scores(confusion):
+    # accuracy_score / f1_score(average="macro") from a confusion matrix
+    # (rows: true class, columns: predicted); classes never seen on either
+    # side are left out of the macro average, as sklearn does
+    tp = np.diag(confusion).astype(np.float64)
+    actual, predicted = confusion.sum(axis=1), confusion.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(actual > 0, tp / actual, 0.0)
+        f1 = np.where(
+            precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0
+        )
+    seen = (actual + predicted) > 0
+    report = pd.DataFrame(
+        {"precision": precision, "recall": recall, "f1-score": f1, "support": actual},
+        index=list(LABEL_MAP),
+    )
+    return tp.sum() / confusion.sum(), f1[seen].mean(), report
+
+
+def evaluate(booster, start, batch_rows=1_000_000, root=STORE_PATH):
+    n = len(LABEL_MAP)
+    confusion = np.zeros((n, n), dtype=np.int64)
+    for df in scan_features(
+        columns=FEATURE_COLS + ["congestion_level"],
+        start=start,
+        batch_rows=batch_rows,
+        root=root,
+    ):
+        X, y = training_batches(df)
+        if len(X):
+            predicted = booster.inplace_predict(X).argmax(axis=1)
+            confusion += np.bincount(
+                y.to_numpy() * n + predicted, minlength=n * n
+            ).reshape(n, n)
+    return confusion
+
+
+def train_external(
+    params=None,
+    holdout=0.2,
+    nthread=None,
+    batch_rows=1_000_000,
+    root=STORE_PATH,
+    bundle_root=None,
+):
+    params = {**EXTERNAL_PARAMS, **(params or {})}
+    nthread = nthread or os.cpu_count()
+    cutoff = time_cutoff(holdout, batch_rows, root)
+    print(f"Training on rows before {cutoff:%Y-%m-%d}, evaluating on the rest")
+
+    cache_parent = os.path.dirname(os.path.abspath(root))
+    with tempfile.TemporaryDirectory(dir=cache_parent) as cache_dir:
+        batches = StoreBatches(
+            os.path.join(cache_dir, "train"),
+            end=cutoff,
+            batch_rows=batch_rows,
+            root=root,
+        )
+        start = time.perf_counter()
+        with span("fit", model="xgboost (external memory)") as fit_span:
+            if hasattr(xgboost, "ExtMemQuantileDMatrix"):
+                dtrain = xgboost.ExtMemQuantileDMatrix(
+                    batches, nthread=nthread, max_bin=256
+                )
+            else:
+                # XGBoost < 3.0: the iterator-backed DMatrix is external memory
+                dtrain = xgboost.DMatrix(batches, nthread=nthread)
+            booster = xgboost.train(
+                {
+                    "objective": "multi:softprob",
+                    "num_class": len(LABEL_MAP),
+                    "eval_metric": "mlogloss",
+                    "tree_method": "hist",
+                    "max_bin": 256,
+                    "max_depth": params["max_depth"],
+                    "learning_rate": params["learning_rate"],
+                    "nthread": nthread,
+                },
+                dtrain,
+                num_boost_round=params["n_estimators"],
+            )
+            fit_span.rows = batches.rows
+        fit_s = time.perf_counter() - start
+        del dtrain
+    print(f"Fitted on {batches.rows} rows in {fit_s:.1f} s with {nthread} threads")
+
+    with span("predict", model="xgboost (external memory)") as predict_span:
+        confusion = evaluate(booster, cutoff, batch_rows, root)
+        predict_span.rows = int(confusion.sum())
+    accuracy, f1_macro, report = confusion_scores(confusion)
+    print("\n--- xgboost (external memory) Holdout Results ---")
+    print(report.round(2).to_string())
+    print(f"accuracy {accuracy:.3f}, F1 macro {f1_macro:.3f}")
+
+    kwargs = {} if bundle_root is None else {"root": bundle_root}
+    path = save_bundle(
+        booster,
+        LABEL_MAP,
+        FEATURE_COLS,
+        batches.dtypes,
+        data_fingerprint=batches.fingerprint(),
+        metrics={
+            "holdout_accuracy": accuracy,
+            "holdout_f1_macro": f1_macro,
+            "params": params,
+            "holdout_start": str(cutoff),
+            "split": "time",
+        },
+        **kwargs,
+    )
+    prune_bundles(keep=3, **kwargs)
+    return path
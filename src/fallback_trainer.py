@@ -0,0 +1,130 @@
+import fcntl
+import json
+import os
+import tempfile
+import time
+
+from sklearn.ensemble import RandomForestClassifier
+
+from feature_store import read_features
+from features import FEATURE_COLS, LABEL_MAP
+from model_bundle import save_bundle
+
+LOCK_PATH = "models/.fallback_training.lock"
+PROGRESS_PATH = "models/fallback_progress.json"
+
+
+def _atomic_write(path, write):
+    # Write to a temp file in the same directory, then rename over the target,
+    # so readers see either the old file or the complete new one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_progress(stage, progress, **extra):
+    state = {"stage": stage, "progress": progress, "pid": os.getpid()}
+    state.update(extra, updated=time.time())
+
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(state, f)
+
+    _atomic_write(PROGRESS_PATH, write)
+
+
+def read_progress():
+    try:
+        with open(PROGRESS_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def acquire_lock(wait_s=0.0):
+    # Exclusive lock, retried for up to wait_s; None if another trainer holds
+    # it. The OS drops the lock if the trainer dies, so it can never go stale.
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    lock = open(LOCK_PATH, "a")
+    deadline = time.monotonic() + wait_s
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                lock.close()
+                return None
+            time.sleep(0.05)
+
+
+def is_training():
+    # A shared lock is granted only while no trainer holds the exclusive one.
+    # It is released at once; a trainer starting in that instant retries.
+    if not os.path.exists(LOCK_PATH):
+        return False
+    with open(LOCK_PATH) as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    return False
+
+
+def train(n_estimators=50, step=10):
+    write_progress("loading data", 0.0)
+    df_train = read_features(columns=FEATURE_COLS + ["congestion_level"])
+    df_train = df_train.dropna(subset=["congestion_level", "volume_15min", "hour"])
+    df_train["label"] = df_train["congestion_level"].map(LABEL_MAP).astype("int64")
+    speed_cols = [col for col in FEATURE_COLS if "vol_" in col]
+    df_train[speed_cols] = df_train[speed_cols].fillna(0).astype("uint16")
+
+    X = df_train[FEATURE_COLS]
+    y = df_train["label"]
+
+    # Trees are added in steps so progress can be reported; n_jobs=-1 builds
+    # each step's trees on all cores
+    model = RandomForestClassifier(
+        n_estimators=step, warm_start=True, n_jobs=-1, random_state=42
+    )
+    for n in range(step, n_estimators + step, step):
+        model.n_estimators = min(n, n_estimators)
+        model.fit(X, y)
+        write_progress(
+            "training", model.n_estimators / n_estimators, rows=len(df_train)
+        )
+    # Scored one row at a time by the app and compiled by tree_engine, which
+    # both expect a single-job forest
+    model.set_params(n_jobs=1)
+
+    # The bundle becomes visible only when its CURRENT pointer is swapped
+    write_progress("saving", 1.0)
+    path = save_bundle(model, LABEL_MAP, FEATURE_COLS, X.dtypes)
+    write_progress("done", 1.0, bundle=path)
+
+
+def main():
+    # Waits out a status probe that holds the lock for an instant
+    lock = acquire_lock(wait_s=2.0)
+    if lock is None:
+        print("A fallback trainer is already running")
+        return
+    try:
+        train()
+    except Exception as e:
+        write_progress("failed", 0.0, error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        lock.close()
+    print("Fallback model bundle saved")
+
+
+if __name__ == "__main__":
+    main()
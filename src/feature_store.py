@@ -0,0 +1,206 @@
+import glob
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from instrument import span, traced
+from schema import STORE_DTYPES, TIME_COLS, compact
+
+STORE_PATH = "data/processed/features"
+CSV_PATH = "data/processed/final_processed.csv"
+
+# The speed-side copies of the location columns duplicate the volume side
+DROP_COLS = [
+    "id_spd",
+    "location_name_spd",
+    "longitude_spd",
+    "latitude_spd",
+    "centreline_id_spd",
+    "time_start_spd",
+    "time_end_spd",
+]
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8())]), flavor="hive"
+)
+
+
+def to_store_schema(df):
+    df = df.drop(columns=[c for c in DROP_COLS if c in df.columns])
+    for col in TIME_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    df = compact(df)
+    df["year"] = df["datetime"].dt.year.astype("int16")
+    df["month"] = df["datetime"].dt.month.astype("int8")
+    # Sorted rows give tight row-group statistics for time-range pushdown
+    return df.sort_values(["datetime", "count_id"]).reset_index(drop=True)
+
+
+def clear_store(root=STORE_PATH):
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+
+def _to_table(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Fixed-width dictionary indices keep every file on the same schema,
+    # whatever the number of categories in that file
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            target = pa.dictionary(pa.int32(), field.type.value_type)
+            table = table.set_column(i, field.name, table.column(i).cast(target))
+    return table
+
+
+def write_features(df, root=STORE_PATH):
+    # Appends a new file to every year/month partition the frame touches
+    with span("store:write", rows=len(df)):
+        ds.write_dataset(
+            _to_table(to_store_schema(df)),
+            root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        )
+
+
+def _month_bound(ts, op):
+    year = ds.field("year")
+    month = ds.field("month")
+    if op == ">=":
+        return (year > ts.year) | ((year == ts.year) & (month >= ts.month))
+    return (year < ts.year) | ((year == ts.year) & (month <= ts.month))
+
+
+def _filter_expression(start=None, end=None, filters=None, partitioned=True):
+    # Date bounds prune whole year/month directories, then row groups
+    expr = None
+    if filters is not None:
+        expr = (
+            filters
+            if isinstance(filters, ds.Expression)
+            else pq.filters_to_expression(filters)
+        )
+    if start is not None:
+        start = pd.Timestamp(start)
+        bound = ds.field("datetime") >= start
+        if partitioned:
+            bound = _month_bound(start, ">=") & bound
+        expr = bound if expr is None else expr & bound
+    if end is not None:
+        end = pd.Timestamp(end)
+        bound = ds.field("datetime") < end
+        if partitioned:
+            bound = _month_bound(end, "<=") & bound
+        expr = bound if expr is None else expr & bound
+    return expr
+
+
+def _unify_categories(df):
+    # Per-file dictionaries are unified into the fixed category sets
+    return df.astype(
+        {
+            c: t
+            for c, t in STORE_DTYPES.items()
+            if c in df.columns and isinstance(t, pd.CategoricalDtype)
+        }
+    )
+
+
+def _read_csv(columns=None, start=None, end=None, filters=None):
+    # The legacy CSV with the same selection applied in memory
+    if start is None and end is None and filters is None:
+        return pd.read_csv(CSV_PATH, usecols=columns)
+    df = pd.read_csv(CSV_PATH)
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    table = ds.dataset(pa.Table.from_pandas(df, preserve_index=False)).to_table(
+        columns=columns,
+        filter=_filter_expression(start, end, filters, partitioned=False),
+    )
+    return table.to_pandas()
+
+
+@traced("load:store")
+def read_features(columns=None, start=None, end=None, filters=None, root=STORE_PATH):
+    # Falls back to the legacy CSV for trees processed before the store existed
+    if not os.path.exists(root):
+        return _read_csv(columns, start, end, filters)
+
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+    table = dataset.to_table(
+        columns=columns, filter=_filter_expression(start, end, filters)
+    )
+    return _unify_categories(table.to_pandas())
+
+
+def scan_features(
+    columns=None,
+    start=None,
+    end=None,
+    filters=None,
+    batch_rows=1_000_000,
+    root=STORE_PATH,
+):
+    # Same selection as read_features, as DataFrames of at most batch_rows
+    # rows, one year/month partition after another in time order
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+
+    def time_order(fragment):
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        return keys["year"], keys["month"], fragment.path
+
+    expr = _filter_expression(start, end, filters)
+    fragments = sorted(dataset.get_fragments(filter=expr), key=time_order)
+    for fragment in fragments:
+        scanner = fragment.scanner(
+            schema=dataset.schema,
+            columns=columns,
+            filter=expr,
+            batch_size=batch_rows,
+        )
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield _unify_categories(batch.to_pandas())
+
+
+def partition_dir(root, year, month):
+    return os.path.join(root, f"year={year}", f"month={month}")
+
+
+def replace_partitions(df, count_ids, partitions, root=STORE_PATH):
+    # Rewrites each listed year/month partition without the rows of count_ids,
+    # plus the rows of df that fall into it. Other partitions are not touched.
+    new = to_store_schema(df) if len(df) else None
+    for year, month in partitions:
+        path = partition_dir(root, year, month)
+        old_files = sorted(glob.glob(os.path.join(path, "*.parquet")))
+        parts = []
+        if old_files:
+            old = ds.dataset(old_files, format="parquet").to_table().to_pandas()
+            parts.append(old[~old["count_id"].isin(count_ids)])
+        if new is not None:
+            in_partition = (new["year"] == year) & (new["month"] == month)
+            parts.append(new[in_partition].drop(columns=["year", "month"]))
+
+        merged = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if len(merged):
+            merged = compact(merged).sort_values(["datetime", "count_id"])
+            os.makedirs(path, exist_ok=True)
+            # The new file lands under a name the dataset scan ignores and is
+            # renamed into place, so a crash never leaves a truncated file
+            name = f"part-{uuid.uuid4().hex}-0.parquet"
+            tmp_path = os.path.join(path, f"_{name}.tmp")
+            pq.write_table(_to_table(merged), tmp_path, compression="zstd")
+            os.replace(tmp_path, os.path.join(path, name))
+        for old_file in old_files:
+            os.remove(old_file)
+        if os.path.isdir(path) and not os.listdir(path):
+            os.rmdir(path)
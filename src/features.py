@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+SPEED_COLS = [
+    "vol_1_19kph",
+    "vol_20_25kph",
+    "vol_26_30kph",
+    "vol_31_35kph",
+    "vol_36_40kph",
+    "vol_41_45kph",
+    "vol_46_50kph",
+    "vol_51_55kph",
+    "vol_56_60kph",
+    "vol_61_65kph",
+    "vol_66_70kph",
+    "vol_71_75kph",
+    "vol_76_80kph",
+    "vol_81_160kph",
+]
+
+# Model input, in the column order the classifiers are trained on
+FEATURE_COLS = ["hour", "is_weekend", "is_rush_hour", "volume_15min"] + SPEED_COLS
+
+# Manual label encoding (Low=0, Medium=1, High=2)
+LABEL_MAP = {"Low": 0, "Medium": 1, "High": 2}
+
+RUSH_HOURS = [7, 8, 9, 16, 17, 18]
+
+TIME_COLUMNS = ["datetime", "time_start_vol", "time_start"]
+
+
+def build_features(df):
+    # Model matrix from raw 15-minute records or processed rows, without
+    # per-row Python work. Time features are derived only when missing.
+    n = len(df)
+    X = np.zeros((n, len(FEATURE_COLS)), dtype=np.float32)
+
+    if not {"hour", "is_weekend", "is_rush_hour"}.issubset(df.columns):
+        time_col = next((c for c in TIME_COLUMNS if c in df.columns), None)
+        if time_col is None:
+            raise ValueError(
+                "records need hour, is_weekend and is_rush_hour "
+                f"or a time column ({', '.join(TIME_COLUMNS)})"
+            )
+        when = pd.to_datetime(df[time_col])
+        hour = when.dt.hour.to_numpy()
+        X[:, 0] = hour
+        X[:, 1] = when.dt.dayofweek.to_numpy() >= 5
+        X[:, 2] = np.isin(hour, RUSH_HOURS)
+    else:
+        X[:, 0] = df["hour"].to_numpy()
+        X[:, 1] = df["is_weekend"].to_numpy()
+        X[:, 2] = df["is_rush_hour"].to_numpy()
+
+    X[:, 3] = df["volume_15min"].to_numpy(dtype=np.float32)
+    for i, col in enumerate(SPEED_COLS, start=4):
+        if col in df.columns:
+            X[:, i] = df[col].fillna(0).to_numpy(dtype=np.float32)
+    return X
@@ -0,0 +1,183 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from feature_store import PARTITIONING, STORE_PATH
+
+FORECAST_PATH = "data/processed/forecast"
+SOURCE_COLUMNS = [
+    "count_id",
+    "direction",
+    "datetime",
+    "volume_15min",
+    "hour",
+    "is_weekend",
+    "is_rush_hour",
+]
+INTERVAL_MIN = 15
+HORIZONS = [15, 30, 45, 60]
+LAGS = [1, 2, 3, 4]  # intervals before the current one
+WINDOWS = {"mean_1h": 4, "mean_3h": 12}  # intervals, current one included
+WEEK_MIN = 7 * 24 * 60
+LEVEL_BINS = [-1, 20, 50, np.inf]  # as the congestion_level labels
+
+# Inputs shared by every horizon; each horizon adds the volume at the same
+# (target) time one week earlier
+BASE_FEATURES = (
+    ["hour", "is_weekend", "is_rush_hour", "volume_15min"]
+    + [f"lag_{lag}" for lag in LAGS]
+    + list(WINDOWS)
+)
+
+# Every series (one count_id and direction) is a run of 15-minute intervals
+# with gaps between counting periods. Rows are sorted on one int64 key,
+# series * SPAN + minutes, so "the same series k minutes earlier" is the key
+# minus k: lags, the week-old value and the targets are exact-match binary
+# searches, and a rolling mean is a difference of cumulative sums between the
+# window start (found the same way) and the row. Missing intervals stay
+# missing instead of shifting the next row into their place.
+
+
+def horizon_features(horizon):
+    return BASE_FEATURES + [f"last_week_{horizon}"]
+
+
+def level_codes(volume):
+    # LABEL_MAP codes of the congestion level, NaN where volume is missing
+    codes = np.digitize(volume, LEVEL_BINS[1:-1], right=True).astype(np.float32)
+    return np.where(np.isnan(volume), np.nan, codes)
+
+
+def lag_features(df, horizons=HORIZONS):
+    # Forecast rows for one or more whole series, in series/time order
+    series = df.groupby(["count_id", "direction"], observed=True, sort=False).ngroup()
+    minutes = df["datetime"].to_numpy().astype("datetime64[m]").view(np.int64)
+    minutes = minutes - minutes.min() if len(df) else minutes
+    span = int(minutes.max(initial=0)) + WEEK_MIN + max(horizons) + 1
+    key = series.to_numpy(dtype=np.int64) * span + minutes
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    volume = df["volume_15min"].to_numpy(dtype=np.float32)[order]
+
+    def value_at(delta_min):
+        target = key + delta_min
+        idx = np.minimum(np.searchsorted(key, target), len(key) - 1)
+        return np.where(key[idx] == target, volume[idx], np.nan)
+
+    out = df.iloc[order][SOURCE_COLUMNS].reset_index(drop=True)
+    for lag in LAGS:
+        out[f"lag_{lag}"] = value_at(-lag * INTERVAL_MIN)
+
+    cumsum = np.concatenate([[0.0], np.cumsum(volume, dtype=np.float64)])
+    row = np.arange(len(key))
+    for name, width in WINDOWS.items():
+        first = np.searchsorted(key, key - (width - 1) * INTERVAL_MIN)
+        total = cumsum[row + 1] - cumsum[first]
+        out[name] = (total / (row + 1 - first)).astype(np.float32)
+
+    for horizon in horizons:
+        out[f"last_week_{horizon}"] = value_at(horizon - WEEK_MIN)
+        out[f"target_{horizon}"] = level_codes(value_at(horizon))
+    return out
+
+
+def spill_buckets(store_path, spill_dir, buckets):
+    # One streaming scan of the store, rows hash-partitioned by count_id so
+    # every series lands whole in one bucket directory
+    count_id = ds.field("count_id")
+    remainder = pc.subtract(
+        count_id, pc.multiply(pc.divide(count_id, buckets), buckets)
+    )
+    dataset = ds.dataset(store_path, format="parquet", partitioning=PARTITIONING)
+    scanner = dataset.scanner(
+        columns={**{c: ds.field(c) for c in SOURCE_COLUMNS}, "bucket": remainder}
+    )
+    ds.write_dataset(
+        scanner,
+        spill_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("bucket", pa.int64())])),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _build_bucket(args):
+    bucket, spill_dir, out_dir, horizons = args
+    path = os.path.join(spill_dir, str(bucket))
+    if not os.path.exists(path):
+        return 0
+    df = ds.dataset(path, format="parquet").to_table(SOURCE_COLUMNS).to_pandas()
+    table = pa.Table.from_pandas(lag_features(df, horizons), preserve_index=False)
+    pq.write_table(
+        table, os.path.join(out_dir, f"bucket-{bucket:04d}.parquet"), compression="zstd"
+    )
+    return len(df)
+
+
+def build_forecast_features(
+    store_path=STORE_PATH,
+    out_dir=FORECAST_PATH,
+    buckets=16,
+    workers=1,
+    horizons=HORIZONS,
+):
+    # Whole series never straddle buckets, so each bucket is built on its own
+    # with only its rows in memory; one Parquet file per bucket
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(tmp_dir)) as spill_dir:
+        spill_buckets(store_path, spill_dir, buckets)
+        jobs = [(b, spill_dir, tmp_dir, horizons) for b in range(buckets)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rows = sum(pool.map(_build_bucket, jobs))
+        else:
+            rows = sum(_build_bucket(job) for job in jobs)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return rows
+
+
+def read_forecast_features(horizon, path=FORECAST_PATH, start=None, end=None):
+    # Rows with a known target at this horizon, inputs plus target only
+    expr = ~ds.field(f"target_{horizon}").is_nan()
+    if start is not None:
+        expr = expr & (ds.field("datetime") >= pd.Timestamp(start))
+    if end is not None:
+        expr = expr & (ds.field("datetime") < pd.Timestamp(end))
+    columns = ["datetime"] + horizon_features(horizon) + [f"target_{horizon}"]
+    return ds.dataset(path, format="parquet").to_table(columns, filter=expr).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build lag / rolling / last-week forecast features per series"
+    )
+    parser.add_argument("--buckets", type=int, default=16, help="count_id buckets")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default=FORECAST_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = build_forecast_features(
+        out_dir=args.output, buckets=args.buckets, workers=args.workers
+    )
+    print(
+        f"{rows} rows of forecast features in {time.perf_counter() - start:.1f} s "
+        f"saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
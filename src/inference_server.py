@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLS, build_features
+from predict_batch import LABEL_MAP_PATH, load_model, predict_proba
+
+
+class MicroBatcher:
+    # Coalesces concurrent requests into one predict call. A batch is flushed
+    # once it holds max_batch_size rows or its first request has waited
+    # max_wait_ms, whichever comes first.
+
+    def __init__(self, model, max_batch_size=256, max_wait_ms=2.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        # One scoring thread keeps the event loop free to accept requests
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.rows = 0
+
+    async def predict(self, X):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((X, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            size = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            X = np.concatenate([x for x, _ in items])
+            try:
+                proba = await loop.run_in_executor(
+                    self.executor, predict_proba, self.model, X
+                )
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(X)
+            offset = 0
+            for x, future in items:
+                future.set_result(proba[offset : offset + len(x)])
+                offset += len(x)
+
+
+class Stats:
+    def __init__(self, window=10_000):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.finished = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds)
+        self.finished.append(time.perf_counter())
+
+    def snapshot(self, batcher):
+        lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        now = time.perf_counter()
+        uptime = now - self.started
+        # Throughput over the recent window rather than the whole uptime
+        recent = [t for t in self.finished if now - t <= 10]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rows": batcher.rows,
+            "batches": batcher.batches,
+            "mean_batch_rows": batcher.rows / max(batcher.batches, 1),
+            "latency_ms": {
+                "p50": float(np.percentile(lat, 50)),
+                "p99": float(np.percentile(lat, 99)),
+            },
+            "requests_per_s_last_10s": len(recent) / min(10, uptime),
+            "requests_per_s_since_start": self.requests / uptime,
+            "rows_per_s_since_start": batcher.rows / uptime,
+        }
+
+
+def parse_instances(payload):
+    # Accepts one record, a list of records, or {"instances": [...]}. Records
+    # are either dicts keyed by FEATURE_COLS (or raw 15-minute records with a
+    # time_start) or plain lists in FEATURE_COLS order.
+    if isinstance(payload, dict) and "instances" in payload:
+        payload = payload["instances"]
+    if not isinstance(payload, list):
+        payload = [payload]
+    if not payload:
+        raise ValueError("no instances given")
+    if isinstance(payload[0], dict):
+        if all(c in payload[0] for c in FEATURE_COLS[:4]):
+            return np.array(
+                [[row.get(c, 0) or 0 for c in FEATURE_COLS] for row in payload],
+                dtype=np.float32,
+            )
+        return build_features(pd.DataFrame(payload))
+    X = np.asarray(payload, dtype=np.float32)
+    if X.ndim != 2 or X.shape[1] != len(FEATURE_COLS):
+        raise ValueError(f"expected rows of {len(FEATURE_COLS)} features")
+    return X
+
+
+def parse_head(head):
+    # (method, path, headers) of a request head; ValueError when malformed
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3:
+        raise ValueError(f"malformed request line: {lines[0][:100]!r}")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    return parts[0], parts[1], headers
+
+
+class InferenceServer:
+    def __init__(self, model, label_map, max_batch_size=256, max_wait_ms=2.0):
+        self.batcher = MicroBatcher(model, max_batch_size, max_wait_ms)
+        self.stats = Stats()
+        reverse_map = {v: k for k, v in label_map.items()}
+        self.classes = [reverse_map[c] for c in model.classes_]
+
+    async def handle_predict(self, body):
+        X = parse_instances(json.loads(body))
+        proba = await self.batcher.predict(X)
+        return {
+            "predictions": [self.classes[i] for i in proba.argmax(axis=1)],
+            "probabilities": np.round(proba, 6).tolist(),
+            "classes": self.classes,
+        }
+
+    async def route(self, method, path, body):
+        if method == "POST" and path == "/predict":
+            return 200, await self.handle_predict(body)
+        if method == "GET" and path == "/metrics":
+            return 200, self.stats.snapshot(self.batcher)
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        return 404, {"error": f"no route for {method} {path}"}
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive, enough for JSON clients
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                start = time.perf_counter()
+                path, headers, framed = None, {}, False
+                try:
+                    method, path, headers = parse_head(head)
+                    length = int(headers.get("content-length", 0))
+                    body = await reader.readexactly(length) if length else b""
+                    framed = True
+                    status, payload = await self.route(method, path, body)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except (ValueError, KeyError, TypeError) as e:
+                    self.stats.errors += 1
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    # The model or the executor failed: answer rather than drop
+                    self.stats.errors += 1
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+                data = json.dumps(payload).encode()
+                reason = {
+                    200: "OK",
+                    400: "Bad Request",
+                    404: "Not Found",
+                    500: "Internal Server Error",
+                }[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    "Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if path == "/predict":
+                    self.stats.record(time.perf_counter() - start)
+                # A request that could not be framed leaves the stream unusable
+                if not framed or headers.get("connection", "").lower() == "close":
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        batcher_task = asyncio.create_task(self.batcher.run())
+        print(f"Serving predictions on http://{host}:{port}/predict")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP congestion prediction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="bundle directory or legacy pickle (default: the current bundle)",
+    )
+    parser.add_argument("--label-map", default=LABEL_MAP_PATH)
+    parser.add_argument(
+        "--max-batch-size", type=int, default=256, help="rows per predict call"
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=2.0,
+        help="longest a request waits for its batch to fill",
+    )
+    parser.add_argument(
+        "--compiled", action="store_true", help="score with the compiled tree engine"
+    )
+    args = parser.parse_args()
+
+    # Model and label map are loaded once for the life of the process
+    model, label_map = load_model(args.model, args.label_map, args.compiled)
+    server = InferenceServer(model, label_map, args.max_batch_size, args.max_wait_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
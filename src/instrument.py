@@ -0,0 +1,232 @@
+import atexit
+import cProfile
+import functools
+import itertools
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+PROFILE_DIR = "data/processed/profiles"
+
+# Spans around the pipeline stages (load, merge, features, label, fit,
+# predict, solve, render): wall time, rows processed and the change in
+# resident memory, kept in memory and optionally written as JSON lines.
+#
+#   TRAFFIC_TRACE=1                       collect spans, print a summary at exit
+#   TRAFFIC_TRACE_FILE=spans.jsonl        also append every span to this file
+#   TRAFFIC_PROFILE=cprofile,tracemalloc  also dump a cProfile profile and/or a
+#                                         tracemalloc snapshot per outermost
+#                                         span into PROFILE_DIR
+#
+# When tracing is off, span() returns one shared no-op object and traced
+# functions are called straight through: the cost is a flag check.
+
+_state = {"enabled": False, "profile": set(), "file": None}
+_local = threading.local()
+_recent = deque(maxlen=2000)
+_file_lock = threading.Lock()
+_dump_ids = itertools.count()
+_page_bytes = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_mb():
+    # Current resident set size; where /proc is missing, the process peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _page_bytes / 1e6
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def enable(profile=(), trace_file=None):
+    _state["profile"] = set(profile)
+    _state["file"] = trace_file
+    if "tracemalloc" in _state["profile"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state["enabled"] = True
+
+
+def disable():
+    _state["enabled"] = False
+
+
+def _rows(result):
+    # Rows of a frame or array result; None for anything else
+    shape = getattr(result, "shape", None)
+    return int(shape[0]) if shape else None
+
+
+class Span:
+    def __init__(self, name, rows=None, attrs=None):
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs or {}
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.profiler = None
+        if self.depth == 0 and "cprofile" in _state["profile"]:
+            try:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            except ValueError:
+                # Another thread's span is being profiled
+                self.profiler = None
+        self.rss = _rss_mb()
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        record = {
+            "name": self.name,
+            "start": self.wall,
+            "duration_ms": duration * 1000,
+            "rows": self.rows,
+            "rows_per_s": self.rows / duration if self.rows and duration else None,
+            "rss_delta_mb": _rss_mb() - self.rss,
+            "parent": self.parent,
+            "depth": self.depth,
+            "thread": threading.current_thread().name,
+            "error": exc_type.__name__ if exc_type else None,
+            **self.attrs,
+        }
+        if self.depth == 0 and _state["profile"]:
+            record.update(self._dump_profiles())
+        _recent.append(record)
+        captured = getattr(_local, "captured", None)
+        if captured is not None:
+            captured.append(record)
+        if _state["file"]:
+            with _file_lock, open(_state["file"], "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        return False
+
+    def _dump_profiles(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]", "_", self.name)
+        stem = os.path.join(PROFILE_DIR, f"{safe_name}-{os.getpid()}-{next(_dump_ids)}")
+        paths = {}
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(stem + ".prof")
+            paths["cprofile"] = stem + ".prof"
+        if "tracemalloc" in _state["profile"] and tracemalloc.is_tracing():
+            tracemalloc.take_snapshot().dump(stem + ".tracemalloc")
+            paths["tracemalloc"] = stem + ".tracemalloc"
+        return paths
+
+
+class _NoSpan:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, rows=None, **attrs):
+    # with span("merge") as s: ...; s.rows = len(df)
+    if not _state["enabled"]:
+        return _NO_SPAN
+    return Span(name, rows, attrs)
+
+
+def traced(name, rows=_rows):
+    # Decorator form of span(); rows(result) gives the rows processed
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not _state["enabled"]:
+                return fn(*args, **kwargs)
+            with Span(name) as s:
+                result = fn(*args, **kwargs)
+                s.rows = rows(result) if rows else None
+            return result
+
+        return call
+
+    return wrap
+
+
+def capture():
+    # Spans finished on this thread from now on are also appended to the
+    # returned list (replacing any earlier capture, e.g. per dashboard rerun)
+    _local.captured = []
+    return _local.captured
+
+
+def recent_spans():
+    return list(_recent)
+
+
+def summary(spans=None):
+    # Per span name: calls, total and mean ms, rows, rows/s, memory delta
+    import pandas as pd
+
+    spans = recent_spans() if spans is None else spans
+    columns = ["calls", "total_ms", "mean_ms", "rows", "rows_per_s", "rss_delta_mb"]
+    if not spans:
+        return pd.DataFrame(columns=columns)
+    groups = pd.DataFrame(spans).groupby("name", sort=False)
+    table = groups.agg(
+        calls=("duration_ms", "size"),
+        total_ms=("duration_ms", "sum"),
+        mean_ms=("duration_ms", "mean"),
+        rss_delta_mb=("rss_delta_mb", "sum"),
+    )
+    # Spans that never report rows stay NaN rather than 0
+    table["rows"] = groups["rows"].sum(min_count=1)
+    table["rows_per_s"] = table["rows"] / (table["total_ms"] / 1000)
+    return table[columns]
+
+
+def _print_summary():
+    if _recent:
+        print("\n[trace] span summary", file=sys.stderr)
+        print(summary().round(2).to_string(), file=sys.stderr)
+
+
+def environment_options():
+    # enable() arguments from TRAFFIC_PROFILE and TRAFFIC_TRACE_FILE
+    profile = [p.strip() for p in os.environ.get("TRAFFIC_PROFILE", "").split(",")]
+    return {
+        "profile": [p for p in profile if p],
+        "trace_file": os.environ.get("TRAFFIC_TRACE_FILE"),
+    }
+
+
+def _from_environment():
+    if os.environ.get("TRAFFIC_TRACE", "") in ("", "0"):
+        return
+    enable(**environment_options())
+    atexit.register(_print_summary)
+
+
+_from_environment()
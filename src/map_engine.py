@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from feature_store import read_features
+from instrument import traced
+from schema import LEVELS
+from spatial_index import load_index
+
+MAP_COLUMNS = [
+    "centreline_id_vol",
+    "location_name_vol",
+    "latitude_vol",
+    "longitude_vol",
+    "hour",
+    "volume_15min",
+    "congestion_level",
+]
+LEVEL_COLORS = np.array([[26, 150, 65, 200], [253, 174, 97, 200], [215, 25, 28, 200]])
+METERS_PER_DEG_LAT = 111_320
+
+
+@traced("features:map")
+def aggregate_congestion(df, by="location", cell_m=250, bucket="hour"):
+    # One row per location (centreline_id) or grid cell, and per time bucket,
+    # with the record count, mean volume and share of each congestion level
+    df = df.dropna(subset=["latitude_vol", "longitude_vol", "congestion_level"])
+    if by == "grid":
+        # Square cells of roughly cell_m metres at this latitude
+        lat0 = np.radians(df["latitude_vol"].mean())
+        keys = {
+            "cell_y": np.floor(df["latitude_vol"] * METERS_PER_DEG_LAT / cell_m),
+            "cell_x": np.floor(
+                df["longitude_vol"] * METERS_PER_DEG_LAT * np.cos(lat0) / cell_m
+            ),
+        }
+    else:
+        keys = {"centreline_id": df["centreline_id_vol"]}
+    if bucket is not None:
+        keys[bucket] = df[bucket]
+
+    levels = pd.Categorical(df["congestion_level"], categories=LEVELS)
+    frame = pd.DataFrame(
+        {
+            **keys,
+            "latitude": df["latitude_vol"].to_numpy(),
+            "longitude": df["longitude_vol"].to_numpy(),
+            "site": df["centreline_id_vol"].to_numpy(),
+            "volume": df["volume_15min"].to_numpy(dtype=np.float64),
+            **{f"share_{level}": levels == level for level in LEVELS},
+        }
+    )
+    agg = frame.groupby(list(keys), observed=True, sort=False).agg(
+        latitude=("latitude", "mean"),
+        longitude=("longitude", "mean"),
+        records=("volume", "size"),
+        sites=("site", "nunique"),
+        mean_volume=("volume", "mean"),
+        **{f"share_{level}": (f"share_{level}", "mean") for level in LEVELS},
+    )
+    if by == "grid":
+        agg["location"] = agg["sites"].astype(str) + " count location(s)"
+    else:
+        names = df.groupby("centreline_id_vol", observed=True)["location_name_vol"]
+        agg = agg.join(names.first().astype(str).rename("location"), on="centreline_id")
+    agg = agg.reset_index()
+    shares = agg[[f"share_{level}" for level in LEVELS]].to_numpy()
+    agg["level"] = np.array(LEVELS)[shares.argmax(axis=1)]
+    return agg
+
+
+def load_aggregates(
+    by="location",
+    cell_m=250,
+    bucket="hour",
+    bbox=None,
+    time_of_day=None,
+    weekdays=None,
+):
+    # Filtered views go through the spatial/time index; the full map reads
+    # only the map columns from the feature store
+    if bbox is None and time_of_day is None and weekdays is None:
+        df = read_features(columns=MAP_COLUMNS)
+    else:
+        df = load_index().query(bbox=bbox, time_of_day=time_of_day, weekdays=weekdays)
+        df["hour"] = df["minute_of_day"] // 60
+    return aggregate_congestion(df, by=by, cell_m=cell_m, bucket=bucket)
+
+
+def congestion_deck(agg):
+    import pydeck as pdk
+
+    # Colour by the dominant level, radius by mean volume; columns become
+    # flat arrays in one ScatterplotLayer
+    level_idx = pd.Categorical(agg["level"], categories=LEVELS).codes
+    data = agg.assign(
+        color=LEVEL_COLORS[level_idx].tolist(),
+        radius=20 + 12 * np.sqrt(agg["mean_volume"].to_numpy()),
+        high_pct=(agg["share_High"] * 100).round(0),
+        mean_volume=agg["mean_volume"].round(1),
+    )
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=data[
+            ["longitude", "latitude", "color", "radius", "location", "level"]
+            + ["mean_volume", "high_pct", "records"]
+        ],
+        get_position="[longitude, latitude]",
+        get_fill_color="color",
+        get_radius="radius",
+        radius_units="meters",
+        pickable=True,
+        stroked=False,
+    )
+    view_state = pdk.ViewState(
+        latitude=float(agg["latitude"].mean()) if len(agg) else 43.65,
+        longitude=float(agg["longitude"].mean()) if len(agg) else -79.38,
+        zoom=12,
+    )
+    tooltip = {
+        "html": "<b>{location}</b><br>Level: {level}<br>"
+        "Mean volume: {mean_volume}<br>High: {high_pct}%<br>Records: {records}"
+    }
+    return pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=tooltip)
+
+
+@traced("render:map", rows=None)
+def render_map_html(agg):
+    # Standalone HTML page, built in memory
+    return congestion_deck(agg).to_html(as_string=True, notebook_display=False)
@@ -1,30 +1,26 @@
-import folium
-import pandas as pd
+import argparse
 
-# Load your processed dataset with coordinates + congestion
-df = pd.read_csv("data/processed/final_processed.csv")
+from map_engine import load_aggregates, render_map_html
 
-# Get a small sample for plotting (optional)
-df = df.dropna(subset=["latitude_vol", "longitude_vol", "congestion_level"])
-df = df.sample(300, random_state=42)  # limit to 300 points for speed
 
-# Create base map centered around the city
-m = folium.Map(location=[43.65, -79.38], zoom_start=12)  # Toronto default center
+def main():
+    parser = argparse.ArgumentParser(description="Write the congestion map to HTML")
+    parser.add_argument("--by", choices=["location", "grid"], default="location")
+    parser.add_argument("--cell-m", type=float, default=250, help="grid cell size")
+    parser.add_argument("--hour", type=int, default=None, help="hour of day (0-23)")
+    parser.add_argument("--output", default="app/congestion_map.html")
+    args = parser.parse_args()
 
-# Color mapping
-color_map = {"Low": "green", "Medium": "orange", "High": "red"}
+    # Every record is aggregated per location (or grid cell), not sampled
+    bucket = None if args.hour is None else "hour"
+    agg = load_aggregates(by=args.by, cell_m=args.cell_m, bucket=bucket)
+    if args.hour is not None:
+        agg = agg[agg["hour"] == args.hour]
 
-# Add each point
-for _, row in df.iterrows():
-    folium.CircleMarker(
-        location=[row["latitude_vol"], row["longitude_vol"]],
-        radius=5,
-        color=color_map.get(row["congestion_level"], "gray"),
-        fill=True,
-        fill_opacity=0.7,
-        popup=f"Volume: {row['volume_15min']}<br>Level: {row['congestion_level']}",
-    ).add_to(m)
+    with open(args.output, "w") as f:
+        f.write(render_map_html(agg))
+    print(f" Map of {len(agg)} points saved to {args.output}")
 
-# Save to HTML
-m.save("app/congestion_map.html")
-print(" Map saved to app/congestion_map.html")
+
+if __name__ == "__main__":
+    main()
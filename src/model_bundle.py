@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+
+BUNDLE_DIR = "models/bundle"
+FORMAT_VERSION = 1
+
+# Everything in this module imports the model libraries lazily: loading an
+# XGBoost or linear bundle never imports sklearn, and nothing here touches
+# pulp or folium.
+
+
+def _library_versions(*names):
+    versions = {}
+    for name in names:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    return versions
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_bundle(
+    model,
+    label_map,
+    feature_cols,
+    feature_dtypes,
+    data_fingerprint=None,
+    metrics=None,
+    root=BUNDLE_DIR,
+):
+    # Writes a new version directory, then points CURRENT at it. Old versions
+    # stay on disk so a bad model can be rolled back by editing CURRENT.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    version = now.strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = os.path.join(root, f"_{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    model_class = f"{type(model).__module__}.{type(model).__name__}"
+    if model_class.startswith("xgboost."):
+        # Native UBJSON: compact, fast to parse, readable by any XGBoost >= 1.6
+        # A bare Booster (external-memory training) has no classes_: its
+        # classes are the label codes
+        model_format, model_file = "xgboost-ubj", "model.ubj"
+        booster = model.get_booster() if hasattr(model, "get_booster") else model
+        booster.save_model(os.path.join(tmp_dir, model_file))
+        classes = [
+            int(c) for c in getattr(model, "classes_", sorted(label_map.values()))
+        ]
+        libraries = _library_versions("xgboost")
+    elif model_class.endswith(".LogisticRegression") and (
+        getattr(model, "multi_class", "auto") in ("auto", "multinomial", "deprecated")
+    ):
+        # A multinomial logistic regression is just its coefficients
+        model_format, model_file = "linear-npz", "model.npz"
+        with open(os.path.join(tmp_dir, model_file), "wb") as f:
+            np.savez(f, coef=model.coef_, intercept=model.intercept_)
+        classes = [int(c) for c in model.classes_]
+        libraries = _library_versions("numpy")
+    else:
+        import joblib
+
+        model_format, model_file = "joblib", "model.joblib"
+        joblib.dump(model, os.path.join(tmp_dir, model_file), compress=3)
+        classes = [int(c) for c in model.classes_]
+        libraries = _library_versions("scikit-learn", "joblib")
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "model_class": model_class,
+        "model_format": model_format,
+        "model_file": model_file,
+        "model_sha256": _sha256(os.path.join(tmp_dir, model_file)),
+        "classes": classes,
+        "label_map": {k: int(v) for k, v in label_map.items()},
+        "feature_cols": list(feature_cols),
+        "feature_dtypes": {c: str(feature_dtypes[c]) for c in feature_cols},
+        "data_fingerprint": data_fingerprint,
+        "metrics": metrics or {},
+        "libraries": libraries,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp_dir, os.path.join(root, version))
+    pointer = os.path.join(root, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    return os.path.join(root, version)
+
+
+def current_bundle(root=BUNDLE_DIR):
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return os.path.join(root, f.read().strip())
+    except OSError:
+        return None
+
+
+class ModelBundle:
+    # Classifier-like wrapper (classes_, predict, predict_proba) over a loaded
+    # bundle, so batch scoring and the HTTP service can use either a bundle or
+    # a legacy pickle
+
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["format_version"] > FORMAT_VERSION:
+            raise ValueError(
+                f"bundle format {self.manifest['format_version']} is newer than "
+                f"this code supports ({FORMAT_VERSION})"
+            )
+        model_path = os.path.join(path, self.manifest["model_file"])
+        if _sha256(model_path) != self.manifest["model_sha256"]:
+            raise ValueError(f"{model_path} does not match its manifest checksum")
+        self.path = path
+        self.classes_ = np.array(self.manifest["classes"])
+        self.feature_cols = self.manifest["feature_cols"]
+        self.label_map = self.manifest["label_map"]
+        self.booster = self.coef = self.model = None
+
+        if self.manifest["model_format"] == "xgboost-ubj":
+            import xgboost
+
+            self.booster = xgboost.Booster()
+            self.booster.load_model(model_path)
+        elif self.manifest["model_format"] == "linear-npz":
+            with np.load(model_path) as arrays:
+                self.coef = arrays["coef"].T.copy()
+                self.intercept = arrays["intercept"]
+        else:
+            import joblib
+
+            self.model = joblib.load(model_path)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if self.booster is not None:
+            # inplace_predict skips DMatrix construction
+            return self.booster.inplace_predict(X)
+        if self.coef is not None:
+            # Same maths as LogisticRegression.predict_proba: a logistic for two
+            # classes, a softmax otherwise
+            scores = X.astype(np.float64) @ self.coef + self.intercept
+            if scores.shape[1] == 1:
+                positive = 1 / (1 + np.exp(-scores[:, 0]))
+                return np.column_stack([1 - positive, positive])
+            scores -= scores.max(axis=1, keepdims=True)
+            np.exp(scores, out=scores)
+            return scores / scores.sum(axis=1, keepdims=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return self.model.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def load_bundle(path=None, root=BUNDLE_DIR):
+    path = path or current_bundle(root)
+    if path is None:
+        raise FileNotFoundError(f"no model bundle under {root}")
+    return ModelBundle(path)
+
+
+def prune_bundles(keep=3, root=BUNDLE_DIR):
+    # Removes all but the newest `keep` versions (never the current one)
+    current = os.path.basename(current_bundle(root) or "")
+    versions = sorted(
+        name
+        for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name)) and not name.startswith("_")
+    )
+    for name in versions[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name))
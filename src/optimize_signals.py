@@ -1,52 +1,141 @@
-import pulp
+import argparse
 
-# Simulated traffic volumes from sensors (you can integrate real-time data later)
-traffic_volume = {"North": 50, "East": 80, "South": 60, "West": 30}
+import numpy as np
 
-# Total signal cycle time (in seconds)
-total_cycle_time = 120
+from instrument import traced
 
-# Initialize LP problem
-prob = pulp.LpProblem("Signal_Timing_Optimization", pulp.LpMinimize)
+DIRECTIONS = ["North", "East", "South", "West"]
 
-# Create green time variables for each direction (continuous, ≥ 10s)
-green_time = {
-    direction: pulp.LpVariable(f"green_{direction}", lowBound=10, cat="Continuous")
-    for direction in traffic_volume
-}
 
-# Objective: Minimize total delay → indirectly minimize difference between allocation & need
-# For now, just keep a dummy objective (we're just interested in the allocation)
-# Objective: Minimize squared difference from proportional time
-ideal_total = sum(traffic_volume.values())
+def target_greens(volumes, cycle_length=120):
+    # Green time proportional to volume; intersections with no traffic at all
+    # get an even split
+    volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+    cycle = np.broadcast_to(np.asarray(cycle_length, dtype=np.float64), len(volumes))
+    totals = volumes.sum(axis=1, keepdims=True)
+    shares = np.divide(
+        volumes,
+        totals,
+        out=np.full_like(volumes, 1 / volumes.shape[1]),
+        where=totals > 0,
+    )
+    return shares * cycle[:, None]
 
-# Add absolute deviation variables
-deviations = {}
 
-for direction in traffic_volume:
-    ideal = (traffic_volume[direction] / ideal_total) * total_cycle_time
-    dev = pulp.LpVariable(f"dev_{direction}", lowBound=0, cat="Continuous")
-    deviations[direction] = dev
+@traced("solve:green_times")
+def green_times(volumes, cycle_length=120, min_green=10):
+    # Solves, for every row of an (N intersections x K approaches) volume
+    # matrix at once,
+    #
+    #     min sum_k |g_k - target_k|  s.t.  sum_k g_k = cycle,  g_k >= min_green
+    #
+    # Since the targets already sum to the cycle, every approach below
+    # min_green is raised to it and the same total is taken back from the
+    # others. That is the projection of the targets onto the bounded simplex,
+    # found here with the sort-based simplex projection. Among the optimal
+    # LP solutions it is the one that trims the long greens evenly.
+    #
+    # cycle_length and min_green are scalars or one value per intersection.
+    # Rows where K * min_green exceeds the cycle are infeasible and come back
+    # as NaN.
+    volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+    n, k = volumes.shape
+    cycle = np.broadcast_to(np.asarray(cycle_length, dtype=np.float64), n)
+    floor = np.broadcast_to(np.asarray(min_green, dtype=np.float64), n)[:, None]
 
-    # Add constraints: deviation captures |green - ideal|
-    prob += green_time[direction] - ideal <= dev
-    prob += ideal - green_time[direction] <= dev
+    # Shift so the lower bound is 0: project s onto {w >= 0, sum w = budget}
+    shifted = target_greens(volumes, cycle) - floor
+    budget = cycle - k * floor[:, 0]
+    ordered = -np.sort(-shifted, axis=1)
+    excess = np.cumsum(ordered, axis=1) - budget[:, None]
+    rank = np.arange(1, k + 1)
+    active = ordered - excess / rank > 0
+    # Number of approaches left above min_green (the condition holds for a
+    # prefix of the sorted targets; none at all when the budget is zero)
+    rho = np.where(active.any(axis=1), k - np.argmax(active[:, ::-1], axis=1), 1)
+    theta = excess[np.arange(n), rho - 1] / rho
+    greens = np.maximum(shifted - theta[:, None], 0) + floor
 
-# Objective: minimize total absolute deviation
-prob += pulp.lpSum(deviations.values())
+    greens[budget < 0] = np.nan
+    return greens
 
 
-# Solve LP
-prob.solve()
+def counted_green_times(volumes, cycle_length=120, min_green=10):
+    # green_times over the approaches each intersection actually counts (not
+    # NaN), one vectorized call per pattern of counted approaches; the others
+    # get no green
+    volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+    cycle = np.broadcast_to(np.asarray(cycle_length, dtype=np.float64), len(volumes))
+    floor = np.broadcast_to(np.asarray(min_green, dtype=np.float64), len(volumes))
+    present = ~np.isnan(volumes)
+    greens = np.zeros_like(volumes)
+    patterns, which = np.unique(present, axis=0, return_inverse=True)
+    for p, pattern in enumerate(patterns):
+        if not pattern.any():
+            continue
+        rows = np.flatnonzero(which.ravel() == p)
+        greens[np.ix_(rows, pattern)] = green_times(
+            volumes[np.ix_(rows, pattern)], cycle[rows], floor[rows]
+        )
+    return greens
 
-# Print optimal green times
-print(" Optimized Green Light Durations:")
-for direction in traffic_volume:
-    print(f"{direction}: {green_time[direction].varValue:.2f} seconds")
 
-# Print comparison: ideal vs optimized
-print("\n Target vs Optimized:")
-for direction in traffic_volume:
-    ideal = (traffic_volume[direction] / ideal_total) * total_cycle_time
-    actual = green_time[direction].varValue
-    print(f"{direction}: Ideal = {ideal:.2f}s | Optimized = {actual:.2f}s")
+def total_deviation(greens, volumes, cycle_length=120):
+    # LP objective per intersection
+    return np.abs(greens - target_greens(volumes, cycle_length)).sum(axis=1)
+
+
+def green_times_pulp(volumes, cycle_length=120, min_green=10):
+    # Reference implementation: one PuLP LP (and one CBC call) per intersection
+    import pulp
+
+    volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+    cycle = np.broadcast_to(np.asarray(cycle_length, dtype=np.float64), len(volumes))
+    floor = np.broadcast_to(np.asarray(min_green, dtype=np.float64), len(volumes))
+    targets = target_greens(volumes, cycle)
+    greens = np.full(volumes.shape, np.nan)
+    for i, row in enumerate(targets):
+        prob = pulp.LpProblem("Signal_Timing_Optimization", pulp.LpMinimize)
+        green = [
+            pulp.LpVariable(f"green_{k}", lowBound=floor[i]) for k in range(len(row))
+        ]
+        dev = [pulp.LpVariable(f"dev_{k}", lowBound=0) for k in range(len(row))]
+        for g, d, ideal in zip(green, dev, row):
+            prob += g - ideal <= d
+            prob += ideal - g <= d
+        prob += pulp.lpSum(dev)
+        prob += pulp.lpSum(green) == cycle[i]
+        prob.solve(pulp.PULP_CBC_CMD(msg=False))
+        if pulp.LpStatus[prob.status] == "Optimal":
+            greens[i] = [g.varValue for g in green]
+    return greens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize signal green times")
+    parser.add_argument(
+        "--volumes",
+        type=float,
+        nargs=len(DIRECTIONS),
+        default=[50, 80, 60, 30],
+        metavar="VOL",
+        help="approach volumes: North East South West",
+    )
+    parser.add_argument("--cycle", type=float, default=120)
+    parser.add_argument("--min-green", type=float, default=10)
+    args = parser.parse_args()
+
+    targets = target_greens(args.volumes, args.cycle)[0]
+    greens = green_times(args.volumes, args.cycle, args.min_green)[0]
+
+    print(" Optimized Green Light Durations:")
+    for direction, green in zip(DIRECTIONS, greens):
+        print(f"{direction}: {green:.2f} seconds")
+
+    print("\n Target vs Optimized:")
+    for direction, ideal, actual in zip(DIRECTIONS, targets, greens):
+        print(f"{direction}: Ideal = {ideal:.2f}s | Optimized = {actual:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
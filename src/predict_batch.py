@@ -0,0 +1,166 @@
+import argparse
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from features import build_features
+from instrument import traced
+from model_bundle import current_bundle, load_bundle
+from tree_engine import compile_model
+
+# Legacy pickles, used only when no bundle has been written yet
+MODEL_PATH = "models/model.pkl"
+LABEL_MAP_PATH = "models/label_map.pkl"
+
+_worker_model = None
+
+
+def resolve_model(model_path=None):
+    # The current bundle unless a bundle directory or pickle is given
+    return model_path or current_bundle() or MODEL_PATH
+
+
+def model_available():
+    return current_bundle() is not None or (
+        os.path.exists(MODEL_PATH) and os.path.exists(LABEL_MAP_PATH)
+    )
+
+
+def load_model(model_path=None, label_map_path=LABEL_MAP_PATH, compiled=False):
+    # compiled=True swaps a tree ensemble for its compiled form (same
+    # probabilities, lower latency on small batches)
+    model_path = resolve_model(model_path)
+    if os.path.isdir(model_path):
+        model = load_bundle(model_path)
+        label_map = model.label_map
+    else:
+        import joblib
+
+        model, label_map = joblib.load(model_path), joblib.load(label_map_path)
+    if compiled:
+        model = compile_model(model, table=True)
+    return model, label_map
+
+
+@traced("predict")
+def predict_proba(model, X):
+    # Models fitted on DataFrames warn about bare arrays; the column order is
+    # fixed by FEATURE_COLS so the warning carries no information here
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return model.predict_proba(X)
+
+
+def _init_worker(model_path, label_map_path, compiled):
+    global _worker_model
+    _worker_model, _ = load_model(model_path, label_map_path, compiled)
+
+
+def _score_in_worker(X):
+    return predict_proba(_worker_model, X)
+
+
+def predict_batch(
+    model,
+    X,
+    batch_size=262_144,
+    workers=1,
+    model_path=None,
+    label_map_path=LABEL_MAP_PATH,
+    compiled=False,
+):
+    # Class probabilities for a feature matrix, scored in large slices. With
+    # workers > 1 the slices are spread over a process pool that loads the model
+    # once per worker.
+    batches = [X[i : i + batch_size] for i in range(0, len(X), batch_size)]
+    if not batches:
+        return np.empty((0, len(model.classes_)), dtype=np.float32)
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(resolve_model(model_path), label_map_path, compiled),
+        ) as pool:
+            parts = list(pool.map(_score_in_worker, batches))
+    else:
+        parts = [predict_proba(model, batch) for batch in batches]
+    return np.concatenate(parts)
+
+
+def score_frame(df, model, label_map, **kwargs):
+    # Adds the predicted congestion level and one probability column per class
+    reverse_map = {v: k for k, v in label_map.items()}
+    proba = predict_batch(model, build_features(df), **kwargs)
+    classes = [reverse_map[c] for c in model.classes_]
+    out = df.copy()
+    out["predicted_level"] = pd.Categorical.from_codes(
+        proba.argmax(axis=1), categories=classes
+    )
+    for i, name in enumerate(classes):
+        out[f"p_{name}"] = proba[:, i].astype(np.float32)
+    return out
+
+
+def read_table(path):
+    if path.endswith(".parquet") or os.path.isdir(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_table(df, path):
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score raw 15-minute records with the trained congestion model"
+    )
+    parser.add_argument("input", help="CSV or Parquet file of 15-minute records")
+    parser.add_argument("output", help="CSV or Parquet file to write")
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="bundle directory or legacy pickle (default: the current bundle)",
+    )
+    parser.add_argument("--label-map", default=LABEL_MAP_PATH)
+    parser.add_argument("--batch-size", type=int, default=262_144)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes to score batches on"
+    )
+    parser.add_argument(
+        "--compiled", action="store_true", help="score with the compiled tree engine"
+    )
+    args = parser.parse_args()
+
+    model, label_map = load_model(args.model, args.label_map, args.compiled)
+    df = read_table(args.input)
+
+    start = time.perf_counter()
+    scored = score_frame(
+        df,
+        model,
+        label_map,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        model_path=args.model,
+        label_map_path=args.label_map,
+        compiled=args.compiled,
+    )
+    elapsed = time.perf_counter() - start
+
+    write_table(scored, args.output)
+    print(
+        f"Scored {len(df)} rows in {elapsed:.2f}s "
+        f"({len(df) / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,451 @@
+import argparse
+import json
+import math
+import os
+import tempfile
+
 import pandas as pd
 
-# Load data
-volume_df = pd.read_csv("data/raw/toronto_volume_2020_2024.csv")
-speed_df = pd.read_csv("data/raw/toronto_speed_2020_2024.csv")
+from feature_store import (
+    STORE_PATH,
+    clear_store,
+    read_features,
+    replace_partitions,
+    write_features,
+)
+from features import RUSH_HOURS, SPEED_COLS
+from instrument import span, traced
+from schema import (
+    SPEED_DTYPES,
+    SPEED_PATH,
+    TIME_FORMAT,
+    VOLUME_PATH,
+    compact,
+    memory_report,
+    read_raw_csv,
+)
+from spatial_index import INDEX_PATH, build_index, update_index
 
-# Show basic info
-print("Volume Data:")
-print(volume_df.head(), "\n")
-print("Speed Data:")
-print(speed_df.head())
+FINAL_PATH = "data/processed/final_processed.csv"
+MANIFEST_PATH = "data/processed/manifest.json"
 
-# Merge using outer join to avoid losing data
-merged_df = pd.merge(
-    volume_df, speed_df, on="count_id", how="outer", suffixes=("_vol", "_spd")
-)
+SPEED_KEYS = [
+    "id",
+    "count_id",
+    "location_name",
+    "longitude",
+    "latitude",
+    "centreline_id",
+    "time_start",
+    "time_end",
+    "direction",
+]
 
-# Drop rows with missing volume data (but allow speed to be missing)
-merged_df = merged_df.dropna(subset=["time_start_vol", "volume_15min"])
+# Volume and speed rows describe the same 15-minute bin of the same count and
+# direction, so that triple is the join key (count_id alone is a cross-product)
+JOIN_KEYS = ["count_id", "direction", "time_bin"]
 
-# Proceed with the rest (datetime, features, labels...)
 
+def add_time_bin(df):
+    df = df.copy()
+    df["time_bin"] = pd.to_datetime(df["time_start"]).dt.floor("15min")
+    return df
 
-# Save the merged file
-merged_df.to_csv("data/processed/merged_clean.csv", index=False)
-print("Merged file saved at data/processed/merged_clean.csv")
-# Convert time_start_vol to datetime
-merged_df["datetime"] = pd.to_datetime(merged_df["time_start_vol"])
 
-# Extract features
-merged_df["hour"] = merged_df["datetime"].dt.hour
-merged_df["day_of_week"] = merged_df["datetime"].dt.day_name()
-merged_df["is_weekend"] = merged_df["day_of_week"].isin(["Saturday", "Sunday"])
-merged_df["is_rush_hour"] = merged_df["hour"].isin([7, 8, 9, 16, 17, 18])
+@traced("merge")
+def join_volume_speed(volume_df, speed_df):
+    volume_df = add_time_bin(volume_df)
+    speed_df = add_time_bin(speed_df)
 
-# Label congestion level from volume
-merged_df["congestion_level"] = pd.cut(
-    merged_df["volume_15min"],
-    bins=[-1, 20, 50, float("inf")],
-    labels=["Low", "Medium", "High"],
-)
+    # Keep one speed row per key so the join can never fan out
+    speed_df = speed_df.drop_duplicates(subset=JOIN_KEYS, keep="last")
+
+    # Hash join on the full key: output has at most one row per volume row
+    merged_df = pd.merge(
+        volume_df,
+        speed_df,
+        on=JOIN_KEYS,
+        how="left",
+        suffixes=("_vol", "_spd"),
+        validate="many_to_one",
+    )
+
+    # Drop rows with missing volume data (but allow speed to be missing)
+    return merged_df.dropna(subset=["time_start_vol", "volume_15min"])
+
+
+@traced("features")
+def add_features(df):
+    # Convert time_start_vol to datetime
+    df["datetime"] = pd.to_datetime(df["time_start_vol"])
+
+    # Extract features
+    df["hour"] = df["datetime"].dt.hour
+    df["day_of_week"] = df["datetime"].dt.day_name()
+    df["is_weekend"] = df["day_of_week"].isin(["Saturday", "Sunday"])
+    df["is_rush_hour"] = df["hour"].isin(RUSH_HOURS)
+
+    # Label congestion level from volume
+    with span("label", rows=len(df)):
+        df["congestion_level"] = pd.cut(
+            df["volume_15min"],
+            bins=[-1, 20, 50, float("inf")],
+            labels=["Low", "Medium", "High"],
+        )
+    return compact(df)
+
+
+def read_speed(path, **kwargs):
+    # The speed extract is optional: without it the speed-bin columns stay empty
+    if path and os.path.exists(path):
+        # Text reads (dtype=str, for content hashes) bypass the schema
+        if "dtype" in kwargs:
+            return pd.read_csv(path, **kwargs)
+        return read_raw_csv(path, SPEED_DTYPES, **kwargs)
+    print(f"Speed data not found at {path}; speed bins will be left empty")
+    empty = pd.DataFrame(columns=SPEED_KEYS + SPEED_COLS)
+    return iter([empty]) if "chunksize" in kwargs else empty
+
+
+def estimate_rows(path, sample_lines=1000):
+    # Row count estimate from the average length of the first lines
+    with open(path, "rb") as f:
+        f.readline()
+        sample = [len(line) for _, line in zip(range(sample_lines), f)]
+    if not sample:
+        return 0
+    return int(os.path.getsize(path) / (sum(sample) / len(sample)))
+
+
+def spill_partitions(chunks, out_dir, prefix, n_partitions):
+    # Hash-partition rows by count_id so each partition can be joined on its own
+    paths = set()
+    for chunk in chunks:
+        for k, part in chunk.groupby(chunk["count_id"] % n_partitions):
+            path = os.path.join(out_dir, f"{prefix}_{k}.csv")
+            part.to_csv(
+                path,
+                mode="a",
+                header=path not in paths,
+                index=False,
+                date_format=TIME_FORMAT,
+            )
+            paths.add(path)
+    return paths
+
+
+def stream_preprocess(
+    volume_path=VOLUME_PATH,
+    speed_path=SPEED_PATH,
+    store_path=STORE_PATH,
+    csv_path=None,
+    chunksize=200_000,
+):
+    # Partitions are sized so that neither side holds more than ~chunksize rows
+    n_partitions = max(1, math.ceil(estimate_rows(volume_path) / chunksize))
+    if speed_path and os.path.exists(speed_path):
+        n_partitions = max(
+            n_partitions, math.ceil(estimate_rows(speed_path) / chunksize)
+        )
+    print(f"Streaming with chunksize={chunksize} over {n_partitions} partitions")
+
+    clear_store(store_path)
+    if csv_path and os.path.exists(csv_path):
+        os.remove(csv_path)
+
+    columns = None
+    label_counts = pd.Series(0, index=["Low", "Medium", "High"])
+    work_dir = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(work_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        spill_partitions(
+            read_raw_csv(volume_path, chunksize=chunksize),
+            tmp_dir,
+            "volume",
+            n_partitions,
+        )
+        spill_partitions(
+            read_speed(speed_path, chunksize=chunksize), tmp_dir, "speed", n_partitions
+        )
+
+        for k in range(n_partitions):
+            volume_part = os.path.join(tmp_dir, f"volume_{k}.csv")
+            if not os.path.exists(volume_part):
+                continue
+            speed_part = os.path.join(tmp_dir, f"speed_{k}.csv")
+            if os.path.exists(speed_part):
+                speed_df = read_raw_csv(speed_part, SPEED_DTYPES)
+            else:
+                speed_df = pd.DataFrame(columns=SPEED_KEYS + SPEED_COLS)
+
+            for chunk in read_raw_csv(volume_part, chunksize=chunksize):
+                out = add_features(join_volume_speed(chunk, speed_df))
+                if columns is None:
+                    memory_report("first chunk, raw", chunk)
+                    memory_report("first chunk, features", out)
+                # Later chunks are written in the column order of the first one
+                if columns is None:
+                    columns = list(out.columns)
+                out = out.reindex(columns=columns)
+                write_features(out, store_path)
+                if csv_path:
+                    out.to_csv(
+                        csv_path,
+                        mode="a",
+                        header=not os.path.exists(csv_path),
+                        index=False,
+                    )
+                label_counts += (
+                    out["congestion_level"]
+                    .value_counts()
+                    .reindex(label_counts.index, fill_value=0)
+                )
+
+    print("Label distribution:\n", label_counts)
+    print(f"Feature store written to {store_path}")
+
+
+# ---------------------- INCREMENTAL MODE ----------------------
+HASH_MASK = (1 << 64) - 1
+
+
+def file_fingerprint(path):
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def count_hashes(chunks):
+    # Order-independent content hash per count_id (sum of row hashes). Rows are
+    # read as text so the hash does not depend on per-chunk dtype inference.
+    totals = {}
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        row_hash = pd.util.hash_pandas_object(chunk, index=False)
+        per_count = row_hash.groupby(chunk["count_id"].astype("int64")).sum()
+        for count_id, value in per_count.items():
+            totals[count_id] = (totals.get(count_id, 0) + int(value)) & HASH_MASK
+    return totals
+
+
+def source_hashes(volume_path, speed_path, chunksize):
+    text = {"dtype": str, "keep_default_na": False, "chunksize": chunksize}
+    volume = count_hashes(pd.read_csv(volume_path, **text))
+    speed = count_hashes(read_speed(speed_path, **text))
+    return {
+        count_id: f"{value:016x}-{speed.get(count_id, 0):016x}"
+        for count_id, value in volume.items()
+    }
+
+
+def count_partitions(df):
+    # year/month partitions holding rows of each count
+    if df.empty:
+        return {}
+    when = pd.to_datetime(df["datetime"])
+    pairs = pd.DataFrame(
+        {"count_id": df["count_id"], "year": when.dt.year, "month": when.dt.month}
+    ).drop_duplicates()
+    partitions = {}
+    for count_id, year, month in pairs.itertuples(index=False):
+        partitions.setdefault(int(count_id), set()).add((int(year), int(month)))
+    return partitions
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def build_manifest(volume_path, speed_path, store_path, chunksize):
+    hashes = source_hashes(volume_path, speed_path, chunksize)
+    stored = read_features(columns=["count_id", "datetime"], root=store_path)
+    partitions = count_partitions(stored)
+    return {
+        "sources": {
+            "volume": file_fingerprint(volume_path),
+            "speed": file_fingerprint(speed_path),
+        },
+        "counts": {
+            str(count_id): {
+                "hash": value,
+                "partitions": sorted(partitions.get(count_id, [])),
+            }
+            for count_id, value in hashes.items()
+        },
+    }
+
+
+def read_counts(chunks, count_ids):
+    # Keeps only the rows of the given counts, one chunk at a time
+    parts = [chunk[chunk["count_id"].isin(count_ids)] for chunk in chunks]
+    parts = [part for part in parts if not part.empty]
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+
+def incremental_preprocess(
+    volume_path=VOLUME_PATH,
+    speed_path=SPEED_PATH,
+    store_path=STORE_PATH,
+    manifest_path=MANIFEST_PATH,
+    chunksize=200_000,
+):
+    # Returns (replaced count ids, rewritten partitions) for the index to
+    # patch: None when the sources are unchanged, (None, None) after a full
+    # rebuild
+    manifest = None
+    if os.path.exists(manifest_path) and os.path.exists(store_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if manifest is None:
+        print("No manifest found; running a full rebuild")
+        stream_preprocess(volume_path, speed_path, store_path, chunksize=chunksize)
+        manifest = build_manifest(volume_path, speed_path, store_path, chunksize)
+        save_manifest(manifest, manifest_path)
+        return None, None
+
+    sources = {
+        "volume": file_fingerprint(volume_path),
+        "speed": file_fingerprint(speed_path),
+    }
+    if manifest["sources"] == sources:
+        print("Source files unchanged since the last run; nothing to do")
+        return None
+
+    # Which counts are new, changed or gone since the last run
+    hashes = source_hashes(volume_path, speed_path, chunksize)
+    known = manifest["counts"]
+    changed = [
+        count_id
+        for count_id, value in hashes.items()
+        if known.get(str(count_id), {}).get("hash") != value
+    ]
+    removed = [int(count_id) for count_id in known if int(count_id) not in hashes]
+
+    # Only the rows of the changed counts are read back and processed
+    new_df = pd.DataFrame()
+    if changed:
+        volume_df = read_counts(
+            read_raw_csv(volume_path, chunksize=chunksize), set(changed)
+        )
+        speed_df = read_counts(
+            read_speed(speed_path, chunksize=chunksize), set(changed)
+        )
+        if speed_df is None:
+            speed_df = pd.DataFrame(columns=SPEED_KEYS + SPEED_COLS)
+        new_df = add_features(join_volume_speed(volume_df, speed_df))
+    new_partitions = count_partitions(new_df)
+
+    # Partitions that held the old rows or will hold the new ones
+    partitions = set()
+    for count_id in changed + removed:
+        old = known.get(str(count_id), {}).get("partitions", [])
+        partitions.update(tuple(p) for p in old)
+    for count_partition in new_partitions.values():
+        partitions.update(count_partition)
+    replace_partitions(new_df, changed + removed, sorted(partitions), store_path)
+
+    for count_id in removed:
+        del known[str(count_id)]
+    for count_id in changed:
+        known[str(count_id)] = {
+            "hash": hashes[count_id],
+            "partitions": sorted(new_partitions.get(count_id, [])),
+        }
+    manifest["sources"] = sources
+    save_manifest(manifest, manifest_path)
+    print(
+        f"{len(changed)} new or changed counts, {len(removed)} removed; "
+        f"rewrote {len(partitions)} partitions"
+    )
+    return changed + removed, sorted(partitions)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge and feature-engineer the raw counts"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="process the raw CSVs chunk by chunk with bounded memory",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only process counts added or changed since the last run",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=200_000,
+        help="rows per chunk in --stream and --incremental mode",
+    )
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help=f"also write the legacy {FINAL_PATH}",
+    )
+    args = parser.parse_args()
+
+    if args.incremental:
+        delta = incremental_preprocess(chunksize=args.chunksize)
+        if delta is None:
+            return
+        count_ids, partitions = delta
+        if count_ids is None:
+            build_index()
+        elif count_ids:
+            update_index(count_ids, partitions)
+            print(f"Index patched for {len(count_ids)} counts")
+        return
+
+    if args.stream:
+        stream_preprocess(
+            csv_path=FINAL_PATH if args.csv else None, chunksize=args.chunksize
+        )
+        save_manifest(
+            build_manifest(VOLUME_PATH, SPEED_PATH, STORE_PATH, args.chunksize)
+        )
+        build_index()
+        return
+
+    # Load data
+    volume_df = read_raw_csv(VOLUME_PATH)
+    speed_df = read_speed(SPEED_PATH)
+    memory_report("raw volume", volume_df)
+    memory_report("raw speed", speed_df)
+
+    # Show basic info
+    print("Volume Data:")
+    print(volume_df.head(), "\n")
+    print("Speed Data:")
+    print(speed_df.head())
+
+    # Align each volume bin with the speed bin of the same count and direction
+    merged_df = join_volume_speed(volume_df, speed_df)
+    memory_report("joined", merged_df)
+
+    merged_df = add_features(merged_df)
+    memory_report("features", merged_df)
+    print("Label distribution:\n", merged_df["congestion_level"].value_counts())
+
+    # Save final processed data as a typed, year/month partitioned store
+    clear_store(STORE_PATH)
+    write_features(merged_df, STORE_PATH)
+    save_manifest(build_manifest(VOLUME_PATH, SPEED_PATH, STORE_PATH, args.chunksize))
+    print(f"Feature store written to {STORE_PATH}")
+    build_index()
+    print(f"Spatial/time index written to {INDEX_PATH}")
 
-print("Label distribution:\n", merged_df["congestion_level"].value_counts())
+    if args.csv:
+        merged_df.to_csv(FINAL_PATH, index=False)
+        print(f"Final cleaned dataset saved to {FINAL_PATH}")
 
 
-# Save final processed data
-merged_df.to_csv("data/processed/final_processed.csv", index=False)
-print("Final cleaned dataset saved to data/processed/final_processed.csv")
+if __name__ == "__main__":
+    main()
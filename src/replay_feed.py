@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+
+from schema import VOLUME_PATH
+from stream_ingest import FEED_DIR, LIVE_PATH, SOCKET_PATH
+
+INTERVAL_S = 15 * 60
+
+# Plays the historical counts back in time_start order at `speed` times real
+# time: the records of one 15-minute interval go out together, every record
+# stamped with the wall-clock time it was sent so the ingestor can measure
+# end-to-end latency. Stretches without any count (the data covers separate
+# counting periods) are cut to one interval.
+
+
+def replay_schedule(path=VOLUME_PATH, limit=None):
+    df = pd.read_csv(path, nrows=limit)
+    df = df.sort_values("time_start", kind="stable").reset_index(drop=True)
+    start = pd.to_datetime(df["time_start"])
+    gaps = start.diff().dt.total_seconds().fillna(0).clip(upper=INTERVAL_S)
+    return df, gaps.cumsum().to_numpy()
+
+
+async def replay(df, offsets, speed, send):
+    # send(frame) delivers the records of one interval; speed 0 sends as fast
+    # as the sink accepts them
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    behind = 0.0
+    bounds = (offsets[1:] != offsets[:-1]).nonzero()[0] + 1
+    for lo, hi in zip([0, *bounds], [*bounds, len(df)]):
+        if speed > 0:
+            due = began + offsets[lo] / speed
+            wait = due - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            else:
+                behind = max(behind, -wait)
+        await send(df.iloc[lo:hi].assign(sent_at=time.time()))
+    return loop.time() - began, behind
+
+
+async def to_socket(df, offsets, speed, path):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(",".join([*df.columns, "sent_at"]).encode() + b"\n")
+
+    async def send(frame):
+        writer.write(frame.to_csv(header=False, index=False).encode())
+        await writer.drain()
+
+    try:
+        return await replay(df, offsets, speed, send)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def to_directory(df, offsets, speed, directory):
+    os.makedirs(directory, exist_ok=True)
+    sequence = 0
+
+    async def send(frame):
+        # Written under a temporary name and renamed, so the tailer never
+        # sees half a file
+        nonlocal sequence
+        path = os.path.join(directory, f"feed-{os.getpid()}-{sequence:08d}.csv")
+        frame.to_csv(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        sequence += 1
+
+    return await replay(df, offsets, speed, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay the volume counts into the stream ingestor"
+    )
+    parser.add_argument("--source", default=VOLUME_PATH)
+    parser.add_argument(
+        "--speed", type=float, default=60, help="times real time (0 = unthrottled)"
+    )
+    parser.add_argument("--socket", default=None, help=f"e.g. {SOCKET_PATH}")
+    parser.add_argument("--directory", default=None, help=f"e.g. {FEED_DIR}")
+    parser.add_argument("--limit", type=int, default=None, help="first N records")
+    parser.add_argument("--live-path", default=LIVE_PATH)
+    args = parser.parse_args()
+
+    df, offsets = replay_schedule(args.source, args.limit)
+    if args.socket:
+        run = to_socket(df, offsets, args.speed, args.socket)
+    else:
+        run = to_directory(df, offsets, args.speed, args.directory or FEED_DIR)
+    elapsed, behind = asyncio.run(run)
+    print(
+        f"Sent {len(df)} records ({offsets[-1] / 3600:.1f} h of feed) in "
+        f"{elapsed:.1f} s: {len(df) / elapsed:,.0f} records/s, "
+        f"at most {behind:.2f} s behind schedule"
+    )
+
+    # The ingestor publishes its own view of throughput and latency
+    time.sleep(2)
+    if os.path.exists(args.live_path):
+        with open(args.live_path) as f:
+            metrics = json.load(f)["metrics"]
+        print(
+            f"Ingestor: {metrics['records']} records in {metrics['batches']} "
+            f"batches, end-to-end latency p50 {metrics['latency_ms']['p50']:.1f} ms, "
+            f"p99 {metrics['latency_ms']['p99']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import pandas as pd
+
+from features import SPEED_COLS
+from instrument import traced
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+LEVELS = ["Low", "Medium", "High"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Raw extracts, kept here so readers of the counts need not import the
+# preprocessing and store stack
+VOLUME_PATH = "data/raw/toronto_volume_2020_2024.csv"
+SPEED_PATH = "data/raw/toronto_speed_2020_2024.csv"
+
+# Column types of the raw volume and speed extracts. Location names and
+# directions repeat on every row of a count, so they are categoricals; counts
+# fit in uint16 and coordinates in float32. Timestamps are parsed with
+# TIME_FORMAT instead of letting pandas guess the format per chunk.
+VOLUME_DTYPES = {
+    "id": "int32",
+    "count_id": "int32",
+    "location_name": "category",
+    "longitude": "float32",
+    "latitude": "float32",
+    "centreline_id": "int32",
+    "direction": "category",
+    "volume_15min": "uint16",
+}
+SPEED_DTYPES = {
+    **{c: t for c, t in VOLUME_DTYPES.items() if c != "volume_15min"},
+    **{col: "uint16" for col in SPEED_COLS},
+}
+RAW_TIME_COLS = ["time_start", "time_end"]
+TIME_DTYPE = "datetime64[us]"
+
+# Column types of the processed table. Speed bins are nullable because counts
+# without a matching speed bin are kept.
+STORE_DTYPES = {
+    "count_id": "int64",
+    "location_name_vol": "category",
+    "longitude_vol": "float32",
+    "latitude_vol": "float32",
+    "centreline_id_vol": "int64",
+    "direction": "category",
+    "volume_15min": "uint16",
+    "hour": "int8",
+    "day_of_week": pd.CategoricalDtype(DAYS, ordered=True),
+    "is_weekend": "bool",
+    "is_rush_hour": "bool",
+    "congestion_level": pd.CategoricalDtype(LEVELS, ordered=True),
+    **{col: "UInt16" for col in SPEED_COLS},
+}
+TIME_COLS = ["time_start_vol", "time_end_vol", "time_bin", "datetime"]
+
+
+@traced("load:csv")
+def read_raw_csv(path, dtypes=VOLUME_DTYPES, **kwargs):
+    # pd.read_csv with the raw schema. Whole files go through the pyarrow
+    # parser; chunked or partial reads (chunksize, nrows) need the C parser.
+    # Timestamps come back in one unit whichever parser read them.
+    usecols = kwargs.get("usecols")
+    dates = {c: TIME_DTYPE for c in RAW_TIME_COLS if usecols is None or c in usecols}
+    engine = "c" if {"chunksize", "nrows", "skiprows"} & set(kwargs) else "pyarrow"
+    reader = pd.read_csv(
+        path,
+        engine=engine,
+        dtype=dtypes,
+        parse_dates=list(dates),
+        date_format=TIME_FORMAT,
+        **kwargs,
+    )
+    if "chunksize" in kwargs:
+        return (chunk.astype(dates) for chunk in reader)
+    return reader.astype(dates)
+
+
+def compact(df, dtypes=STORE_DTYPES):
+    # Casts the columns present in df; the rest are left alone
+    return df.astype({c: t for c, t in dtypes.items() if c in df.columns})
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def memory_report(stage, df, top=3):
+    # One line per pipeline stage: size, bytes per row and the largest columns
+    usage = df.memory_usage(deep=True, index=False).sort_values(ascending=False)
+    total = usage.sum()
+    largest = ", ".join(
+        f"{col} {size / 1e6:.1f}" for col, size in usage.head(top).items()
+    )
+    print(
+        f"[memory] {stage}: {len(df):,} rows x {df.shape[1]} cols, "
+        f"{total / 1e6:.1f} MB ({total / max(len(df), 1):.0f} B/row; "
+        f"largest MB: {largest})"
+    )
+    return total / 1e6
@@ -0,0 +1,230 @@
+import argparse
+import base64
+import json
+
+import numpy as np
+
+from instrument import traced
+from signal_network import (
+    APPROACHES,
+    AXES,
+    corridor_links,
+    load_intersections,
+    optimize_network,
+)
+
+METERS_PER_DEG_LAT = 111_320
+# Unit vector (east, north) from the intersection towards where each approach
+# comes from: northbound traffic arrives from the south, and so on
+APPROACH_SIDE = np.array([[0, -1], [-1, 0], [0, 1], [1, 0]], dtype=np.float64)
+DECKGL_URL = "https://unpkg.com/deck.gl@9.1.14/dist.min.js"
+MAPLIBRE_URL = "https://unpkg.com/maplibre-gl@4.7.1/dist/maplibre-gl"
+MAP_STYLE = "https://basemaps.cartocdn.com/gl/positron-gl-style/style.json"
+
+# The whole plan is one repeating cycle, so the animation needs no frames from
+# the server: every approach gets a marker with the start of its green within
+# the cycle and the green duration, shipped to the browser as flat float32
+# arrays. The page works out the colour of each marker from the clock on every
+# animation frame, (t - start) mod cycle < green.
+
+
+def phase_orders(plan, links=None):
+    # Phase order per intersection: on a corridor the forward approach, then
+    # the backward one (as in SignalNetwork), then the rest in APPROACHES
+    # order; intersections off any corridor keep APPROACHES order
+    orders = np.tile(np.arange(len(APPROACHES)), (len(plan), 1))
+    if links is None or not len(links):
+        return orders
+    for end in ("from", "to"):
+        for axis, (fwd, back) in AXES.items():
+            rows = links.loc[links["axis"] == axis, end].to_numpy(dtype=np.int64)
+            rest = [i for i in range(len(APPROACHES)) if i not in (fwd, back)]
+            orders[rows] = [fwd, back, *rest]
+    return orders
+
+
+def signal_schedule(plan, links=None, approach_m=25.0):
+    # One marker per approach with a green: position, start of the green
+    # (seconds into the cycle, offset included) and its duration
+    plan = plan.reset_index(drop=True)
+    greens = plan[[f"green_{a}" for a in APPROACHES]].to_numpy(dtype=np.float64)
+    greens = np.nan_to_num(greens)
+    cycle = plan["cycle"].to_numpy(dtype=np.float64)
+    offset = plan["offset"].to_numpy(dtype=np.float64)
+
+    orders = phase_orders(plan, links)
+    ordered = np.take_along_axis(greens, orders, axis=1)
+    starts = np.empty_like(greens)
+    np.put_along_axis(starts, orders, ordered.cumsum(axis=1) - ordered, axis=1)
+    starts = (starts + offset[:, None]) % cycle[:, None]
+
+    site, approach = np.nonzero(greens > 0)
+    lat = plan["latitude"].to_numpy(dtype=np.float64)[site]
+    lon = plan["longitude"].to_numpy(dtype=np.float64)[site]
+    side = APPROACH_SIDE[approach] * approach_m / METERS_PER_DEG_LAT
+    return {
+        "site": site.astype(np.uint32),
+        "approach": approach.astype(np.uint8),
+        "position": np.column_stack(
+            [lon + side[:, 0] / np.cos(np.radians(lat)), lat + side[:, 1]]
+        ).astype(np.float32),
+        "start": starts[site, approach].astype(np.float32),
+        "green": greens[site, approach].astype(np.float32),
+        "cycle": cycle[site].astype(np.float32),
+        "names": plan["location_name"].astype(str).tolist(),
+    }
+
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+@traced("render:animation", rows=None)
+def render_animation_html(schedule, speed=1.0, amber_s=3.0, height=600):
+    # Standalone page: deck.gl over a MapLibre base map, animated entirely in
+    # the browser with requestAnimationFrame
+    position = schedule["position"]
+    center = position.mean(axis=0) if len(position) else np.array([-79.38, 43.65])
+    payload = {
+        "count": int(len(position)),
+        "center": [float(center[0]), float(center[1])],
+        "approaches": APPROACHES,
+        "names": schedule["names"],
+        "speed": float(speed),
+        "amber": float(amber_s),
+        "site": _b64(schedule["site"]),
+        "approach": _b64(schedule["approach"]),
+        "position": _b64(position),
+        "start": _b64(schedule["start"]),
+        "green": _b64(schedule["green"]),
+        "cycle": _b64(schedule["cycle"]),
+    }
+    return (
+        ANIMATION_TEMPLATE.replace("__DECKGL_URL__", DECKGL_URL)
+        .replace("__MAPLIBRE_URL__", MAPLIBRE_URL)
+        .replace("__MAP_STYLE__", MAP_STYLE)
+        .replace("__HEIGHT__", str(int(height)))
+        .replace("__PAYLOAD__", json.dumps(payload))
+    )
+
+
+ANIMATION_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<script src="__DECKGL_URL__"></script>
+<script src="__MAPLIBRE_URL__.js"></script>
+<link rel="stylesheet" href="__MAPLIBRE_URL__.css" />
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #map { position: relative; width: 100%; height: __HEIGHT__px; }
+  #panel { position: absolute; top: 8px; left: 8px; z-index: 1; padding: 6px 10px;
+           background: rgba(255, 255, 255, 0.9); border-radius: 4px; font-size: 13px; }
+</style>
+</head>
+<body>
+<div id="map">
+  <div id="panel">
+    <span id="clock"></span><br />
+    Speed <input id="speed" type="range" min="0" max="20" step="0.5" />
+    <span id="speed-label"></span>
+  </div>
+</div>
+<script>
+const data = __PAYLOAD__;
+function decode(text, Type) {
+  const bytes = Uint8Array.from(atob(text), (c) => c.charCodeAt(0));
+  return new Type(bytes.buffer);
+}
+const site = decode(data.site, Uint32Array);
+const approach = decode(data.approach, Uint8Array);
+const position = decode(data.position, Float32Array);
+const start = decode(data.start, Float32Array);
+const green = decode(data.green, Float32Array);
+const cycle = decode(data.cycle, Float32Array);
+
+const RED = [215, 25, 28, 230];
+const AMBER = [253, 174, 97, 230];
+const GREEN = [26, 150, 65, 230];
+const speedInput = document.getElementById("speed");
+const speedLabel = document.getElementById("speed-label");
+const clock = document.getElementById("clock");
+speedInput.value = data.speed;
+
+// Simulated seconds advance at the chosen speed; changing the speed keeps
+// the current position in the cycle
+let simTime = 0;
+let last = performance.now();
+
+const map = new maplibregl.Map({
+  container: "map",
+  style: "__MAP_STYLE__",
+  center: data.center,
+  zoom: 13,
+});
+const overlay = new deck.MapboxOverlay({
+  getTooltip: ({ index }) =>
+    index >= 0 && data.names[site[index]] + " " + data.approaches[approach[index]],
+});
+map.addControl(overlay);
+
+function phaseColor(i) {
+  const c = cycle[i];
+  const t = (((simTime - start[i]) % c) + c) % c;
+  if (t >= green[i]) return RED;
+  return t >= green[i] - data.amber ? AMBER : GREEN;
+}
+
+function frame(now) {
+  simTime += ((now - last) / 1000) * Number(speedInput.value);
+  last = now;
+  overlay.setProps({
+    layers: [
+      new deck.ScatterplotLayer({
+        id: "signals",
+        data: { length: data.count },
+        getPosition: (_, { index }) => [position[2 * index], position[2 * index + 1]],
+        getFillColor: (_, { index }) => phaseColor(index),
+        updateTriggers: { getFillColor: simTime },
+        getRadius: 8,
+        radiusUnits: "meters",
+        radiusMinPixels: 2,
+        pickable: true,
+      }),
+    ],
+  });
+  const c = data.count ? cycle[0] : 0;
+  clock.textContent = `t = ${c ? (simTime % c).toFixed(0) : 0} s of a ${c.toFixed(0)} s cycle`;
+  speedLabel.textContent = `${speedInput.value}x`;
+  requestAnimationFrame(frame);
+}
+requestAnimationFrame(frame);
+</script>
+</body>
+</html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the animated signal plan of the counted corridors to HTML"
+    )
+    parser.add_argument("--hour", type=int, default=8, help="hour of day to plan")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed")
+    parser.add_argument("--output", default="app/signal_animation.html")
+    args = parser.parse_args()
+
+    intersections = load_intersections(hour=args.hour)
+    links = corridor_links(intersections)
+    plan, summary = optimize_network(intersections, links)
+    schedule = signal_schedule(plan, links)
+    with open(args.output, "w") as f:
+        f.write(render_animation_html(schedule, speed=args.speed))
+    print(
+        f" {len(schedule['start'])} approaches at {summary['intersections']} "
+        f"intersections ({summary['cycle']:.0f} s cycle) saved to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,602 @@
+import argparse
+import re
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from instrument import traced
+from schema import VOLUME_PATH, read_raw_csv
+
+APPROACHES = ["NB", "EB", "SB", "WB"]
+# Forward / backward approach of a corridor, as indices into APPROACHES
+AXES = {"NS": (0, 2), "EW": (1, 3)}
+EARTH_RADIUS_M = 6_371_000
+
+# Signal plan for a network of intersections that share one cycle length.
+#
+# Each intersection keeps the per-intersection formulation of
+# optimize_signals.green_times (greens sum to the cycle, every approach gets
+# at least its minimum green, the total deviation from volume-proportional
+# greens is minimised), now with pedestrian minimums. Intersections on the
+# same corridor are also linked by offsets: the phase order at every
+# intersection starts with the corridor's forward approach followed by the
+# backward one, and for every pair of neighbours
+#
+#     o_j - o_i                   = travel_s + n_f * cycle   (forward wave)
+#     (o_i + g_i,f) - (o_j + g_j,f) = travel_s + n_b * cycle   (backward wave)
+#
+# hold up to a penalised error. The integers n are fixed by rounding the
+# previous solution, so each solve is an LP. Everything that changes between
+# solves (targets, cycle, n) lives in the right-hand sides, which keeps the
+# constraint matrix fixed and lets HiGHS restart from its previous basis.
+
+
+def corridor_name(location_name):
+    # "Dewson St: Concord Ave - Delaware Ave" -> "Dewson St"
+    return re.split(r":| / | to ", location_name)[0].strip()
+
+
+def load_intersections(path=VOLUME_PATH, hour=8):
+    # One row per centreline_id with the mean 15-minute volume per approach
+    # at the given hour (NaN where the approach is not counted)
+    df = read_raw_csv(
+        path,
+        usecols=[
+            "location_name",
+            "longitude",
+            "latitude",
+            "centreline_id",
+            "time_start",
+            "direction",
+            "volume_15min",
+        ],
+    )
+    df = df[df["time_start"].dt.hour == hour]
+    volumes = df.pivot_table(
+        index="centreline_id",
+        columns="direction",
+        values="volume_15min",
+        aggfunc="mean",
+    ).reindex(columns=APPROACHES)
+    sites = df.groupby("centreline_id").agg(
+        location_name=("location_name", "first"),
+        latitude=("latitude", "mean"),
+        longitude=("longitude", "mean"),
+    )
+    sites["corridor"] = sites["location_name"].map(corridor_name)
+    return sites.join(volumes).reset_index()
+
+
+def _distance_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def corridor_links(intersections, speed_kmh=40):
+    # Links neighbouring intersections of each corridor, ordered west to east
+    # (or south to north), with the travel time at the progression speed
+    links = []
+    for _, group in intersections.groupby("corridor", sort=False):
+        if len(group) < 2:
+            continue
+        counted = group[APPROACHES].notna().sum()
+        axis = "EW" if counted["EB"] + counted["WB"] >= counted["NB"] else "NS"
+        if axis == "NS" and counted["NB"] + counted["SB"] == 0:
+            axis = "EW"
+        group = group.sort_values("longitude" if axis == "EW" else "latitude")
+        lat, lon = group["latitude"].to_numpy(), group["longitude"].to_numpy()
+        distance = _distance_m(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        links.append(
+            pd.DataFrame(
+                {
+                    "from": group.index[:-1],
+                    "to": group.index[1:],
+                    "axis": axis,
+                    "travel_s": distance / (speed_kmh / 3.6),
+                }
+            )
+        )
+    if not links:
+        return pd.DataFrame(columns=["from", "to", "axis", "travel_s"])
+    return pd.concat(links, ignore_index=True)
+
+
+def pedestrian_minimums(crossing_m=12.0, walk_s=7.0, walk_speed=1.2):
+    # Walk interval plus the clearance time to cross the road
+    return walk_s + np.asarray(crossing_m, dtype=np.float64) / walk_speed
+
+
+def _shares(volumes):
+    present = ~np.isnan(volumes)
+    filled = np.where(present, volumes, 0.0)
+    totals = filled.sum(axis=1, keepdims=True)
+    even = present / np.maximum(present.sum(axis=1, keepdims=True), 1)
+    return np.divide(filled, totals, out=even.copy(), where=totals > 0), present
+
+
+def minimum_greens(present, min_green=10, ped_crossing_m=12.0):
+    # Per approach: the larger of the minimum green and the pedestrian minimum
+    floor = np.maximum(min_green, pedestrian_minimums(ped_crossing_m))
+    return np.where(present, np.broadcast_to(floor, present.shape), 0.0)
+
+
+def critical_cycle(volumes, lower, cycle_range=(60, 120)):
+    # Shortest cycle (whole seconds, within the range) at which the
+    # proportional greens of the critical intersection meet every minimum
+    shares, present = _shares(volumes)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        needed = np.where(present, lower / shares, 0.0).max(axis=1)
+    needed = np.maximum(needed, lower.sum(axis=1))
+    if lower.sum(axis=1).max() > cycle_range[1]:
+        raise ValueError(
+            f"minimum greens at {(lower.sum(axis=1) > cycle_range[1]).sum()} "
+            f"intersections do not fit in a {cycle_range[1]} s cycle"
+        )
+    return float(np.clip(np.ceil(needed.max()), *cycle_range))
+
+
+class SignalNetwork:
+    def __init__(
+        self,
+        volumes,
+        links=None,
+        cycle=(60, 120),
+        min_green=10,
+        ped_crossing_m=12.0,
+        offset_weight=1.0,
+    ):
+        import highspy
+
+        volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+        n = len(volumes)
+        k = len(APPROACHES)
+        self.present = ~np.isnan(volumes)
+        self.lower = minimum_greens(self.present, min_green, ped_crossing_m)
+        self.cycle_range = cycle if np.ndim(cycle) else (cycle, cycle)
+
+        links = links if links is not None else pd.DataFrame(columns=["from", "to"])
+        self.src = links["from"].to_numpy(dtype=np.int64)
+        self.dst = links["to"].to_numpy(dtype=np.int64)
+        self.travel = links["travel_s"].to_numpy(dtype=np.float64) if len(links) else 0
+        fwd_back = np.array([AXES[a] for a in links.get("axis", [])], dtype=np.int64)
+        self.fwd = fwd_back[:, 0] if len(links) else np.empty(0, np.int64)
+        back = fwd_back[:, 1] if len(links) else np.empty(0, np.int64)
+        n_links = len(self.src)
+
+        # Column layout: greens, deviations, offsets, forward and backward
+        # wave errors
+        green = np.arange(n * k).reshape(n, k)
+        dev = n * k + green
+        offset = 2 * n * k + np.arange(n)
+        err_f = 2 * n * k + n + np.arange(n_links)
+        err_b = err_f + n_links
+        self.offset_cols = offset
+        n_cols = 2 * n * k + n + 2 * n_links
+
+        # Rows: cycle sums, |g - target| <= d (two rows each), forward and
+        # backward waves (two rows each)
+        rows, cols, vals = [], [], []
+
+        def add(row, col, val):
+            rows.append(np.ravel(row))
+            cols.append(np.ravel(col))
+            vals.append(np.broadcast_to(val, np.shape(np.ravel(row))))
+
+        gi, gk = np.nonzero(self.present)
+        add(gi, green[gi, gk], 1.0)
+        self.sum_rows = np.arange(n)
+        self.dev_upper = n + np.arange(n * k)
+        self.dev_lower = self.dev_upper + n * k
+        for dev_rows, sign in ((self.dev_upper, -1.0), (self.dev_lower, 1.0)):
+            add(dev_rows, green, 1.0)
+            add(dev_rows, dev, sign)
+
+        self.wave_rows = n + 2 * n * k + np.arange(4 * n_links).reshape(4, -1)
+        for block, sign in ((0, -1.0), (1, 1.0)):
+            r = self.wave_rows[block]
+            add(r, offset[self.dst], 1.0)
+            add(r, offset[self.src], -1.0)
+            add(r, err_f, sign)
+        for block, sign in ((2, -1.0), (3, 1.0)):
+            r = self.wave_rows[block]
+            add(r, offset[self.src], 1.0)
+            add(r, green[self.src, self.fwd], 1.0)
+            add(r, offset[self.dst], -1.0)
+            add(r, green[self.dst, self.fwd], -1.0)
+            add(r, err_b, sign)
+        n_rows = n + 2 * n * k + 4 * n_links
+        matrix = sp.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_rows, n_cols),
+        )
+
+        # Waves only count where the approach is counted at both ends
+        self.has_f = self.present[self.src, self.fwd] & self.present[self.dst, self.fwd]
+        self.has_b = self.present[self.src, back] & self.present[self.dst, back]
+        cost = np.concatenate(
+            [
+                np.zeros(n * k),
+                self.present.ravel().astype(np.float64),
+                np.zeros(n),
+                offset_weight * self.has_f,
+                offset_weight * self.has_b,
+            ]
+        )
+        col_upper = np.full(n_cols, np.inf)
+        col_upper[green[~self.present]] = 0
+        col_upper[dev[~self.present]] = 0
+        col_lower = np.zeros(n_cols)
+        col_lower[: n * k] = self.lower.ravel()
+        # Each corridor's first intersection anchors its offsets at zero
+        anchored = np.setdiff1d(np.arange(n), self.dst)
+        col_upper[offset[anchored]] = 0
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = n_cols
+        lp.num_row_ = n_rows
+        lp.col_cost_ = cost
+        lp.col_lower_ = col_lower
+        lp.col_upper_ = col_upper
+        lp.row_lower_ = np.zeros(n_rows)
+        lp.row_upper_ = np.zeros(n_rows)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        lp.a_matrix_.num_col_ = n_cols
+        lp.a_matrix_.num_row_ = n_rows
+        lp.a_matrix_.start_ = matrix.indptr
+        lp.a_matrix_.index_ = matrix.indices
+        lp.a_matrix_.value_ = matrix.data
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue("output_flag", False)
+        self.highs.passModel(lp)
+        self.free_offsets = np.setdiff1d(offset, offset[anchored])
+        self.inf = highspy.kHighsInf
+        self.n = n
+        self.n_links = n_links
+        self.green = green
+        self.n_f = np.zeros(n_links)
+        self.n_b = np.zeros(n_links)
+        self.warm = False
+        self.update(volumes)
+
+    def _set_rows(self, rows, lower, upper):
+        rows = np.ravel(rows).astype(np.int32)
+        if len(rows):
+            self.highs.changeRowsBounds(
+                len(rows),
+                rows,
+                np.broadcast_to(lower, rows.shape).astype(np.float64),
+                np.broadcast_to(upper, rows.shape).astype(np.float64),
+            )
+
+    def update(self, volumes=None, cycle=None):
+        # New volumes or cycle only move right-hand sides and offset bounds;
+        # the next solve restarts from the current basis
+        if volumes is not None:
+            self.volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+            if cycle is None and self.cycle_range[0] != self.cycle_range[1]:
+                cycle = critical_cycle(self.volumes, self.lower, self.cycle_range)
+        if cycle is None:
+            cycle = self.cycle_range[0]
+        self.cycle = float(cycle)
+        shares, _ = _shares(self.volumes)
+        self.targets = shares * self.cycle
+        target = self.targets.ravel()
+        self._set_rows(self.sum_rows, self.cycle, self.cycle)
+        self._set_rows(self.dev_upper, -self.inf, target)
+        self._set_rows(self.dev_lower, target, self.inf)
+        if len(self.free_offsets):
+            cols = self.free_offsets.astype(np.int32)
+            self.highs.changeColsBounds(
+                len(cols), cols, np.zeros(len(cols)), np.full(len(cols), self.cycle)
+            )
+        self._set_waves()
+
+    def _set_waves(self):
+        if not self.n_links:
+            return
+        forward = self.travel + self.n_f * self.cycle
+        backward = self.travel + self.n_b * self.cycle
+        self._set_rows(self.wave_rows[0], -self.inf, forward)
+        self._set_rows(self.wave_rows[1], forward, self.inf)
+        self._set_rows(self.wave_rows[2], -self.inf, backward)
+        self._set_rows(self.wave_rows[3], backward, self.inf)
+
+    def _round_waves(self, offsets, greens):
+        # Nearest whole number of cycles separating each pair of green starts
+        g_src = greens[self.src, self.fwd]
+        g_dst = greens[self.dst, self.fwd]
+        n_f = np.round(
+            (offsets[self.dst] - offsets[self.src] - self.travel) / self.cycle
+        )
+        n_b = np.round(
+            (offsets[self.src] + g_src - offsets[self.dst] - g_dst - self.travel)
+            / self.cycle
+        )
+        return n_f, n_b
+
+    @traced("solve:network", rows=lambda result: len(result["greens"]))
+    def solve(self, max_rounds=5):
+        start = time.perf_counter()
+        iterations = 0
+        if self.n_links and not self.warm:
+            # First guess: a forward green wave over volume-proportional greens
+            position = np.zeros(self.n)
+            for src, dst, travel in zip(self.src, self.dst, self.travel):
+                position[dst] = position[src] + travel
+            guess = np.maximum(self.targets, self.lower)
+            self.n_f, self.n_b = self._round_waves(position % self.cycle, guess)
+            self._set_waves()
+
+        for rounds in range(1, max_rounds + 1):
+            self.highs.run()
+            iterations += self.highs.getInfo().simplex_iteration_count
+            status = self.highs.modelStatusToString(self.highs.getModelStatus())
+            if status != "Optimal":
+                raise ValueError(f"signal network LP is not optimal: {status}")
+            x = np.asarray(self.highs.getSolution().col_value)
+            greens = x[self.green]
+            offsets = x[self.offset_cols]
+            if not self.n_links:
+                break
+            n_f, n_b = self._round_waves(offsets, greens)
+            if np.array_equal(n_f, self.n_f) and np.array_equal(n_b, self.n_b):
+                break
+            self.n_f, self.n_b = n_f, n_b
+            self._set_waves()
+        self.warm = True
+
+        k = len(APPROACHES)
+        n_links = self.n_links
+        errors = x[2 * self.n * k + self.n :]
+        return {
+            "cycle": self.cycle,
+            "greens": greens,
+            "offsets": offsets % self.cycle,
+            "deviation": np.abs(greens - self.targets).sum(axis=1),
+            "forward_error": np.where(self.has_f, errors[:n_links], np.nan),
+            "backward_error": np.where(self.has_b, errors[n_links:], np.nan),
+            "objective": self.highs.getInfo().objective_function_value,
+            "rounds": rounds,
+            "iterations": iterations,
+            "solve_s": time.perf_counter() - start,
+        }
+
+
+class SignalReoptimizer:
+    # Keeps one SignalNetwork alive between calls. A call with new volumes
+    # moves only its right-hand sides and re-solves from the previous basis;
+    # volumes are rounded to `quantum` vehicles and the plans for recently
+    # seen rounded vectors are served from an LRU cache. The network is
+    # rebuilt when the intersections, their counted approaches or the links
+    # change, since those shape the LP itself.
+
+    def __init__(
+        self,
+        links=None,
+        cycle=120,
+        min_green=10,
+        ped_crossing_m=0.0,
+        quantum=1.0,
+        cache_size=1024,
+    ):
+        self.links = links
+        self.cycle = cycle
+        self.options = {"min_green": min_green, "ped_crossing_m": ped_crossing_m}
+        self.quantum = quantum
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.network = None
+        self.network_key = None
+        self.calls = 0
+        self.hits = 0
+        self.rebuilds = 0
+        self.solve_ms = deque(maxlen=1000)
+        self.call_ms = deque(maxlen=1000)
+
+    @staticmethod
+    def _shape_key(volumes, links):
+        # Everything the LP's columns and matrix depend on
+        key = (volumes.shape, np.isnan(volumes).tobytes())
+        if links is None or not len(links):
+            return key
+        columns = [c for c in ("from", "to", "travel_s", "axis") if c in links]
+        return key + tuple(links[c].to_numpy().tobytes() for c in columns)
+
+    def solve(self, volumes, cycle=None, links=None):
+        start = time.perf_counter()
+        cycle = self.cycle if cycle is None else cycle
+        links = self.links if links is None else links
+        volumes = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+        rounded = np.round(volumes / self.quantum) * self.quantum
+        shape_key = self._shape_key(rounded, links)
+        key = (cycle, shape_key, rounded.tobytes())
+        self.calls += 1
+
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        else:
+            if self.network is None or self.network_key != shape_key:
+                self.network = SignalNetwork(rounded, links, cycle, **self.options)
+                self.network_key = shape_key
+                self.rebuilds += 1
+            else:
+                self.network.update(rounded, cycle)
+            result = self.network.solve()
+            self.solve_ms.append(result["solve_s"] * 1000)
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.call_ms.append((time.perf_counter() - start) * 1000)
+        # Callers get their own arrays, so changing a plan cannot alter the cache
+        return {
+            k: v.copy() if isinstance(v, np.ndarray) else v for k, v in result.items()
+        }
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "hit_rate": self.hits / max(self.calls, 1),
+            "rebuilds": self.rebuilds,
+            "cached_plans": len(self.cache),
+            "median_solve_ms": (
+                float(np.median(self.solve_ms)) if self.solve_ms else None
+            ),
+            "median_call_ms": float(np.median(self.call_ms)) if self.call_ms else None,
+        }
+
+
+def _solve_part(args):
+    volumes, links, cycle, options = args
+    return SignalNetwork(volumes, links, cycle, **options).solve()
+
+
+def _partition(intersections, links, parts):
+    # Whole corridors per part, largest first onto the emptiest part
+    sizes = intersections.groupby("corridor", sort=False).size()
+    load = np.zeros(parts)
+    assignment = {}
+    for corridor, size in sizes.sort_values(ascending=False).items():
+        part = int(load.argmin())
+        assignment[corridor] = part
+        load[part] += size
+    part_of = intersections["corridor"].map(assignment).to_numpy()
+    for part in range(parts):
+        members = np.flatnonzero(part_of == part)
+        if not len(members):
+            continue
+        local = pd.Series(np.arange(len(members)), index=members)
+        part_links = links[links["from"].isin(members)].copy()
+        part_links["from"] = local[part_links["from"]].to_numpy()
+        part_links["to"] = local[part_links["to"]].to_numpy()
+        yield members, part_links
+
+
+def optimize_network(
+    intersections,
+    links,
+    cycle=(60, 120),
+    min_green=10,
+    ped_crossing_m=12.0,
+    offset_weight=1.0,
+    decompose=False,
+    workers=1,
+):
+    # Signal plan (one row per intersection) plus a solve summary. With
+    # decompose=True each group of corridors is its own LP, solved in a
+    # process pool when workers > 1; the shared cycle is fixed first so the
+    # corridors stay on the same cycle.
+    intersections = intersections.reset_index(drop=True)
+    volumes = intersections[APPROACHES].to_numpy(dtype=np.float64)
+    options = {
+        "min_green": min_green,
+        "ped_crossing_m": ped_crossing_m,
+        "offset_weight": offset_weight,
+    }
+    if np.ndim(cycle):
+        lower = minimum_greens(~np.isnan(volumes), min_green, ped_crossing_m)
+        cycle = critical_cycle(volumes, lower, cycle)
+
+    start = time.perf_counter()
+    if decompose:
+        parts = list(_partition(intersections, links, max(workers, 1) * 4))
+        jobs = [
+            (volumes[members], part_links, cycle, options)
+            for members, part_links in parts
+        ]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_solve_part, jobs))
+        else:
+            results = [_solve_part(job) for job in jobs]
+        greens = np.empty_like(volumes)
+        offsets = np.empty(len(volumes))
+        deviation = np.empty(len(volumes))
+        for (members, _), result in zip(parts, results):
+            greens[members] = result["greens"]
+            offsets[members] = result["offsets"]
+            deviation[members] = result["deviation"]
+        forward = np.concatenate([r["forward_error"] for r in results])
+        backward = np.concatenate([r["backward_error"] for r in results])
+        objective = sum(r["objective"] for r in results)
+        iterations = sum(r["iterations"] for r in results)
+        rounds = max(r["rounds"] for r in results)
+    else:
+        result = SignalNetwork(volumes, links, cycle, **options).solve()
+        greens, offsets = result["greens"], result["offsets"]
+        deviation = result["deviation"]
+        forward, backward = result["forward_error"], result["backward_error"]
+        objective, iterations = result["objective"], result["iterations"]
+        rounds = result["rounds"]
+
+    plan = intersections.drop(columns=APPROACHES).assign(
+        cycle=cycle,
+        offset=offsets,
+        **{f"green_{a}": greens[:, i] for i, a in enumerate(APPROACHES)},
+        deviation=deviation,
+    )
+    summary = {
+        "intersections": len(plan),
+        "links": len(links),
+        "cycle": cycle,
+        "objective": objective,
+        "mean_wave_error_s": (
+            float(np.nanmean(np.concatenate([forward, backward])))
+            if len(links)
+            else 0.0
+        ),
+        "rounds": rounds,
+        "iterations": iterations,
+        "solve_s": time.perf_counter() - start,
+    }
+    return plan, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Coordinated signal plan for the counted corridors"
+    )
+    parser.add_argument("--hour", type=int, default=8, help="hour of day to plan")
+    parser.add_argument("--min-cycle", type=float, default=60)
+    parser.add_argument("--max-cycle", type=float, default=120)
+    parser.add_argument("--min-green", type=float, default=10)
+    parser.add_argument(
+        "--crossing-m", type=float, default=12.0, help="pedestrian crossing length"
+    )
+    parser.add_argument("--speed-kmh", type=float, default=40, help="progression speed")
+    parser.add_argument(
+        "--decompose", action="store_true", help="one LP per corridor group"
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the plan to this CSV")
+    args = parser.parse_args()
+
+    intersections = load_intersections(hour=args.hour)
+    links = corridor_links(intersections, speed_kmh=args.speed_kmh)
+    plan, summary = optimize_network(
+        intersections,
+        links,
+        cycle=(args.min_cycle, args.max_cycle),
+        min_green=args.min_green,
+        ped_crossing_m=args.crossing_m,
+        decompose=args.decompose,
+        workers=args.workers,
+    )
+    print(plan.round(2).to_string(index=False))
+    print(summary)
+    if args.output:
+        plan.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+from feature_store import STORE_PATH, read_features
+
+INDEX_PATH = "data/processed/spatial_index.parquet"
+INDEX_COLUMNS = [
+    "count_id",
+    "centreline_id_vol",
+    "location_name_vol",
+    "direction",
+    "latitude_vol",
+    "longitude_vol",
+    "datetime",
+    "volume_15min",
+    "congestion_level",
+]
+METERS_PER_DEG_LAT = 111_320
+WEEKDAYS = {"weekdays": [0, 1, 2, 3, 4], "weekends": [5, 6]}
+
+# The index is a copy of the map/analysis columns sorted by grid cell and then
+# by time, so every cell is one contiguous, time-ordered run of rows. A query
+# picks the cells overlapping its bounding box from the (small) cell table,
+# narrows each run to the date range by binary search, and only then applies
+# the exact box, time-of-day and weekday masks to the rows that are left.
+
+
+def _clock_minutes(value):
+    # "07:30" or 7.5 -> minutes after midnight
+    if isinstance(value, str):
+        hours, minutes = value.split(":")
+        return int(hours) * 60 + int(minutes)
+    return int(round(value * 60))
+
+
+class SpatialIndex:
+    def __init__(self, records, meta):
+        self.records = records
+        self.meta = meta
+        self.cell_m = meta["cell_m"]
+        self.lat_scale = METERS_PER_DEG_LAT / self.cell_m
+        self.lon_scale = self.lat_scale * np.cos(np.radians(meta["lat_ref"]))
+
+        # Cell table: one entry per non-empty cell with its row range
+        cells = records["cell"].to_numpy()
+        keys, starts = np.unique(cells, return_index=True)
+        self.cell_keys = keys
+        self.cell_start = starts
+        self.cell_end = np.append(starts[1:], len(cells))
+        self.cell_y = keys // meta["width"] + meta["cy_min"]
+        self.cell_x = keys % meta["width"] + meta["cx_min"]
+
+        self.time = records["datetime"].to_numpy().astype("datetime64[ns]")
+        self.time = self.time.view(np.int64)
+        self.lat = records["latitude_vol"].to_numpy()
+        self.lon = records["longitude_vol"].to_numpy()
+        self.minute = records["minute_of_day"].to_numpy()
+        self.weekday = records["weekday"].to_numpy()
+
+    @staticmethod
+    def _records(df, meta):
+        # Index rows of df on the grid described by meta; None when a point
+        # falls west, east or south of the grid (its cell key would collide)
+        lat_scale = METERS_PER_DEG_LAT / meta["cell_m"]
+        lon_scale = lat_scale * np.cos(np.radians(meta["lat_ref"]))
+        cy = np.floor(df["latitude_vol"].to_numpy() * lat_scale).astype(np.int64)
+        cx = np.floor(df["longitude_vol"].to_numpy() * lon_scale).astype(np.int64)
+        cy, cx = cy - meta["cy_min"], cx - meta["cx_min"]
+        if len(df) and (cy.min() < 0 or cx.min() < 0 or cx.max() >= meta["width"]):
+            return None
+
+        datetime = pd.to_datetime(df["datetime"])
+        return df[[c for c in INDEX_COLUMNS if c in df.columns]].assign(
+            datetime=datetime,
+            cell=cy * meta["width"] + cx,
+            minute_of_day=(datetime.dt.hour * 60 + datetime.dt.minute).astype("int16"),
+            weekday=datetime.dt.weekday.astype("int8"),
+        )
+
+    @classmethod
+    def build(cls, df, cell_m=250):
+        df = df.dropna(subset=["latitude_vol", "longitude_vol"])
+        lat_ref = float(df["latitude_vol"].mean()) if len(df) else 0.0
+        lat_scale = METERS_PER_DEG_LAT / cell_m
+        lon_scale = lat_scale * np.cos(np.radians(lat_ref))
+        cy = np.floor(df["latitude_vol"].to_numpy() * lat_scale).astype(np.int64)
+        cx = np.floor(df["longitude_vol"].to_numpy() * lon_scale).astype(np.int64)
+        meta = {
+            "cell_m": cell_m,
+            "lat_ref": lat_ref,
+            "cy_min": int(cy.min()) if len(df) else 0,
+            "cx_min": int(cx.min()) if len(df) else 0,
+            "width": int(cx.max() - cx.min() + 1) if len(df) else 1,
+        }
+        records = cls._records(df, meta)
+        records = records.sort_values(["cell", "datetime"], kind="stable")
+        return cls(records.reset_index(drop=True), meta)
+
+    def replace_counts(self, count_ids, df):
+        # A new index without the rows of count_ids, plus the rows of df on
+        # the same grid. None when df reaches outside the grid, in which case
+        # the index has to be rebuilt.
+        df = df.dropna(subset=["latitude_vol", "longitude_vol"])
+        new = self._records(df, self.meta)
+        if new is None:
+            return None
+        kept = self.records[~self.records["count_id"].isin(count_ids)]
+        if len(new):
+            for col in new.columns:
+                # Categories read from different files need not agree
+                if isinstance(kept[col].dtype, pd.CategoricalDtype):
+                    both = union_categoricals([kept[col], new[col]]).categories
+                    kept = kept.assign(**{col: kept[col].cat.set_categories(both)})
+                    new = new.assign(**{col: new[col].astype(kept[col].dtype)})
+            kept = pd.concat([kept, new[kept.columns]], ignore_index=True)
+        records = kept.sort_values(["cell", "datetime"], kind="stable")
+        return SpatialIndex(records.reset_index(drop=True), self.meta)
+
+    def save(self, path=INDEX_PATH):
+        table = pa.Table.from_pandas(self.records, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, b"spatial_index": json.dumps(self.meta)}
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[b"spatial_index"])
+        return cls(table.to_pandas(), meta)
+
+    def _rows(self, bbox, start, end):
+        # Row numbers of the cells overlapping bbox, limited to [start, end)
+        if bbox is None:
+            selected = np.arange(len(self.cell_keys))
+        else:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            selected = np.flatnonzero(
+                (self.cell_y >= np.floor(min_lat * self.lat_scale))
+                & (self.cell_y <= np.floor(max_lat * self.lat_scale))
+                & (self.cell_x >= np.floor(min_lon * self.lon_scale))
+                & (self.cell_x <= np.floor(max_lon * self.lon_scale))
+            )
+        lo = self.cell_start[selected]
+        hi = self.cell_end[selected]
+        if start is not None or end is not None:
+            t0 = pd.Timestamp(start).value if start is not None else None
+            t1 = pd.Timestamp(end).value if end is not None else None
+            lo, hi = lo.copy(), hi.copy()
+            for i, (a, b) in enumerate(zip(lo, hi)):
+                run = self.time[a:b]
+                if t0 is not None:
+                    lo[i] = a + np.searchsorted(run, t0, side="left")
+                if t1 is not None:
+                    hi[i] = a + np.searchsorted(run, t1, side="left")
+        lengths = np.maximum(hi - lo, 0)
+        # Concatenated aranges of every [lo, hi) range
+        offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(lengths.sum())
+
+    def query(
+        self,
+        bbox=None,
+        start=None,
+        end=None,
+        time_of_day=None,
+        weekdays=None,
+        columns=None,
+    ):
+        # Records inside bbox (min_lon, min_lat, max_lon, max_lat) with
+        # start <= datetime < end, a clock time in [from, to) and a weekday in
+        # `weekdays` (0 = Monday, or "weekdays" / "weekends")
+        rows = self._rows(bbox, start, end)
+        mask = np.ones(len(rows), dtype=bool)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            lat, lon = self.lat[rows], self.lon[rows]
+            mask &= (lat >= min_lat) & (lat <= max_lat)
+            mask &= (lon >= min_lon) & (lon <= max_lon)
+        if time_of_day is not None:
+            first, last = map(_clock_minutes, time_of_day)
+            minute = self.minute[rows]
+            if first <= last:
+                mask &= (minute >= first) & (minute < last)
+            else:
+                # Window across midnight, e.g. 22:00-02:00
+                mask &= (minute >= first) | (minute < last)
+        if weekdays is not None:
+            if isinstance(weekdays, str):
+                weekdays = WEEKDAYS[weekdays]
+            mask &= np.isin(self.weekday[rows], weekdays)
+        result = self.records.iloc[rows[mask]]
+        if columns is not None:
+            result = result[columns]
+        return result.reset_index(drop=True)
+
+
+def build_index(store_path=STORE_PATH, path=INDEX_PATH, cell_m=250):
+    index = SpatialIndex.build(
+        read_features(columns=INDEX_COLUMNS, root=store_path), cell_m=cell_m
+    )
+    index.save(path)
+    return index
+
+
+def update_index(
+    count_ids, partitions, store_path=STORE_PATH, path=INDEX_PATH, cell_m=250
+):
+    # After an incremental run that replaced the rows of count_ids within the
+    # given year/month partitions: reads back only those counts from only
+    # those partitions and patches the index, instead of rebuilding it from
+    # the whole store. Falls back to a rebuild when there is no index yet,
+    # its grid differs, or the new rows fall outside it.
+    if not os.path.exists(path):
+        return build_index(store_path, path, cell_m)
+    index = SpatialIndex.load(path)
+    if index.meta["cell_m"] != cell_m:
+        return build_index(store_path, path, cell_m)
+
+    df = pd.DataFrame(columns=INDEX_COLUMNS)
+    if partitions:
+        touched = None
+        for year, month in partitions:
+            expr = (ds.field("year") == year) & (ds.field("month") == month)
+            touched = expr if touched is None else touched | expr
+        df = read_features(
+            columns=INDEX_COLUMNS,
+            filters=touched & ds.field("count_id").isin(list(count_ids)),
+            root=store_path,
+        )
+    patched = index.replace_counts(count_ids, df)
+    if patched is None:
+        return build_index(store_path, path, cell_m)
+    patched.save(path)
+    return patched
+
+
+_loaded = {}
+
+
+def load_index(path=INDEX_PATH):
+    # One index per process, reloaded when the file is rebuilt; built from the
+    # feature store if preprocessing has not written one yet
+    if not os.path.exists(path):
+        build_index(path=path)
+    version = os.stat(path).st_mtime_ns
+    if _loaded.get(path, (None,))[0] != version:
+        _loaded[path] = (version, SpatialIndex.load(path))
+    return _loaded[path][1]
@@ -0,0 +1,492 @@
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from features import LABEL_MAP, RUSH_HOURS, build_features
+from forecast_features import (
+    HORIZONS,
+    INTERVAL_MIN,
+    WEEK_MIN,
+    WINDOWS,
+    horizon_features,
+)
+from optimize_signals import counted_green_times
+from predict_batch import load_model, predict_proba
+from signal_network import APPROACHES
+
+LIVE_PATH = "data/processed/live_state.json"
+FEED_DIR = "data/incoming"
+SOCKET_PATH = "/tmp/traffic_feed.sock"
+FORECAST_MODEL_DIR = "models/forecast"
+LEVELS = {v: k for k, v in LABEL_MAP.items()}
+# A week of intervals, so the forecasters' last-week volumes can be looked up;
+# about 8 KB per sensor. A shorter window leaves them NaN.
+WEEK_INTERVALS = WEEK_MIN // INTERVAL_MIN
+NUMERIC_COLUMNS = ["centreline_id", "volume_15min", "latitude", "longitude"]
+
+# Records arrive in the raw volume CSV schema (plus an optional sent_at epoch
+# timestamp from the replay tool), from files dropped into a directory or
+# lines written to a unix socket. Every source only parses text into frames
+# and queues them; one loop drains the queue into micro-batches and hands each
+# batch to a worker thread, which updates the per-sensor ring buffers, scores
+# the records, forecasts from the buffered history and retimes the signals of
+# the intersections the batch touched. The latest state is written to
+# LIVE_PATH for the dashboard.
+
+
+class RingBuffers:
+    # Last `window` intervals of every sensor (centreline_id and direction) in
+    # fixed (sensors x window) arrays; new sensors get a row on first sight
+    # and the arrays double when full. An interval's slot is its start time in
+    # intervals modulo the window, so looking up "k minutes before the latest
+    # record" reads one slot and checks its stored minute.
+
+    def __init__(self, window=16, capacity=1024, interval_min=INTERVAL_MIN):
+        self.window = window
+        self.interval = interval_min
+        self.index = pd.Index([], dtype=np.int64)
+        self.volume = np.full((capacity, window), np.nan, dtype=np.float32)
+        self.minute = np.full((capacity, window), -1, dtype=np.int64)
+        self.latest = np.full(capacity, -1, dtype=np.int64)
+
+    def rows(self, keys):
+        rows = self.index.get_indexer(keys)
+        new = np.unique(keys[rows < 0])
+        if len(new):
+            self.index = self.index.append(pd.Index(new))
+            if len(self.index) > len(self.latest):
+                grow = max(len(self.index), 2 * len(self.latest)) - len(self.latest)
+                self.volume = np.vstack(
+                    [self.volume, np.full((grow, self.window), np.nan, np.float32)]
+                )
+                self.minute = np.vstack(
+                    [self.minute, np.full((grow, self.window), -1, np.int64)]
+                )
+                self.latest = np.concatenate([self.latest, np.full(grow, -1, np.int64)])
+            rows = self.index.get_indexer(keys)
+        return rows
+
+    def push(self, keys, minutes, volumes):
+        # Stores every record in its interval's slot; returns the rows that
+        # changed
+        rows = self.rows(keys)
+        np.maximum.at(self.latest, rows, minutes)
+        # Records older than the window would overwrite newer intervals
+        keep = minutes > self.latest[rows] - self.window * self.interval
+        # In time order, so the newest record of a slot is written last
+        order = np.argsort(minutes[keep], kind="stable")
+        rows, minutes = rows[keep][order], minutes[keep][order]
+        slot = (minutes // self.interval) % self.window
+        self.volume[rows, slot] = volumes[keep][order]
+        self.minute[rows, slot] = minutes
+        return np.unique(rows)
+
+    def latest_minute(self, rows):
+        return self.latest[rows]
+
+    def at(self, rows, minutes_back):
+        # Volume `minutes_back` before each row's latest record, NaN if that
+        # interval was not received or is older than the window
+        wanted = self.latest[rows] - minutes_back
+        slot = (wanted // self.interval) % self.window
+        hit = self.minute[rows, slot] == wanted
+        return np.where(hit, self.volume[rows, slot], np.nan)
+
+    def mean(self, rows, minutes):
+        # Mean of the intervals received in the last `minutes`
+        back = np.arange(0, minutes, self.interval)
+        wanted = self.latest[rows, None] - back
+        slot = (wanted // self.interval) % self.window
+        hit = self.minute[rows[:, None], slot] == wanted
+        total = np.where(hit, self.volume[rows[:, None], slot], 0).sum(axis=1)
+        return total / np.maximum(hit.sum(axis=1), 1)
+
+
+def clean_records(batch):
+    # Records with a missing or unparsable sensor, volume or time, or an
+    # unknown direction, are skipped one by one rather than failing the batch
+    required = ["centreline_id", "direction", "time_start", "volume_15min"]
+    missing = [c for c in required if c not in batch]
+    if missing:
+        print(f"Skipped {len(batch)} records without {', '.join(missing)}")
+        return batch.iloc[:0]
+    batch = batch.assign(
+        **{
+            c: pd.to_numeric(batch[c], errors="coerce")
+            for c in NUMERIC_COLUMNS + ["sent_at"]
+            if c in batch
+        }
+    )
+    valid = batch[["centreline_id", "volume_15min"]].notna().all(axis=1)
+    valid &= pd.to_datetime(batch["time_start"], errors="coerce").notna()
+    valid &= batch["direction"].isin(APPROACHES)
+    if (~valid).any():
+        print(f"Skipped {int((~valid).sum())} malformed records")
+    return batch[valid]
+
+
+def _sensor_keys(centreline_id, direction):
+    codes = pd.Categorical(direction, categories=APPROACHES).codes
+    return centreline_id.astype(np.int64) * len(APPROACHES) + codes
+
+
+class StreamIngestor:
+    def __init__(
+        self,
+        model,
+        label_map,
+        forecasters=None,
+        window=WEEK_INTERVALS,
+        max_batch_rows=2048,
+        max_wait_ms=50.0,
+        cycle=120,
+        min_green=10,
+        live_path=LIVE_PATH,
+        publish_every_s=1.0,
+    ):
+        self.model = model
+        reverse_map = {v: k for k, v in label_map.items()}
+        self.classes = [reverse_map[c] for c in model.classes_]
+        self.forecasters = forecasters or {}
+        # At least enough intervals for the longest rolling mean
+        self.rings = RingBuffers(max(window, *WINDOWS.values()))
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.cycle = cycle
+        self.min_green = min_green
+        self.live_path = live_path
+        self.publish_every_s = publish_every_s
+        self.queue = asyncio.Queue()
+        # One worker thread keeps the event loop free to read the sources
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.sensors = pd.DataFrame()
+        self.signals = pd.DataFrame()
+        self.started = time.time()
+        self.records = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=10_000)
+        self.last_publish = 0.0
+
+    async def put(self, frame):
+        await self.queue.put((frame, time.time()))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0])
+            batch = pd.concat(
+                [frame.assign(received_at=at) for frame, at in items],
+                ignore_index=True,
+            )
+            try:
+                # Published right away when nothing else is waiting
+                idle = self.queue.empty()
+                await loop.run_in_executor(self.executor, self.process, batch, idle)
+            except Exception as e:
+                # One bad batch must not stop the consumer
+                print(f"Dropped a batch of {len(batch)} records: {e!r}")
+
+    def process(self, batch, publish=False):
+        batch = clean_records(batch)
+        if batch.empty:
+            return
+        when = pd.to_datetime(batch["time_start"])
+        minutes = when.to_numpy().astype("datetime64[m]").view(np.int64)
+        keys = _sensor_keys(batch["centreline_id"].to_numpy(), batch["direction"])
+        volume = batch["volume_15min"].to_numpy(dtype=np.float32)
+        touched = self.rings.push(keys, minutes, volume)
+
+        # Current level of every record with the live classifier
+        proba = predict_proba(self.model, build_features(batch))
+        batch = batch.assign(
+            key=keys,
+            level=np.array(self.classes)[proba.argmax(axis=1)],
+            p_high=proba[:, self.classes.index("High")],
+        )
+        latest = batch.sort_values("time_start").drop_duplicates("key", keep="last")
+        latest = latest.set_index("key").loc[self.rings.index[touched]]
+
+        # Forecasts from the buffered history of the sensors that moved
+        lags = {
+            f"lag_{lag}": self.rings.at(touched, lag * INTERVAL_MIN)
+            for lag in range(1, 5)
+        }
+        means = {
+            name: self.rings.mean(touched, width * INTERVAL_MIN)
+            for name, width in WINDOWS.items()
+        }
+        hour = pd.to_datetime(latest["time_start"]).dt.hour.to_numpy()
+        history = pd.DataFrame(
+            {
+                "hour": hour,
+                "is_weekend": pd.to_datetime(latest["time_start"]).dt.dayofweek >= 5,
+                "is_rush_hour": np.isin(hour, RUSH_HOURS),
+                "volume_15min": latest["volume_15min"].to_numpy(dtype=np.float32),
+                **lags,
+                **means,
+            },
+            index=latest.index,
+        )
+        update = latest[
+            ["centreline_id", "direction", "location_name", "latitude", "longitude"]
+            + ["time_start", "volume_15min", "level", "p_high"]
+        ].assign(mean_1h=means["mean_1h"])
+        for horizon, forecaster in self.forecasters.items():
+            # The volume one week before the forecast time
+            last_week = self.rings.at(touched, WEEK_MIN - horizon)
+            X = history.assign(**{f"last_week_{horizon}": last_week})
+            predicted = forecaster.predict(X[horizon_features(horizon)])
+            update[f"level_{horizon}min"] = [LEVELS[int(c)] for c in predicted]
+        self.sensors = (
+            update.combine_first(self.sensors) if len(self.sensors) else update
+        )
+
+        # Retime every intersection the batch touched from the latest volume
+        # of each of its approaches
+        sites = np.unique(latest["centreline_id"].to_numpy(dtype=np.int64))
+        approach_keys = (sites[:, None] * len(APPROACHES) + np.arange(4)).ravel()
+        rows = self.rings.index.get_indexer(approach_keys)
+        volumes = np.full(len(rows), np.nan)
+        known = rows >= 0
+        volumes[known] = self.rings.at(rows[known], 0)
+        volumes = volumes.reshape(len(sites), len(APPROACHES))
+        greens = counted_green_times(volumes, self.cycle, self.min_green)
+        signals = pd.DataFrame(
+            greens, index=pd.Index(sites, name="centreline_id"), columns=APPROACHES
+        ).add_prefix("green_")
+        self.signals = (
+            signals.combine_first(self.signals) if len(self.signals) else signals
+        )
+
+        now = time.time()
+        sent = (
+            batch["sent_at"].to_numpy(dtype=np.float64)
+            if "sent_at" in batch
+            else batch["received_at"].to_numpy()
+        )
+        self.latencies.extend(now - sent)
+        self.records += len(batch)
+        self.batches += 1
+        if publish or now - self.last_publish >= self.publish_every_s:
+            self.publish()
+
+    def metrics(self):
+        lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        uptime = time.time() - self.started
+        return {
+            "records": self.records,
+            "batches": self.batches,
+            "mean_batch_records": self.records / max(self.batches, 1),
+            "sensors": len(self.rings.index),
+            "records_per_s": self.records / uptime,
+            "latency_ms": {
+                "p50": float(np.percentile(lat, 50)),
+                "p99": float(np.percentile(lat, 99)),
+            },
+        }
+
+    def publish(self):
+        state = {
+            "updated": time.time(),
+            "metrics": self.metrics(),
+            "sensors": json.loads(self.sensors.to_json(orient="records")),
+            "signals": json.loads(
+                self.signals.round(1).reset_index().to_json(orient="records")
+            ),
+        }
+        os.makedirs(os.path.dirname(self.live_path), exist_ok=True)
+        tmp_path = f"{self.live_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.live_path)
+        self.last_publish = state["updated"]
+
+
+def _parse(header, lines):
+    # Lines with the wrong number of fields are skipped; a chunk that cannot
+    # be parsed at all is dropped rather than stopping the source
+    try:
+        return pd.read_csv(io.BytesIO(header + lines), on_bad_lines="skip")
+    except ValueError as e:
+        print(f"Dropped {len(lines.splitlines())} unparsable lines: {e!r}")
+        return None
+
+
+def _read_new(path, offset, header, final=False):
+    # Complete lines appended since `offset` (with final, also a last line
+    # without a newline); the first line is the header
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = len(data) if final else data.rfind(b"\n") + 1
+    if not end:
+        return offset, header, None
+    data = data[:end]
+    if header is None:
+        split = data.find(b"\n") + 1 or len(data)
+        header, data = data[:split], data[split:]
+    return offset + end, header, (_parse(header, data) if data else None)
+
+
+async def tail_directory(ingestor, directory=FEED_DIR, poll_s=0.1, prune_after_s=60):
+    # Picks up new *.csv files and lines appended to files already seen. A
+    # file unchanged for prune_after_s seconds is read to its end, then
+    # deleted and its offset forgotten (never, with prune_after_s=0).
+    os.makedirs(directory, exist_ok=True)
+    offsets = {}
+    while True:
+        paths = sorted(glob.glob(os.path.join(directory, "*.csv")))
+        offsets = {path: offsets[path] for path in paths if path in offsets}
+        for path in paths:
+            offset, header = offsets.get(path, (0, None))
+            try:
+                stat = os.stat(path)
+                settled = (
+                    prune_after_s > 0 and time.time() - stat.st_mtime >= prune_after_s
+                )
+                if stat.st_size <= offset:
+                    if settled:
+                        os.remove(path)
+                        del offsets[path]
+                    continue
+                offset, header, frame = await asyncio.to_thread(
+                    _read_new, path, offset, header, settled
+                )
+            except OSError as e:
+                # Removed or unreadable since the listing
+                print(f"Skipped {path}: {e!r}")
+                offsets.pop(path, None)
+                continue
+            offsets[path] = (offset, header)
+            if frame is not None and len(frame):
+                await ingestor.put(frame)
+        await asyncio.sleep(poll_s)
+
+
+async def serve_socket(ingestor, path=SOCKET_PATH):
+    # Each connection sends the CSV header line, then records
+    async def handle(reader, writer):
+        try:
+            header = await reader.readline()
+            pending = b""
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                data = pending + data
+                end = data.rfind(b"\n") + 1
+                pending = data[end:]
+                frame = _parse(header, data[:end]) if end else None
+                if frame is not None and len(frame):
+                    await ingestor.put(frame)
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(handle, path)
+    print(f"Listening for records on {path}")
+    async with server:
+        await server.serve_forever()
+
+
+def load_forecasters(root=FORECAST_MODEL_DIR):
+    # Forecast bundles (user-trained, see train_forecast.py) that exist
+    from model_bundle import current_bundle, load_bundle
+
+    forecasters = {}
+    for horizon in HORIZONS:
+        bundle_root = os.path.join(root, f"{horizon}min")
+        if current_bundle(bundle_root):
+            forecasters[horizon] = load_bundle(root=bundle_root)
+    return forecasters
+
+
+async def _run(ingestor, directory, socket_path, prune_after_s=60):
+    tasks = [asyncio.create_task(ingestor.run())]
+    if directory:
+        tasks.append(
+            asyncio.create_task(tail_directory(ingestor, directory, 0.1, prune_after_s))
+        )
+    if socket_path:
+        tasks.append(asyncio.create_task(serve_socket(ingestor, socket_path)))
+    await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score live 15-minute records and retime their signals"
+    )
+    parser.add_argument("--directory", default=None, help="tail CSV files here")
+    parser.add_argument("--socket", default=None, help="unix socket to listen on")
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="bundle directory or legacy pickle (default: the current bundle)",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=WEEK_INTERVALS,
+        help="intervals kept per sensor (a week by default; fewer leaves the "
+        "forecasters without last-week volumes)",
+    )
+    parser.add_argument(
+        "--prune-after-s",
+        type=float,
+        default=60,
+        help="delete feed files unchanged this long after reading them (0: keep)",
+    )
+    parser.add_argument("--max-batch-rows", type=int, default=2048)
+    parser.add_argument("--max-wait-ms", type=float, default=50.0)
+    parser.add_argument("--cycle", type=float, default=120)
+    parser.add_argument("--min-green", type=float, default=10)
+    parser.add_argument("--live-path", default=LIVE_PATH)
+    parser.add_argument(
+        "--compiled", action="store_true", help="score with the compiled tree engine"
+    )
+    args = parser.parse_args()
+    if not args.directory and not args.socket:
+        args.directory = FEED_DIR
+
+    model, label_map = load_model(args.model, compiled=args.compiled)
+    ingestor = StreamIngestor(
+        model,
+        label_map,
+        forecasters=load_forecasters(),
+        window=args.window,
+        max_batch_rows=args.max_batch_rows,
+        max_wait_ms=args.max_wait_ms,
+        cycle=args.cycle,
+        min_green=args.min_green,
+        live_path=args.live_path,
+    )
+    try:
+        asyncio.run(_run(ingestor, args.directory, args.socket, args.prune_after_s))
+    except KeyboardInterrupt:
+        ingestor.publish()
+
+
+if __name__ == "__main__":
+    main()
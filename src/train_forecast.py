@@ -0,0 +1,111 @@
+import argparse
+import os
+
+import numpy as np
+from sklearn.metrics import accuracy_score, classification_report, f1_score
+from xgboost import XGBClassifier
+
+from features import LABEL_MAP
+from forecast_features import (
+    FORECAST_PATH,
+    HORIZONS,
+    build_forecast_features,
+    horizon_features,
+    level_codes,
+    read_forecast_features,
+)
+from model_bundle import load_bundle, prune_bundles, save_bundle
+from training_engine import data_hash
+
+FORECAST_MODEL_DIR = "models/forecast"
+
+
+def forecast_bundle_dir(horizon):
+    return os.path.join(FORECAST_MODEL_DIR, f"{horizon}min")
+
+
+def load_forecast_model(horizon):
+    # Bundle predicting the congestion level `horizon` minutes ahead
+    return load_bundle(root=forecast_bundle_dir(horizon))
+
+
+def time_split(df, holdout=0.2):
+    # Train on the earlier intervals, evaluate on the latest ones: a random
+    # split would leak each interval's neighbours into training
+    cutoff = df["datetime"].quantile(1 - holdout)
+    return df[df["datetime"] < cutoff], df[df["datetime"] >= cutoff]
+
+
+def train_horizon(horizon, n_estimators=300, max_depth=6, learning_rate=0.1):
+    features = horizon_features(horizon)
+    target = f"target_{horizon}"
+    df = read_forecast_features(horizon)
+    train, test = time_split(df)
+    print(f"\n--- {horizon} min ahead: {len(train)} train / {len(test)} test rows ---")
+
+    # Missing lags (start of a count, gaps) stay NaN: XGBoost learns a
+    # default direction for them
+    model = XGBClassifier(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        learning_rate=learning_rate,
+        eval_metric="mlogloss",
+        n_jobs=-1,
+    )
+    model.fit(train[features], train[target].astype("int64"))
+    y_test = test[target].astype("int64")
+    y_pred = model.predict(test[features])
+    print(classification_report(y_test, y_pred))
+
+    # Persistence baseline: the level of the current interval carries on
+    baseline = level_codes(test["volume_15min"].to_numpy(dtype=np.float32))
+    metrics = {
+        "horizon_min": horizon,
+        "holdout_accuracy": accuracy_score(y_test, y_pred),
+        "holdout_f1_macro": f1_score(y_test, y_pred, average="macro"),
+        "persistence_f1_macro": f1_score(y_test, baseline, average="macro"),
+        "holdout_start": str(test["datetime"].min()),
+    }
+    print(
+        f"F1 macro {metrics['holdout_f1_macro']:.3f} "
+        f"(persistence {metrics['persistence_f1_macro']:.3f})"
+    )
+
+    path = save_bundle(
+        model,
+        LABEL_MAP,
+        features,
+        train[features].dtypes,
+        data_fingerprint=data_hash(df[features], df[target]),
+        metrics=metrics,
+        root=forecast_bundle_dir(horizon),
+    )
+    prune_bundles(keep=3, root=forecast_bundle_dir(horizon))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train congestion forecasters for 15-60 minutes ahead"
+    )
+    parser.add_argument(
+        "--horizons", type=int, nargs="+", choices=HORIZONS, default=HORIZONS
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="rebuild the forecast features first"
+    )
+    parser.add_argument("--buckets", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(FORECAST_PATH):
+        rows = build_forecast_features(buckets=args.buckets, workers=args.workers)
+        print(f"Built forecast features for {rows} rows")
+
+    for horizon in args.horizons:
+        path = train_horizon(horizon)
+        print(f" Forecast bundle saved in {path}")
+
+
+if __name__ == "__main__":
+    main()
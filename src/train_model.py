@@ -1,97 +1,171 @@
+import argparse
+import os
+
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from xgboost import XGBClassifier
-from sklearn.metrics import classification_report, accuracy_score
-import joblib
-import os
+from sklearn.metrics import accuracy_score, classification_report, f1_score
 
-# Load processed data
-df = pd.read_csv("data/processed/final_processed.csv")
+from external_training import EXTERNAL_PARAMS, train_external
+from feature_store import read_features
+from features import FEATURE_COLS, LABEL_MAP
+from instrument import span
+from model_bundle import prune_bundles, save_bundle
+from schema import memory_report
+from training_engine import (
+    CANDIDATES,
+    LEADERBOARD_PATH,
+    build_model,
+    data_hash,
+    run_search,
+    save_leaderboard,
+    select_winner,
+)
 
 # -------------------------------
-# Define feature columns FIRST
+# Define feature columns FIRST (shared with the prediction path)
 # -------------------------------
-feature_cols = [
-    "hour",
-    "is_weekend",
-    "is_rush_hour",
-    "volume_15min",
-    "vol_1_19kph",
-    "vol_20_25kph",
-    "vol_26_30kph",
-    "vol_31_35kph",
-    "vol_36_40kph",
-    "vol_41_45kph",
-    "vol_46_50kph",
-    "vol_51_55kph",
-    "vol_56_60kph",
-    "vol_61_65kph",
-    "vol_66_70kph",
-    "vol_71_75kph",
-    "vol_76_80kph",
-    "vol_81_160kph",
-]
-
-print(f"Before dropna: {len(df)} rows")
-
-# Drop rows only if core values are missing
-df = df.dropna(subset=["congestion_level", "volume_15min", "hour"])
-speed_cols = [col for col in feature_cols if "vol_" in col]
-df[speed_cols] = df[speed_cols].fillna(0)
-
-print(f"After dropna: {len(df)} rows")
-
-#  Manual label encoding (Low=0, Medium=1, High=2)
-label_map = {"Low": 0, "Medium": 1, "High": 2}
-df["label"] = df["congestion_level"].map(label_map)
-
-# Split features and target
-X = df[feature_cols]
-y = df["label"]
-
-# Train-test split
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
+feature_cols = FEATURE_COLS
+
+
+def load_training_data():
+    # Load processed data (only the model columns)
+    df = read_features(columns=feature_cols + ["congestion_level"])
+
+    print(f"Before dropna: {len(df)} rows")
+
+    # Drop rows only if core values are missing
+    df = df.dropna(subset=["congestion_level", "volume_15min", "hour"])
+    speed_cols = [col for col in feature_cols if "vol_" in col]
+    df[speed_cols] = df[speed_cols].fillna(0).astype("uint16")
+
+    print(f"After dropna: {len(df)} rows")
+
+    #  Manual label encoding (Low=0, Medium=1, High=2)
+    df["label"] = df["congestion_level"].map(LABEL_MAP).astype("int64")
+    memory_report("training frame", df)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cross-validate candidate models and save the winner"
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument(
+        "--jobs", type=int, default=-1, help="parallel fold fits (-1 = all cores)"
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(CANDIDATES),
+        default=list(CANDIDATES),
+    )
+    parser.add_argument(
+        "--metric", choices=["f1_macro", "accuracy"], default="f1_macro"
+    )
+    parser.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        default=None,
+        help="only consider models predicting 10k rows within this many ms",
+    )
+    parser.add_argument(
+        "--external-memory",
+        action="store_true",
+        help="train XGBoost batch by batch from the store (no search)",
+    )
+    parser.add_argument(
+        "--nthread", type=int, default=-1, help="XGBoost threads (-1 = all cores)"
+    )
+    parser.add_argument("--batch-rows", type=int, default=1_000_000)
+    parser.add_argument(
+        "--holdout", type=float, default=0.2, help="latest share of rows held out"
+    )
+    args = parser.parse_args()
+
+    if args.external_memory:
+        # Reuse the best XGBoost config of the last search, if there was one
+        params = EXTERNAL_PARAMS
+        if os.path.exists(LEADERBOARD_PATH):
+            board = pd.read_csv(LEADERBOARD_PATH)
+            board = board[board["model"] == "xgboost"]
+            if not board.empty:
+                _, params = select_winner(board, metric=args.metric)
+        path = train_external(
+            params,
+            holdout=args.holdout,
+            nthread=os.cpu_count() if args.nthread == -1 else args.nthread,
+            batch_rows=args.batch_rows,
+        )
+        print(f"\n Model bundle saved in {path}")
+        return
+
+    df = load_training_data()
+
+    # Split features and target
+    X = df[feature_cols]
+    y = df["label"]
+
+    # Train-test split: the search only ever sees the training part
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    # ------------------------
+    # Cross-validated search over every candidate and grid point
+    # ------------------------
+    with span("search", rows=len(X_train)):
+        board = run_search(
+            X_train,
+            y_train,
+            candidates=args.models,
+            n_splits=args.folds,
+            n_jobs=args.jobs,
+        )
+    save_leaderboard(board)
+    print("\n--- Leaderboard ---")
+    print(board.to_string(index=False))
+    print(f"Leaderboard saved to {LEADERBOARD_PATH}")
+
+    name, params = select_winner(
+        board, metric=args.metric, latency_budget_ms=args.latency_budget_ms
+    )
+    print(f"\nSelected {name} {params}")
+
+    # ------------------------
+    # Refit the winner on the full training split
+    # ------------------------
+    model = build_model(name, params)
+    with span("fit", rows=len(X_train), model=name):
+        model.fit(X_train, y_train)
+    with span("predict", rows=len(X_test), model=name):
+        y_pred = model.predict(X_test)
+    print(f"\n--- {name} Holdout Results ---")
+    print(classification_report(y_test, y_pred))
+
+    # Save model, label map and feature schema as one versioned bundle
+    path = save_bundle(
+        model,
+        LABEL_MAP,
+        feature_cols,
+        X_train.dtypes,
+        data_fingerprint=data_hash(X, y),
+        metrics={
+            "holdout_accuracy": accuracy_score(y_test, y_pred),
+            "holdout_f1_macro": f1_score(y_test, y_pred, average="macro"),
+            "params": params,
+        },
+    )
+    prune_bundles(keep=3)
+    print(f"\n Model bundle saved in {path}")
+
+    # Debug sample
+    print("\nSample volumes & labels around 49:")
+    sample = df[df["volume_15min"].between(45, 52)][
+        ["volume_15min", "congestion_level", "label"]
+    ]
+    print(sample.sort_values("volume_15min"))
+
 
-# ------------------------
-# 1. Logistic Regression
-# ------------------------
-logreg = LogisticRegression(max_iter=1000)
-logreg.fit(X_train, y_train)
-y_pred_log = logreg.predict(X_test)
-print("\n--- Logistic Regression Results ---")
-print(classification_report(y_test, y_pred_log))
-
-# ------------------------
-# 2. Random Forest
-# ------------------------
-rf = RandomForestClassifier(n_estimators=100, random_state=42)
-rf.fit(X_train, y_train)
-y_pred_rf = rf.predict(X_test)
-print("\n--- Random Forest Results ---")
-print(classification_report(y_test, y_pred_rf))
-
-# ------------------------
-# 3. XGBoost
-# ------------------------
-xgb = XGBClassifier(use_label_encoder=False, eval_metric="mlogloss")
-xgb.fit(X_train, y_train)
-y_pred_xgb = xgb.predict(X_test)
-print("\n--- XGBoost Results ---")
-print(classification_report(y_test, y_pred_xgb))
-
-# Save model
-os.makedirs("models", exist_ok=True)
-joblib.dump(xgb, "models/model.pkl")
-joblib.dump(label_map, "models/label_map.pkl")  # save label map as well
-print("\n Model and label map saved in models/")
-
-# Debug sample
-print("\nSample volumes & labels around 49:")
-sample = df[df["volume_15min"].between(45, 52)][
-    ["volume_15min", "congestion_level", "label"]
-]
-print(sample.sort_values("volume_15min"))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold
+from xgboost import XGBClassifier
+
+CACHE_DIR = "models/cv_cache"
+LEADERBOARD_PATH = "models/leaderboard.csv"
+
+# Candidate models and their hyperparameter grids. Every estimator is kept
+# single-threaded: the parallelism comes from running folds side by side.
+CANDIDATES = {
+    "logistic_regression": (
+        lambda **p: LogisticRegression(max_iter=1000, **p),
+        {"C": [0.1, 1.0, 10.0]},
+    ),
+    "random_forest": (
+        lambda **p: RandomForestClassifier(random_state=42, n_jobs=1, **p),
+        {"n_estimators": [50, 100], "max_depth": [None, 12]},
+    ),
+    "xgboost": (
+        lambda **p: XGBClassifier(eval_metric="mlogloss", n_jobs=1, **p),
+        {"n_estimators": [100, 300], "max_depth": [4, 6], "learning_rate": [0.1, 0.3]},
+    ),
+}
+
+
+def expand_grid(grid):
+    keys = sorted(grid)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(grid[k] for k in keys))
+    ]
+
+
+def data_hash(X, y):
+    row_hashes = pd.util.hash_pandas_object(
+        pd.concat([X, y], axis=1), index=False
+    ).to_numpy()
+    columns = ",".join(map(str, X.columns)).encode()
+    return hashlib.sha1(row_hashes.tobytes() + columns).hexdigest()[:16]
+
+
+def _cache_path(name, params, fold, n_splits, data_key):
+    key = json.dumps([name, params, fold, n_splits, data_key], sort_keys=True)
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".joblib")
+
+
+def _fit_fold(name, params, fold, n_splits, data_key, X, y, train_idx, test_idx):
+    path = _cache_path(name, params, fold, n_splits, data_key)
+    if os.path.exists(path):
+        return joblib.load(path)["result"]
+
+    factory, _ = CANDIDATES[name]
+    model = factory(**params)
+    start = time.perf_counter()
+    model.fit(X.iloc[train_idx], y.iloc[train_idx])
+    fit_s = time.perf_counter() - start
+
+    y_pred = model.predict(X.iloc[test_idx])
+    result = {
+        "model": name,
+        "params": json.dumps(params, sort_keys=True),
+        "fold": fold,
+        "accuracy": accuracy_score(y.iloc[test_idx], y_pred),
+        "f1_macro": f1_score(y.iloc[test_idx], y_pred, average="macro"),
+        "fit_s": fit_s,
+        "size_kb": len(pickle.dumps(model)) / 1024,
+    }
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump({"result": result, "model": model}, tmp_path, compress=3)
+    os.replace(tmp_path, path)
+    return result
+
+
+def predict_ms_per_10k(model, X, repeats=3):
+    # Measured serially after the search so parallel folds don't skew it
+    sample = X.iloc[np.resize(np.arange(len(X)), 10_000)]
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(sample)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_search(X, y, candidates=None, n_splits=5, n_jobs=-1):
+    # k-fold CV over every candidate and grid point, one job per fold. Folds
+    # already fitted on the same data and params are read back from CACHE_DIR.
+    candidates = candidates or list(CANDIDATES)
+    data_key = data_hash(X, y)
+    folds = list(StratifiedKFold(n_splits, shuffle=True, random_state=42).split(X, y))
+    configs = [
+        (name, params)
+        for name in candidates
+        for params in expand_grid(CANDIDATES[name][1])
+    ]
+    print(
+        f"Cross-validating {len(configs)} configs x {n_splits} folds (data {data_key})"
+    )
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(
+            name, params, fold, n_splits, data_key, X, y, train_idx, test_idx
+        )
+        for name, params in configs
+        for fold, (train_idx, test_idx) in enumerate(folds)
+    )
+
+    board = (
+        pd.DataFrame(results)
+        .groupby(["model", "params"], sort=False)
+        .agg(
+            accuracy=("accuracy", "mean"),
+            f1_macro=("f1_macro", "mean"),
+            f1_std=("f1_macro", "std"),
+            fit_s=("fit_s", "mean"),
+            size_kb=("size_kb", "mean"),
+        )
+        .reset_index()
+    )
+    board["predict_ms_per_10k"] = [
+        predict_ms_per_10k(
+            joblib.load(
+                _cache_path(row.model, json.loads(row.params), 0, n_splits, data_key)
+            )["model"],
+            X,
+        )
+        for row in board.itertuples()
+    ]
+    return board.sort_values("f1_macro", ascending=False).reset_index(drop=True)
+
+
+def select_winner(board, metric="f1_macro", latency_budget_ms=None, tolerance=0.002):
+    # Best metric within the latency budget; among configs scoring within
+    # `tolerance` of that best, the fastest to predict wins
+    pool = board
+    if latency_budget_ms is not None:
+        pool = board[board["predict_ms_per_10k"] <= latency_budget_ms]
+        if pool.empty:
+            print(
+                f"No config predicts 10k rows within {latency_budget_ms} ms; "
+                "ignoring the budget"
+            )
+            pool = board
+    contenders = pool[pool[metric] >= pool[metric].max() - tolerance]
+    winner = contenders.sort_values("predict_ms_per_10k").iloc[0]
+    return winner["model"], json.loads(winner["params"])
+
+
+def build_model(name, params, n_jobs=-1):
+    # Final refit uses every core (for the models the search pinned to one)
+    factory, _ = CANDIDATES[name]
+    model = factory(**params)
+    if model.get_params().get("n_jobs") == 1:
+        model.set_params(n_jobs=n_jobs)
+    return model
+
+
+def save_leaderboard(board, path=LEADERBOARD_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    board.to_csv(path, index=False)
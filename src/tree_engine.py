@@ -0,0 +1,362 @@
+import argparse
+import json
+import time
+import warnings
+from decimal import Decimal, localcontext
+
+import numpy as np
+
+from features import FEATURE_COLS, SPEED_COLS
+
+# A trained tree ensemble flattened into one set of node arrays: every tree's
+# nodes are stored back to back, `roots` holds the first node of each tree.
+# All splits are "x < threshold goes left" on float32 inputs (sklearn's
+# "x <= t" on a float64 t is the same test against the next float32 above t),
+# NaN follows `default_left`, and leaves point at themselves so a batch walks
+# every tree in lock step for `depth` steps without branching per row.
+# Leaf values are summed tree by tree in the source library's order and
+# precision, so the probabilities match its predict_proba bit for bit.
+
+# glibc's expf (the one XGBoost calls on Linux), step for step in float64:
+# exp(x) = 2^(k/32) * 2^(r/32) with a 32-entry table and a cubic. numpy's
+# own float32 exp differs from it in the last bit for some inputs.
+EXP_BITS = 5
+EXP_N = 1 << EXP_BITS
+EXP_INV_LN2 = float.fromhex("0x1.71547652b82fep+0") * EXP_N
+EXP_POLY = [
+    float.fromhex("0x1.c6af84b912394p-5") / EXP_N**3,
+    float.fromhex("0x1.ebfce50fac4f3p-3") / EXP_N**2,
+    float.fromhex("0x1.62e42ff0c52d6p-1") / EXP_N,
+]
+EXP_UNDERFLOW = float.fromhex("-0x1.9fe368p6")
+EXP_OVERFLOW = float.fromhex("0x1.62e42ep6")
+
+
+def _exp_table():
+    # 2^(i/32), correctly rounded, with the exponent bits of i/32 taken out
+    with localcontext() as ctx:
+        ctx.prec = 40
+        powers = [float(Decimal(2) ** (Decimal(i) / EXP_N)) for i in range(EXP_N)]
+    bits = np.array(powers).view(np.uint64)
+    return bits - (np.arange(EXP_N, dtype=np.uint64) << np.uint64(52 - EXP_BITS))
+
+
+EXP_TABLE = _exp_table()
+
+
+def expf(x):
+    x = np.asarray(x, dtype=np.float32)
+    z = EXP_INV_LN2 * x.astype(np.float64)
+    z = np.where(np.isfinite(z), z, 0.0)
+    kd = np.rint(z)
+    r = z - kd
+    k = kd.astype(np.int64)
+    scale = EXP_TABLE[k % EXP_N] + (k.astype(np.uint64) << np.uint64(52 - EXP_BITS))
+    y = (EXP_POLY[0] * r + EXP_POLY[1]) * (r * r) + (EXP_POLY[2] * r + 1)
+    with np.errstate(over="ignore"):
+        out = (y * scale.view(np.float64)).astype(np.float32)
+    out[x < EXP_UNDERFLOW] = 0.0
+    out[x > EXP_OVERFLOW] = np.inf
+    out[np.isnan(x)] = np.nan
+    return out
+
+
+# Batch size from which the source model's predict_proba is faster than the
+# NumPy traversal (benchmarks/bench_tree_engine.py, one core)
+NATIVE_ROWS = {"xgboost": 16, "forest": 256}
+
+
+class CompiledEnsemble:
+    def __init__(
+        self,
+        kind,
+        classes,
+        roots,
+        feature,
+        threshold,
+        default_left,
+        children,
+        value,
+        tree_class,
+        depth,
+        base_margin=None,
+    ):
+        self.kind = kind  # "xgboost" (softmax of summed margins) or "forest"
+        self.classes_ = np.asarray(classes)
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.children = children  # left child at 2 * node, right at 2 * node + 1
+        self.value = value
+        self.tree_class = tree_class
+        self.depth = depth
+        self.base_margin = base_margin
+        self.table = None
+        # Large batches of rows outside the table go to the source model's
+        # own predict_proba (compiled C++ beats NumPy traversal there); both
+        # give the same bits, so only the latency changes
+        self.native = None
+        self.native_rows = None
+
+    def leaves(self, X):
+        # (rows, trees) leaf node of every tree for every row; np.take is
+        # about twice as fast as fancy indexing on these small index arrays
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        flat = X.ravel()
+        offset = (np.arange(len(X), dtype=np.int32) * X.shape[1])[:, None]
+        missing = np.isnan(flat).any()
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.depth):
+            x = np.take(flat, offset + np.take(self.feature, node))
+            go_right = x >= np.take(self.threshold, node)
+            if missing:
+                go_right |= np.isnan(x) & ~np.take(self.default_left, node)
+            node = np.take(self.children, 2 * node + go_right)
+        return node
+
+    def _tree_proba(self, X):
+        # Scored in row blocks so the (rows, trees) node arrays stay small
+        block = max(1, (1 << 20) // len(self.roots))
+        if len(X) > block:
+            return np.concatenate(
+                [self._tree_proba(X[i : i + block]) for i in range(0, len(X), block)]
+            )
+        values = np.take(self.value, self.leaves(X), axis=0)
+        if self.kind == "xgboost":
+            # float32 margins, trees added in order as in XGBoost's CPU
+            # predictor: cumsum accumulates strictly left to right
+            margin = np.empty((len(X), len(self.classes_)), dtype=np.float32)
+            for k in range(len(self.classes_)):
+                terms = values[:, self.tree_class == k]
+                start = np.broadcast_to(self.base_margin[k], (len(X), 1))
+                margin[:, k] = np.cumsum(np.hstack([start, terms]), axis=1)[:, -1]
+            # XGBoost's softmax: expf of the max-shifted margin, summed in
+            # double in class order, divided in float
+            margin -= margin.max(axis=1, keepdims=True)
+            exp = expf(margin)
+            total = np.zeros(len(exp))
+            for k in range(exp.shape[1]):
+                total += exp[:, k]
+            return exp / total.astype(np.float32)[:, None]
+        # sklearn forests: float64 per-tree class fractions summed in tree
+        # order, then averaged
+        return np.cumsum(values, axis=1)[:, -1] / values.shape[1]
+
+    def _cold_proba(self, X):
+        if self.native is not None and len(X) >= self.native_rows:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                return self.native.predict_proba(X)
+        return self._tree_proba(X)
+
+    def build_table(self, max_volume=1024):
+        # Precomputed probabilities for the rows that dominate the feed: no
+        # speed bins, integer volume below max_volume. Every (hour, weekend,
+        # rush hour, volume) combination is scored once.
+        hour, weekend, rush, volume = np.meshgrid(
+            np.arange(24), [0, 1], [0, 1], np.arange(max_volume), indexing="ij"
+        )
+        grid = np.zeros((hour.size, len(FEATURE_COLS)), dtype=np.float32)
+        grid[:, :4] = np.column_stack(
+            [hour.ravel(), weekend.ravel(), rush.ravel(), volume.ravel()]
+        )
+        self.table = self._cold_proba(grid)
+        self.max_volume = max_volume
+        return self
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if self.table is None:
+            return self._cold_proba(X)
+        hour, weekend, rush, volume = X[:, 0], X[:, 1], X[:, 2], X[:, 3]
+        hot = (
+            (X[:, 4 : 4 + len(SPEED_COLS)] == 0).all(axis=1)
+            & (hour >= 0)
+            & (hour < 24)
+            & (hour == np.floor(hour))
+            & ((weekend == 0) | (weekend == 1))
+            & ((rush == 0) | (rush == 1))
+            & (volume >= 0)
+            & (volume < self.max_volume)
+            & (volume == np.floor(volume))
+        )
+        index = ((hour * 2 + weekend) * 2 + rush) * self.max_volume + volume
+        proba = np.empty((len(X), len(self.classes_)), dtype=self.table.dtype)
+        proba[hot] = self.table[index[hot].astype(np.int64)]
+        if not hot.all():
+            proba[~hot] = self._cold_proba(X[~hot])
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def _pack(trees):
+    # trees: dicts of per-node arrays with children indexed within the tree;
+    # returns the concatenated arrays with global child indices. Leaves are
+    # their own children and split on feature 0.
+    offsets = np.cumsum([0] + [len(t["feature"]) for t in trees])
+    leaf = np.concatenate([t["leaf"] for t in trees])
+    arrays = {
+        key: np.concatenate([t[key] for t in trees])
+        for key in ["threshold", "default_left", "value"]
+    }
+    arrays["feature"] = np.where(
+        leaf, 0, np.concatenate([t["feature"] for t in trees])
+    ).astype(np.int32)
+    node = np.arange(len(leaf))
+    children = np.empty(2 * len(leaf), dtype=np.int32)
+    for i, key in enumerate(["left", "right"]):
+        child = np.concatenate([t[key] + off for t, off in zip(trees, offsets)])
+        children[i::2] = np.where(leaf, node, child)
+    arrays["children"] = children
+    arrays["roots"] = offsets[:-1].astype(np.int32)
+    arrays["depth"] = max(t["depth"] for t in trees)
+    return arrays
+
+
+def _depth(left, right, leaf):
+    depth, level = 0, [0]
+    while True:
+        level = [c for n in level if not leaf[n] for c in (left[n], right[n])]
+        if not level:
+            return depth
+        depth += 1
+
+
+def compile_xgboost(booster, classes):
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "multi:softprob":
+        raise ValueError(f"unsupported XGBoost objective {objective}")
+    model = learner["gradient_booster"]["model"]
+    trees = []
+    for tree in model["trees"]:
+        left = np.array(tree["left_children"], dtype=np.int64)
+        leaf = left == -1
+        right = np.array(tree["right_children"], dtype=np.int64)
+        conditions = np.array(tree["split_conditions"], dtype=np.float32)
+        trees.append(
+            {
+                "feature": np.array(tree["split_indices"], dtype=np.int64),
+                # Leaves keep their value in split_conditions
+                "threshold": conditions,
+                "value": conditions,
+                "default_left": np.array(tree["default_left"], dtype=bool),
+                "left": left,
+                "right": right,
+                "leaf": leaf,
+                "depth": _depth(left, right, leaf),
+            }
+        )
+    base = learner["learner_model_param"]["base_score"].strip("[]").split(",")
+    base_margin = np.broadcast_to(np.array(base, dtype=np.float32), len(classes)).copy()
+    return CompiledEnsemble(
+        "xgboost",
+        classes,
+        tree_class=np.array(model["tree_info"], dtype=np.int64),
+        base_margin=base_margin,
+        **_pack(trees),
+    )
+
+
+def _float32_below(threshold):
+    # Largest float32 <= threshold, then the next one up: for float32 x,
+    # x <= threshold exactly when x < that value
+    down = threshold.astype(np.float32)
+    down = np.where(down > threshold, np.nextafter(down, np.float32(-np.inf)), down)
+    return np.nextafter(down, np.float32(np.inf))
+
+
+def compile_forest(forest):
+    # Matches predict_proba of a forest scored with n_jobs=1; with more jobs
+    # sklearn adds the trees in whatever order the threads finish
+    import sklearn
+
+    counts = tuple(int(p) for p in sklearn.__version__.split(".")[:2]) < (1, 4)
+    trees = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left == -1
+        value = tree.value[:, 0, :].astype(np.float64)
+        if counts:
+            # Older trees store class counts; predict_proba normalises them
+            normalizer = value.sum(axis=1)[:, None]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        missing_left = getattr(tree, "missing_go_to_left", np.zeros(len(leaf)))
+        trees.append(
+            {
+                "feature": tree.feature.astype(np.int64),
+                "threshold": _float32_below(tree.threshold),
+                "value": value,
+                "default_left": np.asarray(missing_left, dtype=bool),
+                "left": tree.children_left.astype(np.int64),
+                "right": tree.children_right.astype(np.int64),
+                "leaf": leaf,
+                "depth": tree.max_depth,
+            }
+        )
+    return CompiledEnsemble(
+        "forest",
+        forest.classes_,
+        tree_class=None,
+        **_pack(trees),
+    )
+
+
+def compile_model(model, native_rows=None, table=False):
+    # Compiled tree ensemble for an XGBoost or random-forest model (bare or in
+    # a ModelBundle); any other model, e.g. a logistic regression, is
+    # returned unchanged and keeps its own predict_proba. Batches of at least
+    # native_rows rows outside the table use the model itself (inf: never).
+    # table=True precomputes the no-speed-bin lookup table.
+    booster = getattr(model, "booster", None)
+    inner = getattr(model, "model", None)
+    inner = model if inner is None else inner
+    if booster is None and hasattr(inner, "get_booster"):
+        booster = inner.get_booster()
+    if booster is not None:
+        try:
+            compiled = compile_xgboost(booster, model.classes_)
+        except ValueError:
+            return model
+    elif type(inner).__name__ in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        compiled = compile_forest(inner)
+    else:
+        return model
+    compiled.native = model
+    compiled.native_rows = native_rows or NATIVE_ROWS[compiled.kind]
+    return compiled.build_table() if table else compiled
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile the current model and check it against native predict"
+    )
+    parser.add_argument("--model", default=None, help="bundle directory or pickle")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    from feature_store import read_features
+    from features import build_features
+    from predict_batch import load_model, predict_proba
+
+    model, _ = load_model(args.model)
+    start = time.perf_counter()
+    compiled = compile_model(model, table=True)
+    if compiled is model:
+        print(f"{type(model).__name__} is not a tree ensemble; nothing to compile")
+        return
+    print(
+        f"Compiled {len(compiled.roots)} trees ({len(compiled.feature)} nodes, "
+        f"depth {compiled.depth}) in {time.perf_counter() - start:.2f} s"
+    )
+    X = build_features(read_features(columns=FEATURE_COLS).head(args.rows))
+    same = np.array_equal(compiled.predict_proba(X), predict_proba(model, X))
+    print(f"Bit-identical to native predict_proba on {len(X)} rows: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from external_training import (
+    StoreBatches,
+    evaluate,
+    time_cutoff,
+    train_external,
+    training_batches,
+)
+from feature_store import read_features, write_features
+from features import FEATURE_COLS, LABEL_MAP, RUSH_HOURS, SPEED_COLS
+
+
+def processed_rows(days=10, counts=3, seed=0):
+    # Processed-table rows every 15 minutes over `days` days from midnight
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2022-01-28", periods=days * 96, freq="15min")
+    df = pd.DataFrame(
+        {
+            "count_id": np.repeat(np.arange(counts), len(times)),
+            "direction": "EB",
+            "datetime": np.tile(times, counts),
+        }
+    )
+    df["hour"] = df["datetime"].dt.hour
+    df["is_weekend"] = df["datetime"].dt.dayofweek >= 5
+    df["is_rush_hour"] = df["hour"].isin(RUSH_HOURS)
+    df["volume_15min"] = rng.poisson(30, len(df))
+    for col in SPEED_COLS:
+        df[col] = rng.poisson(2, len(df))
+    df["congestion_level"] = pd.cut(
+        df["volume_15min"], [-1, 20, 50, np.inf], labels=list(LABEL_MAP)
+    )
+    return df
+
+
+class AlwaysLow:
+    def inplace_predict(self, X):
+        return np.tile([1.0, 0.0, 0.0], (len(X), 1))
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("store") / "features")
+    # Spans a month boundary, so both sides of the cutoff read two partitions
+    write_features(processed_rows(), root)
+    return root
+
+
+def test_cutoff_is_a_day_boundary(store):
+    cutoff = time_cutoff(0.2, root=store)
+    assert cutoff == cutoff.normalize()
+    days = read_features(columns=["datetime"], root=store)["datetime"].dt.normalize()
+    # The latest whole days that fit in the holdout share, and no more
+    held_out = (days >= cutoff).mean()
+    assert held_out <= 0.2 < held_out + (days == cutoff - pd.Timedelta("1D")).mean()
+
+
+def test_time_split_has_no_row_on_both_sides(store):
+    cutoff = time_cutoff(0.2, root=store)
+    df = read_features(
+        columns=FEATURE_COLS + ["congestion_level", "datetime"], root=store
+    )
+    X, _ = training_batches(df)
+    before = int((df.loc[X.index, "datetime"] < cutoff).sum())
+    after = len(X) - before
+    # Rows stamped exactly at the cutoff (midnight) belong to the holdout
+    assert (df["datetime"] == cutoff).any()
+
+    batches = StoreBatches(None, end=cutoff, batch_rows=500, root=store)
+    fed = []
+    while batches.next(lambda data, label: fed.append(data)):
+        pass
+    assert sum(len(x) for x in fed) == batches.rows == before
+
+    confusion = evaluate(AlwaysLow(), cutoff, batch_rows=500, root=store)
+    assert confusion.sum() == after
+    assert before + after == len(X)
+
+
+def test_train_external_records_the_split(store, tmp_path):
+    bundle_root = str(tmp_path / "bundles")
+    path = train_external(
+        {"n_estimators": 5, "max_depth": 3},
+        holdout=0.2,
+        nthread=1,
+        batch_rows=500,
+        root=store,
+        bundle_root=bundle_root,
+    )
+    with open(os.path.join(path, "manifest.json")) as f:
+        metrics = json.load(f)["metrics"]
+    assert metrics["split"] == "time"
+    assert pd.Timestamp(metrics["holdout_start"]) == time_cutoff(0.2, root=store)
+
+
+def test_train_external_without_extmem_quantile_dmatrix(store, tmp_path, monkeypatch):
+    # XGBoost 2.x has no ExtMemQuantileDMatrix; the iterator DMatrix is used
+    import xgboost
+
+    monkeypatch.delattr(xgboost, "ExtMemQuantileDMatrix", raising=False)
+    path = train_external(
+        {"n_estimators": 5, "max_depth": 3},
+        nthread=1,
+        batch_rows=500,
+        root=store,
+        bundle_root=str(tmp_path / "bundles"),
+    )
+    with open(os.path.join(path, "manifest.json")) as f:
+        assert json.load(f)["metrics"]["holdout_accuracy"] > 0
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from optimize_signals import (
+    counted_green_times,
+    green_times,
+    green_times_pulp,
+    target_greens,
+    total_deviation,
+)
+
+pytest.importorskip("pulp")
+# PuLP's deprecation notices for the CBC API it still ships
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+def assert_matches_pulp(volumes, cycle, min_green):
+    # Same feasibility and LP objective as PuLP everywhere; the same greens
+    # where the optimum is unique (no minimum green binds). The tolerance is
+    # CBC's.
+    greens = green_times(volumes, cycle, min_green)
+    reference = green_times_pulp(volumes, cycle, min_green)
+    np.testing.assert_array_equal(np.isnan(greens), np.isnan(reference))
+    feasible = ~np.isnan(reference).any(axis=1)
+    np.testing.assert_allclose(
+        total_deviation(greens[feasible], volumes[feasible], cycle[feasible]),
+        total_deviation(reference[feasible], volumes[feasible], cycle[feasible]),
+        atol=1e-4,
+    )
+    floor = np.broadcast_to(min_green, len(volumes))[:, None]
+    unique = feasible & (target_greens(volumes, cycle) >= floor).all(axis=1)
+    np.testing.assert_allclose(greens[unique], reference[unique], atol=1e-4)
+    return greens
+
+
+def test_random_volumes_match_pulp():
+    rng = np.random.default_rng(0)
+    volumes = rng.gamma(2.0, 40.0, size=(300, 4)).round()
+    quiet = rng.random(volumes.shape) < 0.2
+    volumes[quiet] = rng.integers(0, 5, quiet.sum())
+    cycle = rng.choice([40.0, 60.0, 90.0, 120.0], len(volumes))
+    min_green = rng.choice([5.0, 7.0, 10.0, 12.0], len(volumes))
+    greens = assert_matches_pulp(volumes, cycle, min_green)
+    feasible = ~np.isnan(greens).any(axis=1)
+    np.testing.assert_allclose(greens[feasible].sum(axis=1), cycle[feasible])
+    assert (greens[feasible] >= min_green[feasible, None] - 1e-9).all()
+
+
+@pytest.mark.parametrize(
+    "volumes",
+    [
+        [[np.nan, np.nan, np.nan, np.nan]],
+        [[0.0, 0.0, 0.0, 0.0]],
+        [[50.0, np.nan, 10.0, 0.0]],
+        [[5.0, 100.0, 0.0, 0.0]],
+    ],
+    ids=["all-nan", "zero-volumes", "some-nan", "one-busy-approach"],
+)
+def test_edge_cases_match_pulp(volumes):
+    volumes = np.array(volumes)
+    greens = assert_matches_pulp(volumes, np.array([120.0]), 10.0)
+    np.testing.assert_allclose(
+        greens, green_times_pulp(volumes, 120.0, 10.0), atol=1e-4
+    )
+
+
+def test_infeasible_minimum_greens_are_nan():
+    # 4 approaches x 10 s does not fit in a 30 s cycle
+    volumes = np.array([[10.0, 20.0, 30.0, 40.0], [10.0, 20.0, 30.0, 40.0]])
+    cycle = np.array([30.0, 40.0])
+    greens = assert_matches_pulp(volumes, cycle, 10.0)
+    assert np.isnan(greens[0]).all()
+    np.testing.assert_allclose(greens[1], 10.0)
+
+
+def test_single_approach_gets_the_whole_cycle():
+    volumes = np.array([[10.0], [0.0], [np.nan]])
+    cycle = np.array([60.0, 90.0, 5.0])
+    greens = assert_matches_pulp(volumes, cycle, 10.0)
+    np.testing.assert_allclose(greens[:2, 0], [60.0, 90.0])
+    assert np.isnan(greens[2, 0])
+
+
+def test_counted_green_times_skip_absent_approaches():
+    volumes = np.array([[50.0, np.nan, 10.0, 0.0], [np.nan] * 4, [5.0, 100, 0, 0]])
+    greens = counted_green_times(volumes, 120.0, 10.0)
+    assert greens[0, 1] == 0 and (greens[1] == 0).all()
+    np.testing.assert_allclose(
+        greens[0, [0, 2, 3]], green_times([[50.0, 10.0, 0.0]], 120.0, 10.0)[0]
+    )
+    np.testing.assert_allclose(greens[2], green_times(volumes[2], 120.0, 10.0)[0])
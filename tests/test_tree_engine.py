@@ -0,0 +1,114 @@
+import ctypes
+import ctypes.util
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import XGBClassifier
+
+from features import FEATURE_COLS
+from tree_engine import NATIVE_ROWS, compile_model, expf
+
+# Inputs where numpy's float32 exp and glibc's expf disagree in the last bit,
+# with glibc's result (what XGBoost's softmax uses on Linux)
+GLIBC_EXPF = [
+    ("-0x1.d0b064p+2", "0x1.70594ep-11"),
+    ("-0x1.3ab60ep+4", "0x1.8a415ep-29"),
+    ("-0x1.de0738p+1", "0x1.874bdep-6"),
+    ("-0x1.5a3e92p+2", "0x1.250880p-8"),
+    ("-0x1.4c6de0p+0", "0x1.177a22p-2"),
+    ("-0x1.d76a36p+1", "0x1.9c0b6ep-6"),
+    ("-0x1.3f1faap+4", "0x1.2b3b16p-29"),
+    ("-0x1.2576fep+3", "0x1.b45b9ap-14"),
+]
+
+
+def synthetic_rows(n, seed=0):
+    # FEATURE_COLS-shaped rows: hour, weekend, rush hour, volume and speed
+    # bins, with some missing values; labels follow the volume
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, len(FEATURE_COLS)), dtype=np.float32)
+    X[:, 0] = rng.integers(0, 24, n)
+    X[:, 1] = rng.integers(0, 2, n)
+    X[:, 2] = np.isin(X[:, 0], [7, 8, 9, 16, 17, 18])
+    X[:, 3] = rng.gamma(2.0, 20.0, n).round()
+    X[:, 4:] = rng.poisson(3.0, (n, len(FEATURE_COLS) - 4))
+    X[rng.random(X.shape) < 0.1] = np.nan
+    volume = np.nan_to_num(X[:, 3], nan=30.0) + rng.normal(0, 5, n)
+    y = np.digitize(volume, [20, 50])
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def data():
+    return synthetic_rows(3000)
+
+
+@pytest.fixture(scope="module")
+def xgb(data):
+    X, y = data
+    return XGBClassifier(
+        n_estimators=30, max_depth=4, learning_rate=0.3, tree_method="hist", n_jobs=1
+    ).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def forest(data):
+    X, y = data
+    return RandomForestClassifier(
+        n_estimators=20, max_depth=8, n_jobs=1, random_state=0
+    ).fit(X, y)
+
+
+def batch_sizes(kind):
+    return [1, NATIVE_ROWS[kind] - 1, NATIVE_ROWS[kind] + 1, 2000]
+
+
+@pytest.mark.parametrize("name", ["xgb", "forest"])
+def test_compiled_scores_are_bit_identical(name, request):
+    model = request.getfixturevalue(name)
+    X, _ = synthetic_rows(2000, seed=1)
+    # native_rows=inf scores every batch with the NumPy traversal; the default
+    # hands large batches to the model itself
+    traversal = compile_model(model, native_rows=np.inf)
+    routed = compile_model(model)
+    for rows in batch_sizes(traversal.kind):
+        expected = model.predict_proba(X[:rows])
+        np.testing.assert_array_equal(traversal.predict_proba(X[:rows]), expected)
+        np.testing.assert_array_equal(routed.predict_proba(X[:rows]), expected)
+
+
+@pytest.mark.parametrize("name", ["xgb", "forest"])
+def test_lookup_table_is_bit_identical(name, request):
+    model = request.getfixturevalue(name)
+    compiled = compile_model(model, native_rows=np.inf, table=True)
+    X, _ = synthetic_rows(500, seed=2)
+    # Half the rows without speed bins and with whole volumes hit the table
+    X[::2, 4:] = 0
+    X[::2, 3] = np.nan_to_num(X[::2, 3])
+    np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+
+
+def test_expf_matches_glibc_on_known_inputs():
+    x = np.array([float.fromhex(a) for a, _ in GLIBC_EXPF], dtype=np.float32)
+    expected = np.array([float.fromhex(b) for _, b in GLIBC_EXPF], dtype=np.float32)
+    np.testing.assert_array_equal(expf(x), expected)
+
+
+def test_expf_special_values():
+    x = np.array([0.0, -0.0, -104.0, 89.0, -np.inf, np.inf, np.nan], np.float32)
+    out = expf(x)
+    np.testing.assert_array_equal(out[:6], [1.0, 1.0, 0.0, np.inf, 0.0, np.inf])
+    assert np.isnan(out[6])
+
+
+def test_expf_matches_libm():
+    path = ctypes.util.find_library("m")
+    if path is None or "libm.so" not in path:
+        pytest.skip("needs glibc's libm")
+    libm = ctypes.CDLL(path)
+    libm.expf.restype = ctypes.c_float
+    libm.expf.argtypes = [ctypes.c_float]
+    x = np.random.default_rng(0).uniform(-60, 0, 20_000).astype(np.float32)
+    expected = np.array([libm.expf(float(v)) for v in x], dtype=np.float32)
+    np.testing.assert_array_equal(expf(x), expected)